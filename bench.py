@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Replay benchmark.
+#
+# Feeds recorded or synthetic XMPP traffic through the real Dispatcher,
+# ConferenceBot and plugins using a loopback transport, so no server is
+# needed. Reports stanzas/sec, per stage latency (from common.metrics) and
+# allocations for each scenario. Run it before and after a performance change:
+#
+#   python bench.py                     # every synthetic scenario
+#   python bench.py presence -n 5000 -u 3000
+#   python bench.py -r captured.xml     # one stanza per line
+#   python bench.py --startup           # plugin load times
+#   python bench.py --connections 4     # sharded broadcast to a local server
+#   python bench.py --roster            # roster download on (re)connect
+#   python bench.py --ibb 4096          # in-band file transfer, 1 and 20 streams
+#   python bench.py --jidescape         # XEP-0106 JID escaping
+#   python bench.py --serialize         # turning stanzas into text
+#   python bench.py --cmdargs           # parsing command arguments
+#
+# Import times at startup are reported by bench/imports.py.
+
+from __future__ import with_statement
+
+import gc
+import imp
+import os
+import random
+import shutil
+import sys
+import time
+
+try:
+	import resource
+except ImportError:
+	# Not available on windows.
+	resource = None
+
+from bench import cmdargs, ibb, jidescape, loopback, roster, serialize, \
+	sharding, startup, streams
+from common import argparse, metrics, utils
+
+# Stage prefixes reported for each scenario.
+STAGES = ['bot.', 'xmpp.', 'hook.', 'command.', 'plugin.']
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(prog='bench.py',
+		description='Replay XMPP traffic through the bot and time it.')
+	parser.add_argument('scenarios', nargs='*', metavar='scenario',
+		help='Any of: %s (default: all)' % ', '.join(streams.ORDER))
+	parser.add_argument('-n', '--count', type=int, default=2000,
+		help='Stanzas per scenario')
+	parser.add_argument('-u', '--users', type=int, default=500,
+		help='Number of users in the roster')
+	parser.add_argument('-c', '--chunk', type=int, default=10,
+		help='Stanzas read per main loop frame')
+	parser.add_argument('-r', '--recording', metavar='file',
+		help='Replay stanzas from a file, one per line')
+	parser.add_argument('-s', '--seed', type=int, default=0,
+		help='Random seed for the synthetic streams')
+	parser.add_argument('--startup', action='store_true',
+		help='Time loading the plugins instead of replaying traffic')
+	parser.add_argument('--connections', type=int, default=0,
+		help='Time broadcasts through this many connections to a local '
+			 'stand-in server instead of replaying traffic')
+	parser.add_argument('--rate', type=int, default=50000,
+		help='Bytes/sec the stand-in server reads from each connection')
+	parser.add_argument('--roster', action='store_true',
+		help='Time connecting and reconnecting to a local stand-in server '
+			 'with the roster cache')
+	parser.add_argument('--ibb', type=int, default=0, metavar='KB',
+		help='Time sending a file of this size over in-band bytestreams '
+			 'between two loopback clients')
+	parser.add_argument('--jidescape', action='store_true',
+		help='Time escaping -n legacy names for JIDs')
+	parser.add_argument('--serialize', action='store_true',
+		help='Time serializing -n outgoing stanzas')
+	parser.add_argument('--cmdargs', action='store_true',
+		help='Time parsing -n command argument lines')
+	return parser.parse_args(argv)
+
+def prepare_module():
+	"""Create bench/config.ini and the log folder if they're missing."""
+	module = utils.get_module()
+	utils.confirmdir(os.path.join('.', module, 'logs'))
+	config = os.path.join('.', module, 'config.ini')
+	if not os.path.exists(config):
+		shutil.copy(os.path.join('.', 'templates', '%s-config.ini' % module),
+					config)
+
+def load_bot():
+	"""Build a ConferenceBot from gbot.py.
+
+	gbot.py can't simply be imported, the gbot package shadows it.
+
+	"""
+	conference = imp.load_source('conference', os.path.join('.', 'gbot.py'))
+	return conference.ConferenceBot()
+
+def live_objects():
+	gc.collect()
+	return len(gc.get_objects())
+
+def max_rss():
+	if resource is None:
+		return 0
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def replay(bot, sock, stanzas, chunk):
+	"""Feed `stanzas` through the bot, running a frame every `chunk` stanzas.
+
+	Return the number of stanzas fed.
+
+	"""
+	fed = 0
+	for stanza in stanzas:
+		sock.feed(stanza)
+		fed += 1
+		if not fed % chunk:
+			bot.step(0)
+	bot.step(0)
+	# Don't wait out the presence window, handle anything still held.
+	for pres in bot.presences.flush():
+		bot._dispatch_presence(pres)
+	return fed
+
+def run_scenario(name, generator, bot, sock, users, options):
+	metrics.registry.enabled = True
+	metrics.registry.reset()
+	sent_count, sent_bytes = sock.sent_count, sock.sent_bytes
+	received_bytes = sock.received_bytes
+	objects = live_objects()
+
+	stanzas = generator(bot.jid, users, options.count)
+	start = time.time()
+	fed = replay(bot, sock, stanzas, options.chunk)
+	elapsed = time.time() - start
+
+	objects = live_objects() - objects
+	print '=== %s ===' % name
+	print 'stanzas in:  %d (%d bytes) in %.3fs, %.1f stanzas/sec' % (
+		fed, sock.received_bytes - received_bytes, elapsed,
+		elapsed and fed / elapsed)
+	print 'stanzas out: %d (%d bytes)' % (
+		sock.sent_count - sent_count, sock.sent_bytes - sent_bytes)
+	print 'presences coalesced: %d' % bot.presences.stats['coalesced']
+	print 'live objects: %+d, max rss: %d KB' % (objects, max_rss())
+	for stage in STAGES:
+		report = metrics.registry.format(stage)
+		if report:
+			print report
+	print
+
+def main(argv):
+	options = parse_args(argv)
+	random.seed(options.seed)
+	# These don't need the bot.
+	if options.ibb:
+		ibb.run(options.ibb)
+		return 0
+	if options.jidescape:
+		jidescape.run(options.count)
+		return 0
+	if options.serialize:
+		serialize.run(options.count)
+		return 0
+	if options.cmdargs:
+		cmdargs.run(options.count)
+		return 0
+	prepare_module()
+
+	bot = load_bot()
+	if options.startup:
+		startup.run(bot, list(bot._pluginhash))
+		return 0
+
+	users = ['user%d@%s' % (i, bot.jid.getDomain())
+			 for i in xrange(options.users)]
+	if options.roster:
+		roster.run(bot, users)
+		return 0
+	if options.connections:
+		# -n is the number of messages, sent as broadcasts to every user.
+		sharding.run(bot, options.connections, users,
+					 max(1, options.count / len(users)), options.rate)
+		return 0
+
+	sock = loopback.connect_loopback(bot, bot.jid, users)
+
+	if options.recording:
+		scenarios = [(options.recording, streams.recording(options.recording))]
+	else:
+		names = options.scenarios or streams.ORDER
+		for name in names:
+			if name not in streams.SCENARIOS:
+				print 'Unknown scenario: %s' % name
+				return 1
+		scenarios = [(name, streams.SCENARIOS[name]) for name in names]
+
+	for name, generator in scenarios:
+		run_scenario(name, generator, bot, sock, users, options)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Time parsing command arguments against the argparse parser it replaced."""
+
+import random
+import shlex
+import time
+
+from common import argparse, cmdargs, const
+
+def build_load_parser():
+	"""The argparse parser !(re|un)load used to build."""
+	parser = argparse.ArgumentParser(prog='!(re|un)load', add_help=False)
+	parser.add_argument('extra', default=False, nargs='?')
+	parser.add_argument('-a', '--all', action='store_true')
+	parser.add_argument('-f', '--force', action='store_true')
+	parser.add_argument('-p', '--plugin', const=True, default=False, nargs='?')
+	parser.add_argument('-i', '--ini', const=True, default=False, nargs='?')
+	return parser
+
+LOAD_SPEC = cmdargs.ArgSpec('!(re|un)load',
+	cmdargs.Arg('extra', nargs='?', default=False),
+	cmdargs.Option('-a', '--all'),
+	cmdargs.Option('-f', '--force'),
+	cmdargs.Option('-p', '--plugin', nargs='?', default=False),
+	cmdargs.Option('-i', '--ini', nargs='?', default=False),
+)
+
+def _lines(count):
+	"""Arguments as admins type them, a few quoted."""
+	return [random.choice(['-p', '-p plugin_admin', '-a -f', '-i roster',
+		'-i roster -p plugin_info', '-af', '--plugin="plugin_mail"'])
+		for i in xrange(count)]
+
+def _best(func, lines, rounds):
+	times = []
+	for i in xrange(rounds):
+		start = time.time()
+		for line in lines:
+			func(line)
+		times.append(time.time() - start)
+	return min(times)
+
+def run(count=20000, rounds=5):
+	"""run(int count=20000, int rounds=5) -> None
+
+	Parse `count` !reload argument lines with shlex and argparse, then with
+	the compiled ArgSpec, and report the best of `rounds`.
+
+	"""
+	lines = _lines(count)
+	parser = build_load_parser()
+	for line in set(lines):
+		expected = vars(parser.parse_args(shlex.split(line)))
+		assert vars(LOAD_SPEC.parse(line)) == expected, line
+
+	old = _best(lambda line: parser.parse_args(shlex.split(line)), lines, rounds)
+	new = _best(LOAD_SPEC.parse, lines, rounds)
+	print '=== cmdargs (%d lines, best of %d) ===' % (count, rounds)
+	print 'shlex + argparse: %.2fms, %.2fus/line' % (old * 1000, old / count * 1e6)
+	print 'ArgSpec:          %.2fms, %.2fus/line' % (new * 1000, new / count * 1e6)
+	print
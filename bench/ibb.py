@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Time in-band bytestreams between two clients joined back to back."""
+
+import glob
+import os
+import time
+
+import xmpp
+
+from bench.loopback import LoopbackSocket, STREAM_HEADER
+from xmpp.simplexml import ustr
+
+class PeerSocket(LoopbackSocket):
+	"""A LoopbackSocket that hands everything sent to `peer`.
+
+	Nothing is passed on before `peer` is set, so each end keeps the stream
+	header it was fed.
+
+	"""
+
+	def __init__(self):
+		LoopbackSocket.__init__(self)
+		self.peer = None
+
+	def plugin(self, owner):
+		# PlugIn only calls plugin() when the class itself defines it.
+		return LoopbackSocket.plugin(self, owner)
+
+	def send(self, raw_data):
+		if type(raw_data) != type(u'') and type(raw_data) != type(''):
+			raw_data = ustr(raw_data)
+		LoopbackSocket.send(self, raw_data)
+		if self.peer is not None:
+			self.peer.feed(raw_data)
+
+def _client(jid):
+	client = xmpp.Client(jid.getDomain(), debug=[])
+	client.User, client.Resource = jid.getNode(), jid.getResource()
+	client._registered_name = jid
+	sock = PeerSocket()
+	sock.PlugIn(client)
+	client.connected = 'tcp'
+	xmpp.dispatcher.Dispatcher().PlugIn(client)
+	sock.feed(STREAM_HEADER % jid.getDomain())
+	client.Process(0)
+	xmpp.filetransfer.IBB().PlugIn(client)
+	return client, sock
+
+def _transfer(sender, receiver, ibb, source, streams, blocksize, window):
+	"""Send `source` once on each of `streams` streams, return the seconds taken."""
+	to = str(receiver._registered_name)
+	files = []
+	start = time.time()
+	for i in xrange(streams):
+		fp = open(source, 'rb')
+		files.append(fp)
+		ibb.OpenStream('bench%d' % i, to, fp, blocksize, window)
+	while ibb._streams:
+		sender.Process(0)
+		receiver.Process(0)
+	receiver.Process(0)
+	elapsed = time.time() - start
+	for fp in files:
+		fp.close()
+	return elapsed
+
+def _check(source, streams):
+	expected = open(source, 'rb').read()
+	for i in xrange(streams):
+		received = open('/tmp/xmpp_file_bench%d' % i, 'rb').read()
+		assert received == expected, 'stream %d arrived damaged' % i
+
+def run(size=4096, streams=20, blocksize=3000, window=16):
+	"""run(int size=4096, int streams=20, int blocksize=3000, int window=16) -> None
+
+	Send a `size` KB file over one in-band bytestream, then over `streams`
+	at once, between two clients joined by loopback sockets.
+
+	"""
+	sender, sender_sock = _client(xmpp.JID('sender@bench.local/ibb'))
+	receiver, receiver_sock = _client(xmpp.JID('receiver@bench.local/ibb'))
+	sender_sock.peer, receiver_sock.peer = receiver_sock, sender_sock
+	ibb = sender.IBB
+
+	source = '/tmp/xmpp_bench_ibb'
+	fp = open(source, 'wb')
+	fp.write(os.urandom(size * 1024))
+	fp.close()
+
+	print '=== ibb (%d KB, %d byte blocks, window %d) ===' % (
+		size, blocksize, window)
+	try:
+		for count in (1, streams):
+			elapsed = _transfer(sender, receiver, ibb, source, count,
+								blocksize, window)
+			_check(source, count)
+			print '%2d stream(s):  %.3fs, %.2f MB/s' % (count, elapsed,
+				size * count / 1024.0 / elapsed)
+	finally:
+		os.remove(source)
+		for filename in glob.glob('/tmp/xmpp_file_bench*'):
+			os.remove(filename)
+	print
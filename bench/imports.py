@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Import time report.
+#
+# Times every module imported while gbot.py and its plugins load, the same
+# way bench.py builds the bot, so a heavy import creeping back into startup
+# shows up. Run it from the repository root in a fresh interpreter:
+#
+#   python bench/imports.py             # the 25 slowest imports
+#   python bench/imports.py -n 50
+#
+# Exits with 1 if a module that should only be loaded on first use was
+# imported during startup.
+
+import getopt
+import imp
+import os
+import shutil
+import sys
+import time
+
+# Modules that are only imported once they're used.
+DEFERRED = [
+	'common.argparse',
+	'shlex',
+	'xmpp.browser',
+	'xmpp.commands',
+	'xmpp.filetransfer',
+	'cProfile',
+	'pstats',
+]
+
+class ImportTimer(object):
+	"""An import hook on sys.meta_path that records how long each module took.
+
+	Each entry in `times` is module name -> [total seconds, own seconds],
+	where own time leaves out the modules it imported.
+
+	"""
+	def __init__(self):
+		self.times = {}
+		# What find_module found, for load_module.
+		self._found = None
+		# The time spent in finished child imports, one per import in progress.
+		self._children = []
+
+	def install(self):
+		sys.meta_path.insert(0, self)
+
+	def uninstall(self):
+		sys.meta_path.remove(self)
+
+	def find_module(self, fullname, path=None):
+		try:
+			self._found = imp.find_module(fullname.rsplit('.', 1)[-1], path)
+		except ImportError:
+			# Let the normal machinery find it, or fail.
+			return None
+		return self
+
+	def load_module(self, fullname):
+		found, self._found = self._found, None
+		self._children.append(0.0)
+		start = time.time()
+		try:
+			return imp.load_module(fullname, *found)
+		finally:
+			total = time.time() - start
+			if found[0]:
+				found[0].close()
+			self.times[fullname] = [total, total - self._children.pop()]
+			if self._children:
+				self._children[-1] += total
+
+	def report(self, top=25):
+		rows = sorted(self.times.iteritems(), key=lambda row: row[1][0],
+					  reverse=True)
+		lines = ['%10s %10s  module' % ('total ms', 'own ms')]
+		for name, (total, own) in rows[:top]:
+			lines.append('%10.2f %10.2f  %s' % (total * 1000, own * 1000, name))
+		lines.append('%d modules, %.2fms spent importing' % (
+			len(rows), sum([own for total, own in self.times.itervalues()]) * 1000))
+		return '\n'.join(lines)
+
+def main(argv):
+	top = 25
+	opts, args = getopt.getopt(argv, 'n:')
+	for opt, value in opts:
+		if opt == '-n':
+			top = int(value)
+
+	# Load the bot the way bench.py does, so it uses bench/config.ini.
+	root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	os.chdir(root)
+	sys.path[0] = root
+	sys.argv[0] = os.path.join(root, 'bench.py')
+
+	if not os.path.exists(os.path.join('bench', 'config.ini')):
+		shutil.copy(os.path.join('templates', 'bench-config.ini'),
+					os.path.join('bench', 'config.ini'))
+	if not os.path.isdir(os.path.join('bench', 'logs')):
+		os.makedirs(os.path.join('bench', 'logs'))
+
+	timer = ImportTimer()
+	timer.install()
+	start = time.time()
+	try:
+		conference = imp.load_source('conference', 'gbot.py')
+		conference.ConferenceBot()
+	finally:
+		timer.uninstall()
+	elapsed = time.time() - start
+
+	print '=== imports (gbot.py and its plugins) ==='
+	print timer.report(top)
+	print 'startup took %.2fms' % (elapsed * 1000)
+
+	loaded = [name for name in DEFERRED if name in timer.times]
+	if loaded:
+		print 'Imported during startup, should be deferred: %s' % ', '.join(loaded)
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Time XEP-0106 JID escaping against the replace() chain it replaced."""
+
+import random
+import time
+
+from xmpp import jep0106
+from xmpp.jep0106 import xep0106mapping
+
+def replace_encode(str):
+	"""JIDEncode as it was, one replace() per mapping."""
+	str = str.replace('\\5c', '\\5c5c')
+	for each in xep0106mapping:
+		str = str.replace('\\' + each[1], '\\5c' + each[1])
+	for each in xep0106mapping:
+		str = str.replace(each[0], '\\' + each[1])
+	return str
+
+def replace_decode(str):
+	"""JIDDecode as it was."""
+	for each in xep0106mapping:
+		str = str.replace('\\' + each[1], each[0])
+	return str.replace('\\5c', '\\')
+
+def _names(count):
+	"""Legacy user names, most of them plain, some needing escapes."""
+	names = []
+	for i in xrange(count):
+		if i % 4:
+			names.append('user%d' % i)
+		else:
+			names.append(random.choice(['john smith', "o'brien", 'a/b:c',
+				'mail@example.com', r'back\slash']) + str(i))
+	return names
+
+def _best(func, names, rounds):
+	times = []
+	for i in xrange(rounds):
+		start = time.time()
+		func(names)
+		times.append(time.time() - start)
+	return min(times)
+
+def run(count=10000, rounds=5):
+	"""run(int count=10000, int rounds=5) -> None
+
+	Encode and decode `count` legacy names with the old replace() chain,
+	the single pass codec one name at a time and the bulk API.
+
+	"""
+	names = _names(count)
+	encoded = jep0106.JIDEncodeAll(names)
+	assert encoded == map(replace_encode, names)
+	assert jep0106.JIDDecodeAll(encoded) == map(replace_decode, encoded)
+
+	print '=== jid escaping (%d names, best of %d) ===' % (count, rounds)
+	for label, encode, decode in [
+			('replace chain', lambda names: map(replace_encode, names),
+				lambda names: map(replace_decode, names)),
+			('single pass', lambda names: map(jep0106.JIDEncode, names),
+				lambda names: map(jep0106.JIDDecode, names)),
+			('bulk', jep0106.JIDEncodeAll, jep0106.JIDDecodeAll)]:
+		print '%-14s encode %7.2fms, decode %7.2fms' % (label,
+			_best(encode, names, rounds) * 1000,
+			_best(decode, encoded, rounds) * 1000)
+	print
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import deque
+
+import xmpp
+
+from xmpp.client import PlugIn
+from xmpp.simplexml import ustr
+
+STREAM_HEADER = ("<?xml version='1.0'?><stream:stream xmlns='jabber:client' "
+	"xmlns:stream='http://etherx.jabber.org/streams' id='loopback' "
+	"from='%s'>")
+
+class LoopbackSocket(PlugIn):
+	"""Stands in for xmpp.transports.TCPsocket without a server.
+
+	Data passed to `feed` is handed to the dispatcher the next time it asks
+	for input. Everything the bot sends is counted and thrown away, unless
+	`keep_sent` is True.
+
+	"""
+
+	def __init__(self, keep_sent=False):
+		PlugIn.__init__(self)
+		self.DBG_LINE = 'socket'
+		self._exported_methods = [self.send, self.disconnect]
+		self._incoming = deque()
+		self.keep_sent = keep_sent
+		self.sent = []
+		self.sent_count = 0
+		self.sent_bytes = 0
+		self.received_bytes = 0
+
+	def plugin(self, owner):
+		self._owner.Connection = self
+		self._owner.RegisterDisconnectHandler(self.disconnected)
+		return 'ok'
+
+	def plugout(self):
+		if self._owner.__dict__.has_key('Connection'):
+			del self._owner.Connection
+			self._owner.UnregisterDisconnectHandler(self.disconnected)
+
+	def getHost(self):
+		return 'loopback'
+
+	def getPort(self):
+		return 0
+
+	def feed(self, data):
+		"""Queue raw data as if the server had sent it."""
+		if isinstance(data, unicode):
+			data = data.encode('utf-8')
+		self._incoming.append(data)
+
+	def pending_data(self, timeout=0):
+		return bool(self._incoming)
+
+	def receive(self):
+		# Like TCPsocket, read everything that's waiting.
+		data = ''.join(self._incoming)
+		self._incoming.clear()
+		self.received_bytes += len(data)
+		return data
+
+	def send(self, raw_data):
+		if type(raw_data) == type(u''):
+			raw_data = raw_data.encode('utf-8')
+		elif type(raw_data) != type(''):
+			raw_data = ustr(raw_data).encode('utf-8')
+		self.sent_count += 1
+		self.sent_bytes += len(raw_data)
+		if self.keep_sent:
+			self.sent.append(raw_data)
+
+	def disconnect(self):
+		pass
+
+	def disconnected(self):
+		pass
+
+def connect_loopback(bot, jid, roster_items=()):
+	"""connect_loopback(BotFramework bot, JID jid, list roster_items) -> LoopbackSocket
+
+	Give `bot` an xmpp client that talks to a LoopbackSocket, and bring it to
+	the same state BotFramework.connect leaves it in: handlers registered,
+	roster received and initial presence sent.
+
+	"""
+	client = bot.client = xmpp.Client(jid.getDomain(), debug=[])
+	client.User, client.Resource = jid.getNode(), jid.getResource()
+	sock = LoopbackSocket()
+	sock.PlugIn(client)
+	client.connected = 'tcp'
+
+	xmpp.dispatcher.Dispatcher().PlugIn(client)
+	sock.feed(STREAM_HEADER % jid.getDomain())
+	client.Process(0)
+
+	bot.registerHandlers()
+	client.sendInitPresence()
+	sock.feed(roster_result(jid, roster_items))
+	client.Process(0)
+	return sock
+
+def roster_result(jid, roster_items):
+	"""Return the server's reply to the roster request for `roster_items`."""
+	items = ''.join(["<item jid='%s' subscription='both'/>" % item
+					 for item in roster_items])
+	return ("<iq type='result' id='roster' to='%s'>"
+			"<query xmlns='jabber:iq:roster'>%s</query></iq>" % (jid, items))
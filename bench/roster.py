@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Reconnect to a StandInServer with and without the roster cache."""
+
+import glob
+import os
+import time
+
+from bench.server import StandInServer
+from common import utils
+
+def _connect(bot, server):
+	"""Connect, wait for the roster and return (seconds, roster bytes)."""
+	start = time.time()
+	bot.connect(server.address, secure=0, resource='bench')
+	bot.client.getRoster()
+	elapsed = time.time() - start
+	return elapsed, server.connections[-1].roster_bytes
+
+def _check(bot, server, label):
+	roster = set(bot.getRoster())
+	roster.discard(bot.jid.getStripped())
+	assert roster == set(server.users), '%s: roster is out of date' % label
+
+def run(bot, users, changes=10):
+	"""run(ConferenceBot bot, list users, int changes=10) -> None
+
+	Connect `bot` to a StandInServer with `users` in the roster and time a
+	cold connect, then a reconnect after `changes` users were added while
+	the bot was away, then adding and removing users through the bot.
+
+	"""
+	for filename in glob.glob(os.path.join('.', utils.get_module(), '*.roster')):
+		os.remove(filename)
+	server = StandInServer(users, domain=bot.jid.getDomain())
+	server.start()
+
+	print '=== roster (%d users) ===' % len(users)
+	cold = _connect(bot, server)
+	_check(bot, server, 'cold connect')
+	print 'cold connect:      %.3fs, %d roster bytes' % cold
+	bot.client.disconnect()
+
+	warm = _connect(bot, server)
+	_check(bot, server, 'unchanged reconnect')
+	print 'reconnect:         %.3fs, %d roster bytes' % warm
+	bot.client.disconnect()
+
+	for i in xrange(changes):
+		server.subscription('new%d@%s' % (i, server.domain), 'subscribed')
+	delta = _connect(bot, server)
+	_check(bot, server, 'reconnect after changes')
+	print 'reconnect (+%d):   %.3fs, %d roster bytes' % ((changes,) + delta)
+
+	connection = server.connections[-1]
+	sent = connection.sent_bytes
+	start = time.time()
+	added = ['added%d@%s' % (i, server.domain) for i in xrange(changes)]
+	with bot.rosterBatch():
+		for jid in added:
+			bot.addUser(jid)
+	with bot.rosterBatch():
+		for jid in added:
+			bot.removeUser(jid)
+	# Wait for the server to push every change back.
+	roster = bot.client.Roster
+	end = time.time() + 5
+	while time.time() < end and roster.version != str(server.roster_version):
+		bot.client.Process(0.01)
+	_check(bot, server, 'add and remove')
+	print 'add+remove %d:     %.3fs, %d bytes pushed' % (changes,
+		time.time() - start, connection.sent_bytes - sent)
+	print
+
+	bot.client.disconnect()
+	server.stop()
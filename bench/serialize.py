@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Time turning outgoing stanzas into text."""
+
+import random
+import time
+
+import xmpp
+
+def _stanzas(count):
+	"""What the bot sends most: relayed messages, presences and iq replies."""
+	me = xmpp.JID('bot@bench.local/gbot')
+	stanzas = []
+	for i in xrange(count):
+		to = xmpp.JID('user%d@bench.local/home' % (i % 500))
+		kind = i % 10
+		if kind < 7:
+			body = random.choice(['hi', 'brb', 'a < b & c > d',
+				'<%s> said "%s"' % (to.getNode(), 'x' * (i % 120))])
+			stanza = xmpp.Message(to, body, typ='chat', frm=me)
+		elif kind < 9:
+			stanza = xmpp.Presence(to, frm=me, show='away',
+				status='Away: %d' % i)
+		else:
+			stanza = xmpp.Iq('result', xmpp.NS_VERSION, to=to, frm=me)
+			stanza.setID('v%d' % i)
+		stanzas.append(stanza)
+	return stanzas
+
+def run(count=20000, rounds=5):
+	"""run(int count=20000, int rounds=5) -> None
+
+	Serialize `count` typical outgoing stanzas and report the best of
+	`rounds`.
+
+	"""
+	stanzas = _stanzas(count)
+	times = []
+	for i in xrange(rounds):
+		start = time.time()
+		for stanza in stanzas:
+			str(stanza)
+		times.append(time.time() - start)
+	best = min(times)
+	print '=== serialize (%d stanzas, best of %d) ===' % (count, rounds)
+	print 'total: %.2fms, %.1f stanzas/sec' % (best * 1000, count / best)
+	print
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""A stand-in XMPP server for benchmarks.
+
+Just enough of a server for the bot to connect to it over TCP: plain
+streams, non-SASL auth, a versioned roster where every user is online and
+a per connection rate limit. Messages are counted instead of delivered.
+
+"""
+
+from __future__ import with_statement
+
+import select
+import socket
+import threading
+import time
+
+from xmpp.protocol import Iq, JID, Node, Presence, NS_AUTH, NS_ROSTER, \
+	NS_ROSTER_VER
+from xmpp.simplexml import NodeBuilder
+
+STREAM_HEADER = ("<?xml version='1.0'?><stream:stream xmlns='jabber:client' "
+	"xmlns:stream='http://etherx.jabber.org/streams' id='%d' from='%s'>")
+# Advertised even though the stream is pre-1.0, the client only needs it
+# to be there by the time it asks for the roster.
+STREAM_FEATURES = "<stream:features><ver xmlns='%s'/></stream:features>" % \
+	NS_ROSTER_VER
+
+class Connection(object):
+	"""One client connection to the StandInServer."""
+
+	def __init__(self, server, sock, number):
+		self.server = server
+		self.sock = sock
+		self.number = number
+		self.jid = None
+		self.messages = 0
+		self.sent_bytes = 0
+		self.closing = False
+		# Bytes sent answering the roster request.
+		self.roster_bytes = 0
+		# Bytes the connection may still send this second.
+		self.allowance = float(server.rate)
+		self.last_check = time.time()
+
+		self.stream = NodeBuilder()
+		self.stream._dispatch_depth = 2
+		self.stream.dispatch = self.dispatch
+		self.stream.stream_header_received = self.header_received
+		self.stream.stream_footer_received = self.footer_received
+
+	def __str__(self):
+		return str(self.jid or 'connection %d' % self.number)
+
+	def readable(self, now):
+		"""Return True if the rate limit lets this connection send more."""
+		if not self.server.rate:
+			return True
+		self.allowance = min(self.server.rate, self.allowance +
+							 (now - self.last_check) * self.server.rate)
+		self.last_check = now
+		return self.allowance >= 1
+
+	def read(self):
+		size = 4096
+		if self.server.rate:
+			size = max(1, min(size, int(self.allowance)))
+		data = self.sock.recv(size)
+		if not data:
+			return False
+		self.allowance -= len(data)
+		self.stream.Parse(data)
+		return not self.closing
+
+	def send(self, data):
+		data = unicode(data).encode('utf-8')
+		self.sent_bytes += len(data)
+		self.sock.sendall(data)
+
+	def header_received(self, ns, tag, attrs):
+		self.send(STREAM_HEADER % (self.number, self.server.domain))
+		if self.server.versioning:
+			self.send(STREAM_FEATURES)
+
+	def footer_received(self):
+		self.send('</stream:stream>')
+		self.closing = True
+
+	def dispatch(self, stanza):
+		name = stanza.getName()
+		if name == 'message':
+			self.messages += 1
+			self.server.received(self, stanza)
+		elif name == 'iq' and stanza.getAttr('type') in ('get', 'set'):
+			self.iq(Iq(node=stanza))
+		elif name == 'presence' and stanza.getAttr('to'):
+			self.server.subscription(JID(stanza.getAttr('to')).getStripped(),
+									 stanza.getAttr('type'))
+
+	def push(self, jid, subscription, version):
+		"""Send a roster push for one contact."""
+		iq = Iq('set', NS_ROSTER, to=self.jid)
+		iq.getTag('query').addChild('item', {'jid' : jid,
+											 'subscription' : subscription})
+		if self.server.versioning:
+			iq.getTag('query').setAttr('ver', version)
+		self.send(iq)
+
+	def roster(self, reply, version):
+		"""Answer a roster request, with only the changes if `version` is
+		known."""
+		server = self.server
+		start = self.sent_bytes
+		changes = server.changes_since(version)
+		if changes is None:
+			query = reply.getTag('query')
+			if server.versioning:
+				query.setAttr('ver', str(server.roster_version))
+			for user in server.users:
+				query.addChild('item', {'jid' : user, 'subscription' : 'both'})
+			self.send(reply)
+		else:
+			reply.delChild('query')
+			self.send(reply)
+			for version, jid, subscription in changes:
+				self.push(jid, subscription, str(version))
+		self.roster_bytes = self.sent_bytes - start
+
+		# Everyone is online.
+		for user in server.users:
+			self.send(Presence(to=self.jid, frm='%s/chat' % user))
+
+	def iq(self, iq):
+		reply = iq.buildReply('result')
+		namespace = iq.getQueryNS()
+		if namespace == NS_AUTH and iq.getType() == 'get':
+			query = reply.getTag('query')
+			for tag in ('username', 'password', 'resource'):
+				query.addChild(tag)
+		elif namespace == NS_AUTH:
+			query = iq.getTag('query')
+			self.jid = JID(node=query.getTagData('username'),
+						   domain=self.server.domain,
+						   resource=query.getTagData('resource'))
+		elif namespace == NS_ROSTER and iq.getType() == 'get':
+			self.roster(reply, iq.getTag('query').getAttr('ver'))
+			return
+		self.send(reply)
+
+class StandInServer(threading.Thread):
+	"""A local XMPP server that throttles each connection to `rate` bytes a
+	second (0 for no limit), like the shapers real servers use.
+
+	Every account gets `users` as its roster, all of them online.
+	`recipients` counts the messages sent to each user.
+	Subscription presences add and remove users and are pushed to every
+	connection. With `versioning` the roster is versioned (XEP-0237).
+
+	"""
+
+	def __init__(self, users, rate=0, domain='bench.local', host='127.0.0.1',
+				 port=0, versioning=True):
+		threading.Thread.__init__(self, name='StandInServer')
+		self.setDaemon(True)
+		self.users = list(users)
+		self.versioning = versioning
+		self.roster_version = 0
+		# (version, jid, subscription) for every roster change.
+		self.changes = []
+		self.rate = rate
+		self.domain = domain
+		self.connections = []
+		self.recipients = {}
+		self.total = 0
+		self._lock = threading.Lock()
+		self._running = True
+
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind((host, port))
+		self.listener.listen(16)
+		self.address = self.listener.getsockname()
+
+	def received(self, connection, message):
+		with self._lock:
+			to = JID(message.getAttr('to')).getStripped()
+			self.recipients[to] = self.recipients.get(to, 0) + 1
+			self.total += 1
+
+	def subscription(self, jid, typ):
+		"""Add or remove `jid` from the roster for a subscription presence."""
+		if typ in ('subscribe', 'subscribed') and jid not in self.users:
+			self.users.append(jid)
+			subscription = 'both'
+		elif typ in ('unsubscribe', 'unsubscribed') and jid in self.users:
+			self.users.remove(jid)
+			subscription = 'remove'
+		else:
+			return
+		self.roster_version += 1
+		self.changes.append((self.roster_version, jid, subscription))
+		for connection in self.connections:
+			if connection.jid is not None:
+				connection.push(jid, subscription, str(self.roster_version))
+
+	def changes_since(self, version):
+		"""Return the roster changes after `version`, or None if the whole
+		roster has to be sent."""
+		if not self.versioning or not version or not version.isdigit():
+			return None
+		version = int(version)
+		if version > self.roster_version:
+			return None
+		return [change for change in self.changes if change[0] > version]
+
+	def wait_for(self, total, timeout=60.0, step=None):
+		"""wait_for(int total, float timeout=60.0, callable step=None) -> bool
+
+		Wait until `total` messages have been received, calling `step`
+		(eg. the bot's main loop) while waiting.
+		Return False if it took longer than `timeout` seconds.
+
+		"""
+		end = time.time() + timeout
+		while self.total < total:
+			if time.time() > end:
+				return False
+			if step:
+				step()
+			else:
+				time.sleep(0.01)
+		return True
+
+	def run(self):
+		while self._running:
+			now = time.time()
+			sockets = dict([(c.sock, c) for c in self.connections
+							if c.readable(now)])
+			try:
+				ready = select.select([self.listener] + sockets.keys(),
+									  [], [], 0.02)[0]
+			except select.error:
+				continue
+			for sock in ready:
+				if sock is self.listener:
+					client, address = self.listener.accept()
+					self.connections.append(
+						Connection(self, client, len(self.connections)))
+					continue
+				connection = sockets[sock]
+				try:
+					alive = connection.read()
+				except socket.error:
+					alive = False
+				if not alive:
+					sock.close()
+					self.connections.remove(connection)
+
+	def stop(self):
+		self._running = False
+		self.join(1)
+		for connection in self.connections:
+			connection.sock.close()
+		self.listener.close()
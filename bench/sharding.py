@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Broadcast through the bot's shards to a StandInServer."""
+
+import time
+
+from bench.server import StandInServer
+from common.ini import iMan
+
+def run(bot, connections, users, count, rate):
+	"""run(ConferenceBot bot, int connections, list users, int count, int rate) -> None
+
+	Connect `bot` to a StandInServer limiting each connection to `rate`
+	bytes a second, using `connections` connections in total, then time
+	`count` broadcasts to `users`.
+
+	"""
+	server = StandInServer(users, rate, bot.jid.getDomain())
+	server.start()
+
+	for i in xrange(1, connections):
+		iMan.config.shards['bench%d' % i] = ''
+	bot.connect(server.address, secure=0, resource='bench')
+
+	expected = count * len(users)
+	start = time.time()
+	for i in xrange(count):
+		bot.sendtoall('broadcast %d' % i)
+	finished = server.wait_for(expected, step=lambda: bot.step(0.01))
+	elapsed = time.time() - start
+
+	print '=== sharded broadcast (%d connections, %d bytes/sec each) ===' % (
+		connections, rate)
+	print 'messages: %d of %d in %.3fs, %.1f messages/sec%s' % (
+		server.total, expected, elapsed, elapsed and server.total / elapsed,
+		not finished and ' (timed out)' or '')
+	for connection in server.connections:
+		print '  %s: %d' % (connection, connection.messages)
+	print
+
+	bot.shards.disconnect()
+	server.stop()
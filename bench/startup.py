@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import time
+
+def _load_all(bot, names):
+	"""Unload then load every plugin, return the seconds the load took."""
+	bot.unload_plugins([name for name in names if name in bot._pluginhash])
+	start = time.time()
+	bot.load_plugins(names)
+	return time.time() - start
+
+def _stage_all(bot, names):
+	"""Unload then stage every plugin, return the seconds staging took."""
+	bot.unload_plugins([name for name in names
+						if name in bot._pluginhash or name in bot._staged])
+	start = time.time()
+	bot.stage_plugins(names)
+	return time.time() - start
+
+def run(bot, names, rounds=5):
+	"""run(PluginFramework bot, list names, int rounds=5) -> None
+
+	Time loading `names` with a cold code cache, a warm code cache, staging
+	them for lazy loading and an unchanged `!reload -p` check.
+	Each is the best of `rounds`.
+
+	"""
+	cold = []
+	warm = []
+	check = []
+	staged = []
+	for i in xrange(rounds):
+		shutil.rmtree(bot.code_cache_path, True)
+		cold.append(_load_all(bot, names))
+		warm.append(_load_all(bot, names))
+		staged.append(_stage_all(bot, names))
+		_load_all(bot, names)
+
+		start = time.time()
+		changed = [name for name in names if bot.plugin_changed(name)]
+		check.append(time.time() - start)
+		assert not changed, 'Plugins changed while benchmarking: %s' % changed
+
+	print '=== startup (%d plugins, best of %d) ===' % (len(names), rounds)
+	print 'cold load (compile):      %.2fms' % (min(cold) * 1000)
+	print 'warm load (code cache):   %.2fms' % (min(warm) * 1000)
+	print 'staged (lazyplugins):     %.2fms' % (min(staged) * 1000)
+	print 'unchanged reload check:   %.2fms' % (min(check) * 1000)
+	print
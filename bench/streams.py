@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import random
+
+from xmpp.simplexml import XMLescape
+
+# Each generator yields raw stanzas as the server would send them to `to`.
+# `users` is a list of bare JIDs that are in the bot's roster.
+
+LINES = [
+	'hello everyone',
+	'has anyone seen the new patch notes?',
+	'brb, dinner',
+	'lol that is <not> how it works & you know it',
+	'ok back',
+	'what time is the raid tonight?',
+]
+
+COMMANDS = [
+	'!help',
+	'!help mail',
+	'!8ball will this benchmark finish?',
+	'!roll 3d6',
+	'!calc 2**10',
+	'!lastseen user1',
+	'!mail check',
+	'!search user',
+	'!w',
+]
+
+def _message(frm, to, body):
+	return "<message from='%s/res' to='%s' type='chat'><body>%s</body></message>" % (
+		frm, to, XMLescape(body))
+
+def _presence(frm, to, show=None, typ=None, status=None):
+	attrs = typ and " type='%s'" % typ or ''
+	children = ''
+	if show:
+		children += '<show>%s</show>' % show
+	if status:
+		children += '<status>%s</status>' % XMLescape(status)
+	return "<presence from='%s/res' to='%s'%s>%s</presence>" % (
+		frm, to, attrs, children)
+
+def message_burst(to, users, count):
+	"""Chat lines from random users, each relayed to the whole room."""
+	for i in xrange(count):
+		yield _message(random.choice(users), to, random.choice(LINES))
+
+def presence_flood(to, users, count):
+	"""Every user coming online, then flapping between states.
+
+	This is what the bot sees right after it connects.
+
+	"""
+	for user in users[:count]:
+		yield _presence(user, to)
+	for i in xrange(count - len(users[:count])):
+		user = random.choice(users)
+		choice = random.randint(0, 3)
+		if choice == 0:
+			yield _presence(user, to, typ='unavailable')
+		elif choice == 1:
+			yield _presence(user, to, show='away', status='Idle')
+		else:
+			yield _presence(user, to, status='Around')
+
+def roster_pushes(to, users, count):
+	"""Roster pushes (iq set) for new and existing contacts."""
+	for i in xrange(count):
+		yield ("<iq type='set' id='push%d' to='%s'><query xmlns='jabber:iq:roster'>"
+			   "<item jid='%s' subscription='both'/></query></iq>" % (
+			   i, to, users[i % len(users)]))
+
+def command_traffic(to, users, count):
+	"""Mostly commands, with a little chat mixed in."""
+	for i in xrange(count):
+		if i % 5 == 4:
+			yield _message(random.choice(users), to, random.choice(LINES))
+		else:
+			yield _message(random.choice(users), to, random.choice(COMMANDS))
+
+def recording(path):
+	"""Replay stanzas from a file, one stanza per line.
+
+	Lines from the connection debug log (`got` lines) work as is.
+
+	"""
+	def generator(to, users, count):
+		played = 0
+		f = open(path, 'r')
+		try:
+			for line in f:
+				line = line.strip()
+				if not line or not line.startswith('<'):
+					continue
+				yield line
+				played += 1
+				if count and played >= count:
+					break
+		finally:
+			f.close()
+	return generator
+
+SCENARIOS = {
+	'messages' : message_burst,
+	'presence' : presence_flood,
+	'roster' : roster_pushes,
+	'commands' : command_traffic,
+}
+
+# Users come online first so the later scenarios have someone to talk to.
+ORDER = ['presence', 'messages', 'commands', 'roster']
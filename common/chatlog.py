@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+import logging
+import mmap
+import os
+import re
+import time
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+_history_log = logging.getLogger('pygab.history')
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+def words(text):
+	"""words(unicode text) -> set
+
+	Return the lowercased words in `text` the index is keyed by.
+
+	"""
+	return set(_word_re.findall(text.lower()))
+
+def _unicode(value):
+	# Nicks and text can arrive as byte strings, unicode_escape only works
+	# on them if they're plain ASCII.
+	if isinstance(value, str):
+		return unicode(value, 'utf-8', 'replace')
+	return value
+
+def _encode(created, nick, text):
+	# unicode_escape turns tabs and newlines into \t and \n so every record
+	# is a single tab separated line.
+	return '%d\t%s\t%s\n' % (created, nick.encode('unicode_escape'),
+							text.encode('unicode_escape'))
+
+def _decode(line):
+	created, nick, text = line.split('\t', 2)
+	return (int(created), nick.decode('unicode_escape'),
+			text.decode('unicode_escape'))
+
+class _Segment(object):
+	"""One file of the on-disk store and where its records start."""
+
+	def __init__(self, path, first):
+		self.path = path
+		# Sequence number of the segment's first record.
+		self.first = first
+		# Byte offset of each record.
+		self.offsets = array('L')
+		# Every word in the segment, so its postings can be pruned.
+		self.words = set()
+		self.size = 0
+		self._map = None
+		self._map_size = 0
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def read(self, seq):
+		"""Return the record `seq` through a read-only map of the file."""
+		offset = self.offsets[seq - self.first]
+		if offset >= self._map_size:
+			# The segment has grown since it was mapped.
+			self.close()
+			with open(self.path, 'rb') as f:
+				self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			self._map_size = self._map.size()
+		end = self._map.find('\n', offset)
+		return _decode(self._map[offset:end])
+
+	def close(self):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+			self._map_size = 0
+
+class ChatHistory(object):
+	"""Recently relayed chat, searchable by word.
+
+	The last `size` lines are kept in memory. Every line is also appended to
+	a segment file in `path`, a new segment is started once the current one
+	reaches `segment_size` bytes and the oldest is deleted once there are
+	more than `max_segments`, so both memory and disk use stay bounded.
+	An inverted index maps each word to the sequence numbers of the lines
+	using it; lines that have fallen out of memory are read back by mapping
+	their segment.
+
+	"""
+
+	def __init__(self, path, size=200, segment_size=256 * 1024, max_segments=16):
+		"""ChatHistory(str path, int size=200, int segment_size=256K,
+			int max_segments=16) -> None
+
+		"""
+		self.path = path
+		self.segment_size = segment_size
+		self.max_segments = max(max_segments, 1)
+		# (seq, created, nick, text)
+		self._recent = deque(maxlen=size)
+		self._segments = []
+		# word -> array of sequence numbers, oldest first
+		self._index = {}
+		self._next = 0
+		self._journal = None
+
+	def __len__(self):
+		"""Return the number of lines still searchable."""
+		if not self._segments:
+			return 0
+		return self._next - self._segments[0].first
+
+	def load(self):
+		"""load() -> None
+
+		Rebuild the index from the segments on disk and open the newest for
+		appending.
+
+		"""
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+		names = sorted([name for name in os.listdir(self.path)
+						if name.endswith('.seg')])
+		for name in names:
+			segment = _Segment(os.path.join(self.path, name), self._next)
+			self._segments.append(segment)
+			torn = False
+			with open(segment.path, 'rb') as f:
+				offset = 0
+				for line in f:
+					if not line.endswith('\n'):
+						torn = True
+						break
+					try:
+						created, nick, text = _decode(line[:-1])
+					except ValueError:
+						_history_log.warning("Skipping a corrupt line in %s" % name)
+					else:
+						segment.offsets.append(offset)
+						self._add(segment, created, nick, text)
+					offset += len(line)
+				segment.size = offset
+			if torn:
+				# A torn write from a crash, cut it off so the next line
+				# doesn't get appended to it.
+				_history_log.warning("Dropping a partial line in %s" % name)
+				with open(segment.path, 'r+b') as f:
+					f.truncate(segment.size)
+		self._prune()
+		if self._segments:
+			self._open(self._segments[-1])
+		_history_log.info("Loaded %d lines of history from %s" % (
+			len(self), self.path))
+
+	def close(self):
+		"""close() -> None
+
+		Close the segment being written and every mapped segment.
+
+		"""
+		if self._journal is not None:
+			self._journal.close()
+			self._journal = None
+		for segment in self._segments:
+			segment.close()
+
+	def append(self, nick, text, created=None):
+		"""append(unicode nick, unicode text, int created=time.time()) -> None
+
+		Record a relayed line.
+
+		"""
+		if created is None:
+			created = time.time()
+		nick = _unicode(nick)
+		text = _unicode(text)
+		segment = self._segments and self._segments[-1]
+		if not segment or segment.size >= self.segment_size:
+			number = 0
+			if segment:
+				number = int(os.path.basename(segment.path)[:-4]) + 1
+			segment = _Segment(os.path.join(self.path, '%08d.seg' % number),
+							   self._next)
+			self._segments.append(segment)
+			self._open(segment)
+			self._prune()
+
+		record = _encode(created, nick, text)
+		self._journal.write(record)
+		self._journal.flush()
+		segment.offsets.append(segment.size)
+		segment.size += len(record)
+		self._add(segment, int(created), nick, text)
+
+	def recent(self, count):
+		"""recent(int count) -> list
+
+		Return the last `count` lines as (created, nick, text), oldest first.
+
+		"""
+		first = max(self._next - count, self._next - len(self))
+		return [self._read(seq) for seq in xrange(first, self._next)]
+
+	def search(self, query, count):
+		"""search(unicode query, int count) -> list
+
+		Return the last `count` lines using every word in `query` as
+		(created, nick, text), oldest first.
+
+		"""
+		postings = [self._index.get(word) for word in words(query)]
+		if not postings:
+			return []
+		if None in postings:
+			return []
+		postings.sort(key=len)
+		shortest, others = postings[0], postings[1:]
+
+		found = []
+		for seq in reversed(shortest):
+			for posting in others:
+				i = bisect_left(posting, seq)
+				if i == len(posting) or posting[i] != seq:
+					break
+			else:
+				found.append(seq)
+				if len(found) >= count:
+					break
+		found.reverse()
+		return [self._read(seq) for seq in found]
+
+	def _read(self, seq):
+		if self._recent and seq >= self._recent[0][0]:
+			return self._recent[seq - self._recent[0][0]][1:]
+		segment = self._segments[self._segment_index(seq)]
+		return segment.read(seq)
+
+	def _segment_index(self, seq):
+		lo, hi = 0, len(self._segments) - 1
+		while lo < hi:
+			mid = (lo + hi + 1) // 2
+			if self._segments[mid].first <= seq:
+				lo = mid
+			else:
+				hi = mid - 1
+		return lo
+
+	def _add(self, segment, created, nick, text):
+		seq = self._next
+		self._next += 1
+		self._recent.append((seq, created, nick, text))
+		for word in words(text):
+			posting = self._index.get(word)
+			if posting is None:
+				posting = self._index[word] = array('L')
+			posting.append(seq)
+			segment.words.add(word)
+
+	def _open(self, segment):
+		if self._journal is not None:
+			self._journal.close()
+		self._journal = open(segment.path, 'ab')
+
+	def _prune(self):
+		while len(self._segments) > self.max_segments:
+			segment = self._segments.pop(0)
+			first = self._segments[0].first
+			for word in segment.words:
+				posting = self._index[word]
+				del posting[:bisect_left(posting, first)]
+				if not posting:
+					del self._index[word]
+			segment.close()
+			os.remove(segment.path)
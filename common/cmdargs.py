@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Declarative arguments for bot commands.
+
+A command describes its arguments once, at class level, and parses them with
+CommandMount.parse_args. The spec is compiled into lookup tables when it's
+built, so parsing is a split and a walk over the words, and help text comes
+from the spec itself. argparse and shlex are never imported.
+
+	class Reload(mounts.CommandMount):
+		argspec = cmdargs.ArgSpec('!reload',
+			cmdargs.Arg('extra', nargs='?', default=False),
+			cmdargs.Option('-f', '--force', help='force an action'),
+			cmdargs.Option('-p', '--plugin', nargs='?', metavar='plugin_name'),
+		)
+		__doc__ = "Reload parts of the bot.\n%s" % argspec.format_help()
+
+		def thread(self, user, args):
+			options = self.parse_args(args)
+
+Anything that doesn't fit the spec raises CommandHelp, which sends the user
+the command's __doc__.
+
+"""
+
+import re
+
+from common import const
+
+__all__ = ['Arg', 'Option', 'ArgSpec', 'Namespace', 'split']
+
+# Words are only run through the tokenizer if one of these shows up,
+# everything else is a plain str.split().
+_QUOTING = re.compile(r'[\'"\\]')
+
+# Double quoted text, single quoted text, an escaped character, whitespace
+# and plain text. Anything else is an unbalanced quote or a trailing
+# backslash.
+_TOKEN = re.compile(r'''"((?:[^"\\]|\\.)*)"|'([^']*)'|\\(.)|(\s+)|([^\s'"\\]+)|(.)''',
+					re.S)
+# Inside double quotes a backslash only escapes a quote or another backslash.
+_DQ_ESCAPE = re.compile(r'\\([\\"])')
+
+def split(text):
+	"""split(str text) -> list
+
+	Split `text` into words the way a posix shell (and shlex.split) would.
+	Raises CommandHelp on an unbalanced quote.
+
+	"""
+	if not _QUOTING.search(text):
+		return text.split()
+
+	words = []
+	word = []
+	inword = False
+	for dq, sq, escaped, space, plain, bad in _TOKEN.findall(text):
+		if space:
+			if inword:
+				words.append(''.join(word))
+				word = []
+				inword = False
+			continue
+		if bad:
+			raise const.CommandHelp('No closing quotation')
+		inword = True
+		if plain:
+			word.append(plain)
+		elif escaped:
+			word.append(escaped)
+		elif sq:
+			word.append(sq)
+		elif dq:
+			word.append(_DQ_ESCAPE.sub(r'\1', dq))
+		# Otherwise it's an empty pair of quotes, still a word.
+	if inword:
+		words.append(''.join(word))
+	return words
+
+def _is_option(word):
+	"""Words starting with a dash are options, unless they're a number."""
+	return word[:1] == '-' and len(word) > 1 and not word[1].isdigit()
+
+class Namespace(object):
+	"""Holds the parsed values as attributes."""
+	def __init__(self, **kwargs):
+		self.__dict__.update(kwargs)
+
+	def __repr__(self):
+		return 'Namespace(%s)' % ', '.join(
+			['%s=%r' % item for item in sorted(self.__dict__.items())])
+
+class Arg(object):
+	"""A positional argument.
+
+	nargs is 1 for a required word, '?' for an optional one and '*' for
+	every word left over (a list).
+
+	"""
+	def __init__(self, dest, nargs=1, default=None, metavar=None, help=''):
+		if nargs not in (1, '?', '*'):
+			raise ValueError('Unsupported nargs %r for %s' % (nargs, dest))
+		self.dest = dest
+		self.nargs = nargs
+		if nargs == '*' and default is None:
+			default = []
+		self.default = default
+		self.metavar = metavar or dest
+		self.help = help
+
+	def usage(self):
+		if self.nargs == 1:
+			return self.metavar
+		elif self.nargs == '?':
+			return '[%s]' % self.metavar
+		return '[%s ...]' % self.metavar
+
+class Option(object):
+	"""An option, -s and/or --long.
+
+	nargs is 0 for a switch (False, True when given), '?' for a value that
+	may be left off (default, `const` when there's no value) and 1 for a
+	required value.
+
+	"""
+	def __init__(self, *flags, **kwargs):
+		self.flags = flags
+		self.nargs = kwargs.pop('nargs', 0)
+		if self.nargs not in (0, '?', 1):
+			raise ValueError('Unsupported nargs %r for %s' % (self.nargs, flags))
+
+		longs = [flag for flag in flags if flag.startswith('--')]
+		dest = (longs or flags)[0].lstrip('-').replace('-', '_')
+		self.dest = kwargs.pop('dest', dest)
+		self.const = kwargs.pop('const', True)
+		if self.nargs:
+			self.default = kwargs.pop('default', None)
+		else:
+			self.default = kwargs.pop('default', False)
+		self.metavar = kwargs.pop('metavar', self.dest)
+		self.help = kwargs.pop('help', '')
+		if kwargs:
+			raise TypeError('Unknown Option arguments: %s' % ', '.join(kwargs))
+
+	def invocation(self):
+		flags = ', '.join(self.flags)
+		if self.nargs == '?':
+			return '%s [%s]' % (flags, self.metavar)
+		elif self.nargs == 1:
+			return '%s %s' % (flags, self.metavar)
+		return flags
+
+	def usage(self):
+		flag = self.flags[0]
+		if self.nargs == '?':
+			return '[%s [%s]]' % (flag, self.metavar)
+		elif self.nargs == 1:
+			return '[%s %s]' % (flag, self.metavar)
+		return '[%s]' % flag
+
+class ArgSpec(object):
+	"""The arguments one command takes.
+
+	ex. ArgSpec('!help', Arg('cmd', nargs='?', metavar='command'))
+
+	"""
+	def __init__(self, prog, *args, **kwargs):
+		self.prog = prog
+		self.epilog = kwargs.pop('epilog', '')
+		if kwargs:
+			raise TypeError('Unknown ArgSpec arguments: %s' % ', '.join(kwargs))
+
+		self.positionals = [arg for arg in args if isinstance(arg, Arg)]
+		self.options = [arg for arg in args if isinstance(arg, Option)]
+
+		# Compile the spec: flag -> Option, and the starting values.
+		self._flags = {}
+		for option in self.options:
+			for flag in option.flags:
+				if flag in self._flags:
+					raise ValueError('%s is used twice in %s' % (flag, prog))
+				self._flags[flag] = option
+		self._defaults = dict([(arg.dest, arg.default)
+							   for arg in self.positionals + self.options])
+		self._help = None
+
+	def parse(self, text):
+		"""parse(str text) -> Namespace
+
+		Raises CommandHelp when `text` doesn't match the spec.
+
+		"""
+		values = self._defaults.copy()
+		words = split(text)
+		positionals = self.positionals
+		rest = []
+		index = 0
+		count = len(words)
+		while index < count:
+			word = words[index]
+			index += 1
+			if not self._flags or not _is_option(word):
+				rest.append(word)
+				continue
+			if word == '--':
+				rest.extend(words[index:])
+				break
+
+			value = None
+			if word[:2] == '--':
+				if '=' in word:
+					word, value = word.split('=', 1)
+				option = self._flags.get(word)
+			else:
+				option = self._flags.get(word[:2])
+				flags = word[2:]
+				if option is not None and flags and not option.nargs:
+					# A run of switches, -af. Like argparse the last one may
+					# take a value, -ap foo or -apfoo.
+					while option is not None and not option.nargs and flags:
+						values[option.dest] = True
+						word = '-' + flags[0]
+						option = self._flags.get(word)
+						flags = flags[1:]
+				if option is not None and option.nargs and flags:
+					value = flags
+			if option is None:
+				raise const.CommandHelp('Unrecognized option %s' % word)
+
+			if not option.nargs:
+				if value is not None and word[:2] == '--':
+					raise const.CommandHelp('%s takes no value' % word)
+				values[option.dest] = True
+				continue
+			if value is None and index < count and not _is_option(words[index]):
+				value = words[index]
+				index += 1
+			if value is None:
+				if option.nargs == 1:
+					raise const.CommandHelp('%s needs a value' % word)
+				value = option.const
+			values[option.dest] = value
+
+		for arg in positionals:
+			if arg.nargs == '*':
+				if rest:
+					values[arg.dest] = rest
+				rest = []
+				break
+			if rest:
+				values[arg.dest] = rest.pop(0)
+			elif arg.nargs == 1:
+				raise const.CommandHelp('Missing %s' % arg.metavar)
+		if rest:
+			raise const.CommandHelp('Unrecognized arguments: %s' % ' '.join(rest))
+		return Namespace(**values)
+
+	def format_usage(self):
+		return 'usage: %s' % ' '.join([self.prog] +
+			[option.usage() for option in self.options] +
+			[arg.usage() for arg in self.positionals])
+
+	def format_help(self):
+		"""Usage, one line per argument and the epilog."""
+		if self._help is not None:
+			return self._help
+
+		sections = [self.format_usage()]
+		positionals = [(arg.metavar, arg.help) for arg in self.positionals]
+		options = [(option.invocation(), option.help) for option in self.options]
+		# Line the help up in one column, unless a name is very long.
+		width = min(max([0] + [len(name) for name, _ in positionals + options]),
+					22)
+		for title, rows in (('positional arguments:', positionals),
+							('optional arguments:', options)):
+			if not rows:
+				continue
+			lines = [title]
+			for name, help in rows:
+				if len(name) > width and help:
+					lines.append('  %s' % name)
+					lines.append('  %s  %s' % (' ' * width, help))
+				else:
+					lines.append(('  %-*s  %s' % (width, name, help)).rstrip())
+			sections.append('\n'.join(lines))
+		if self.epilog:
+			sections.append(self.epilog)
+		self._help = '\n\n'.join(sections) + '\n'
+		return self._help
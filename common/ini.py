@@ -37,6 +37,68 @@ global iMan
 
 _ini_log = logging.getLogger('pygab.ini')
 
+# Sections whose lists are looked up by membership, they're frozen as frozensets.
+SET_SECTIONS = frozenset(['users'])
+
+def _freeze(value, as_set=False):
+	if isinstance(value, (list, tuple)):
+		if as_set:
+			return frozenset(value)
+		return tuple(value)
+	return value
+
+class FrozenSection(object):
+
+	"""A read only copy of an ini section with every key as a plain attribute.
+
+	Sub-sections become FrozenSections, lists become tuples and the lists in
+	SET_SECTIONS become frozensets. Unlike ConfigNode, reading a missing key
+	raises AttributeError instead of creating it.
+
+	"""
+
+	def __init__(self, node, name=None):
+		as_set = name in SET_SECTIONS
+		for key, value in node.iteritems():
+			if isinstance(value, ConfigNode):
+				value = FrozenSection(value, key)
+			else:
+				value = _freeze(value, as_set)
+			object.__setattr__(self, key, value)
+
+	def __setattr__(self, attr, value):
+		raise AttributeError('Config snapshots are read only')
+
+	def __delattr__(self, attr):
+		raise AttributeError('Config snapshots are read only')
+
+	def __contains__(self, key):
+		return key in self.__dict__
+
+	def __getitem__(self, key):
+		return self.__dict__[key]
+
+	def __iter__(self):
+		return iter(self.__dict__)
+
+	def __repr__(self):
+		return 'FrozenSection(%r)' % self.__dict__
+
+	def get(self, key, default=None):
+		return self.__dict__.get(key, default)
+
+	def items(self):
+		return self.__dict__.items()
+
+def _callback_key(callback):
+	# Plugins are exec'd so their functions have no __module__, use the file
+	# they were defined in instead.
+	func = getattr(callback, 'im_func', callback)
+	try:
+		return (func.func_globals.get('__file__'), func.__name__)
+	except AttributeError:
+		return callback
+
 class IniManager(object):
 
 	"""IniManager is a convience class for managing ini files.
@@ -53,6 +115,10 @@ class IniManager(object):
 		self.temp_path = (curdir, temp_path)
 		# Keep track of the number of times an .ini is loaded/unloaded.
 		self.__references = {}
+		# name -> FrozenSection of the ini as it was last read.
+		self.__snapshots = {}
+		# name -> {(file, function name): callback}
+		self.__subscribers = {}
 
 	def __contains__(self, name):
 		"""__contains__(str name) -> bool
@@ -110,6 +176,7 @@ class IniManager(object):
 		else:
 			setattr(self, name, ini)
 			self.__references[name] = self.__references.get(name, 0) + 1
+			self.refresh(name)
 			return True
 
 	def loaded(self, name):
@@ -135,6 +202,7 @@ class IniManager(object):
 					self[name].save()
 				del self[name]
 				del self.__references[name]
+				self.__snapshots.pop(name, None)
 				return True
 		return False
 
@@ -150,14 +218,81 @@ class IniManager(object):
 		ini.setfilename(new_name)
 		ini.save()
 
+	def read(self, name):
+		"""read(str name) -> None
+
+		Read 'name'.ini again and refresh its snapshot.
+
+		"""
+		name = name.lower()
+		self[name].read()
+		self.refresh(name)
+
 	def readall(self):
 		"""readall() -> None
 
 		Read all loaded ini files.
 
 		"""
-		for ini in self:
-			ini.read()
+		for name in self.__references.keys():
+			self.read(name)
+
+	def snapshot(self, name):
+		"""snapshot(str name) -> FrozenSection
+
+		Return the read only copy of 'name'.ini, None if it isn't loaded.
+		The copy is replaced, never changed, whenever the ini is read or
+		refreshed, so hold on to it for as long as one consistent view is
+		needed.
+
+		"""
+		name = name.lower()
+		snapshot = self.__snapshots.get(name)
+		if snapshot is None and name in self.__references:
+			snapshot = self.refresh(name)
+		return snapshot
+
+	def refresh(self, name):
+		"""refresh(str name) -> FrozenSection
+
+		Rebuild the snapshot of 'name'.ini and pass it to its subscribers.
+		Call this after changing a loaded ini in place.
+
+		"""
+		name = name.lower()
+		snapshot = FrozenSection(self[name])
+		self.__snapshots[name] = snapshot
+		for callback in self.__subscribers.get(name, {}).values():
+			try:
+				callback(snapshot)
+			except:
+				traceback.print_exc()
+		return snapshot
+
+	def subscribe(self, name, callback):
+		"""subscribe(str name, function callback) -> None
+
+		Call 'callback(snapshot)' whenever the snapshot of 'name'.ini is
+		rebuilt, and straight away if it's loaded. A callback replaces one
+		from the same file with the same name, so reloading a plugin
+		doesn't leave its old callbacks behind.
+
+		"""
+		name = name.lower()
+		self.__subscribers.setdefault(name, {})[_callback_key(callback)] = callback
+		snapshot = self.snapshot(name)
+		if snapshot is not None:
+			callback(snapshot)
+
+	def unsubscribe(self, name, callback):
+		"""unsubscribe(str name, function callback) -> None"""
+		self.__subscribers.get(name.lower(), {}).pop(_callback_key(callback), None)
+
+	def _name_of(self, ini):
+		"""Return the name 'ini' is loaded under."""
+		for name in self.__references:
+			if self[name] is ini:
+				return name
 
 	def saveall(self):
 		"""readall() -> None
@@ -209,6 +344,7 @@ class IniManager(object):
 		else:
 			ini[section][key] = [entry]
 		ini.save()
+		self._refresh_node(ini)
 		return True
 
 	def del_entry(self, ini, section, key, entry):
@@ -230,6 +366,7 @@ class IniManager(object):
 		if not ini[section][key]:
 			del ini[section][key]
 		ini.save()
+		self._refresh_node(ini)
 		return True
 
 	def set_entry(self, ini, section, key, entry):
@@ -246,8 +383,20 @@ class IniManager(object):
 
 		ini[section][key] = [entry]
 		ini.save()
+		self._refresh_node(ini)
 		return True
 
+	def _refresh_node(self, ini):
+		name = self._name_of(ini)
+		if not name:
+			return
+		if self.__subscribers.get(name):
+			self.refresh(name)
+		else:
+			# Nobody is waiting on it, so drop the stale snapshot and let
+			# the next snapshot() call build a new one.
+			self.__snapshots.pop(name, None)
+
 	def _merge_template(self, ini, template):
 		"""_merge_template(DictIni ini, DictIni template) -> DictIni
 
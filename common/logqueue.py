@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Asynchronous logging.
+
+Records are put on a bounded queue by `QueueHandler` and written by a
+background `LogWriter` thread, so a slow disk or a log rotation never holds
+up the main loop.
+
+	writer = LogWriter(queue_size=10000, overflow='drop_new')
+	history = BatchedFileHandler('history.log', 'midnight', 1, 0, 'utf-8')
+	logging.getLogger('pygab.chat').addHandler(writer.handler(history))
+	writer.start()
+
+Create the target handlers before the queue handler wrapping them,
+logging.shutdown closes handlers newest first and the queue handler has to
+be drained into the targets before they're closed.
+
+Messages are %-formatted on the writer thread, pass arguments that won't
+change after the call.
+
+"""
+
+import logging
+import logging.handlers
+import Queue
+import threading
+
+from common import metrics
+
+# What to do with a record when the queue is full.
+OVERFLOW_DROP_NEW = 'drop_new'		# Discard the record being logged.
+OVERFLOW_DROP_OLD = 'drop_old'		# Discard the oldest queued record.
+OVERFLOW_BLOCK = 'block'			# Wait for room, stalls the caller.
+OVERFLOW_POLICIES = (OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLD, OVERFLOW_BLOCK)
+
+# Put on the queue to tell the writer to finish.
+_STOP = object()
+
+class BatchedFileHandler(logging.handlers.TimedRotatingFileHandler):
+	"""A TimedRotatingFileHandler that only flushes at the end of a batch.
+
+	LogWriter calls `flush_batch` after writing each batch, so a burst of
+	records costs one flush instead of one per line.
+
+	"""
+
+	def flush(self):
+		pass
+
+	def flush_batch(self):
+		logging.handlers.TimedRotatingFileHandler.flush(self)
+
+	def close(self):
+		self.flush_batch()
+		logging.handlers.TimedRotatingFileHandler.close(self)
+
+class QueueHandler(logging.Handler):
+	"""Put records on a LogWriter's queue for `handlers` to write."""
+
+	def __init__(self, writer, handlers):
+		logging.Handler.__init__(self)
+		self.writer = writer
+		self.handlers = handlers
+
+	def emit(self, record):
+		if record.exc_info:
+			# Tracebacks keep frames alive and may be gone by the time the
+			# writer gets to the record, format them now.
+			self.format(record)
+			record.exc_info = None
+		self.writer.put((self.handlers, record))
+
+	def close(self):
+		self.writer.stop()
+		logging.Handler.close(self)
+
+class LogWriter(threading.Thread):
+	"""Write queued records from a background thread.
+
+	`queue_size` bounds the backlog, `overflow` is one of OVERFLOW_POLICIES and
+	`batch_size` is the most records written between flushes.
+	`stats` counts queued, written and dropped records.
+
+	"""
+
+	def __init__(self, queue_size=10000, overflow=OVERFLOW_DROP_NEW,
+				 batch_size=100):
+		threading.Thread.__init__(self, name='LogWriter')
+		self.setDaemon(True)
+		if overflow not in OVERFLOW_POLICIES:
+			raise ValueError('Unknown log overflow policy: %s' % overflow)
+		self.queue = Queue.Queue(queue_size)
+		self.overflow = overflow
+		self.batch_size = max(1, batch_size)
+		self.stats = {'queued' : 0, 'written' : 0, 'dropped' : 0}
+		self._stopped = False
+
+	def handler(self, *handlers):
+		"""handler(logging.Handler *handlers) -> QueueHandler
+
+		Return a handler that queues records for `handlers` to write.
+
+		"""
+		return QueueHandler(self, handlers)
+
+	def put(self, item):
+		"""put(tuple item) -> bool
+
+		Queue a (handlers, record) pair following the overflow policy.
+		Return False if a record had to be dropped.
+
+		"""
+		if self._stopped:
+			# Nobody is left to write it, do it here.
+			self.write([item])
+			return True
+
+		if self.overflow == OVERFLOW_BLOCK:
+			self.queue.put(item)
+			self.stats['queued'] += 1
+			return True
+
+		try:
+			self.queue.put_nowait(item)
+			self.stats['queued'] += 1
+			return True
+		except Queue.Full:
+			pass
+
+		if self.overflow == OVERFLOW_DROP_OLD:
+			try:
+				self.queue.get_nowait()
+			except Queue.Empty:
+				pass
+			try:
+				self.queue.put_nowait(item)
+				self.stats['queued'] += 1
+			except Queue.Full:
+				pass
+		self.stats['dropped'] += 1
+		metrics.registry.inc('log.dropped')
+		return False
+
+	def run(self):
+		while True:
+			batch = [self.queue.get()]
+			while len(batch) < self.batch_size:
+				try:
+					batch.append(self.queue.get_nowait())
+				except Queue.Empty:
+					break
+
+			stop = _STOP in batch
+			self.write([item for item in batch if item is not _STOP])
+			if stop:
+				return
+
+	def write(self, items):
+		written = set()
+		for handlers, record in items:
+			for handler in handlers:
+				if record.levelno >= handler.level:
+					# Rotation happens in here, on this thread.
+					handler.handle(record)
+					written.add(handler)
+		for handler in written:
+			if hasattr(handler, 'flush_batch'):
+				handler.flush_batch()
+			else:
+				handler.flush()
+		self.stats['written'] += len(items)
+		metrics.registry.set('log.backlog', self.queue.qsize())
+
+	def stop(self, timeout=5.0):
+		"""stop(float timeout=5.0) -> None
+
+		Write out what's queued and stop the thread. Records logged after this
+		are written synchronously.
+
+		"""
+		if self._stopped:
+			return
+		self._stopped = True
+		if self.isAlive():
+			# Block even if the queue is full, the sentinel must get through.
+			self.queue.put(_STOP)
+			self.join(timeout)
+		else:
+			items = []
+			while True:
+				try:
+					items.append(self.queue.get_nowait())
+				except Queue.Empty:
+					break
+			self.write(items)
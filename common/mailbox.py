@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+import ast
+import logging
+import os
+
+_mail_log = logging.getLogger('pygab.mail')
+
+class MailStore(object):
+	"""Mailbox storage backed by an append-only journal.
+
+	Every mailbox lives in memory as a dictionary of sender -> message, keyed
+	by the recipient's lowercased user name. Changes are appended to the
+	journal as single records rather than rewriting the whole file, so sending
+	or reading a letter costs one small write. The journal is compacted when
+	dead records outnumber live ones by `compact_ratio`.
+
+	"""
+
+	def __init__(self, filename, compact_ratio=4):
+		"""MailStore(str filename, int compact_ratio=4) -> None
+
+		"""
+		self._filename = filename
+		self.compact_ratio = compact_ratio
+		# recipient -> {sender: message}
+		self._boxes = {}
+		# Number of records in the journal and number of letters still
+		# waiting, used to decide when to compact.
+		self._records = 0
+		self._live = 0
+		self._journal = None
+
+	def __contains__(self, recipient):
+		"""Return True if 'recipient' has any mail waiting. O(1)"""
+		self._ensure_loaded()
+		return recipient in self._boxes
+
+	def __len__(self):
+		return len(self._boxes)
+
+	def exists(self):
+		"""Return True if the journal file is already on disk."""
+		return os.path.exists(self._filename)
+
+	def load(self):
+		"""load() -> None
+
+		Rebuild the in-memory index by replaying the journal.
+
+		"""
+		self._boxes.clear()
+		self._records = 0
+		self._live = 0
+		if self.exists():
+			with open(self._filename, 'r') as f:
+				for index, line in enumerate(f):
+					line = line.strip()
+					if not line:
+						continue
+					try:
+						record = ast.literal_eval(line)
+					except (SyntaxError, ValueError):
+						# A torn write from a crash, skip it.
+						_mail_log.warning("Skipping corrupt mail record on "
+										  "line %d" % (index + 1))
+						continue
+					self._apply(record)
+					self._records += 1
+
+		if self._journal is not None:
+			self._journal.close()
+		self._journal = open(self._filename, 'a')
+		_mail_log.info("Loaded %d mailboxes from %s" % (
+			len(self._boxes), self._filename))
+
+	def import_ini(self, ini):
+		"""import_ini(ConfigNode ini) -> int
+
+		Copy letters from an old style mail.ini into the journal.
+		Return the number of letters imported.
+
+		"""
+		imported = 0
+		for recipient, letters in ini.items():
+			for sender, message in letters.items():
+				self.put(recipient, sender, message)
+				imported += 1
+		return imported
+
+	def close(self):
+		"""close() -> None
+
+		Compact the journal if needed and close it.
+
+		"""
+		if self._journal is None:
+			return
+		self._maybe_compact()
+		self._journal.close()
+		self._journal = None
+
+	def count(self, recipient):
+		"""count(str recipient) -> int
+
+		Return the number of letters waiting for 'recipient'.
+
+		"""
+		self._ensure_loaded()
+		return len(self._boxes.get(recipient, ()))
+
+	def put(self, recipient, sender, message):
+		"""put(str recipient, str sender, str message) -> None
+
+		Store a letter. A sender only ever has one letter per recipient, so
+		a second letter replaces the first.
+
+		"""
+		self._ensure_loaded()
+		self._write(('put', recipient, sender, message))
+
+	def peek(self, recipient):
+		"""peek(str recipient) -> (sender, message)
+
+		Return the next letter for 'recipient' or None if there are none.
+
+		"""
+		self._ensure_loaded()
+		box = self._boxes.get(recipient)
+		if not box:
+			return None
+		return box.items()[0]
+
+	def pop(self, recipient):
+		"""pop(str recipient) -> (sender, message)
+
+		Remove and return the next letter for 'recipient' or None if there
+		are none.
+
+		"""
+		letter = self.peek(recipient)
+		if letter is not None:
+			self._write(('del', recipient, letter[0]))
+			self._maybe_compact()
+		return letter
+
+	def compact(self):
+		"""compact() -> None
+
+		Rewrite the journal so it only contains live letters.
+
+		"""
+		temp_name = self._filename + '.tmp'
+		records = 0
+		with open(temp_name, 'w') as f:
+			for recipient, box in self._boxes.iteritems():
+				for sender, message in box.iteritems():
+					f.write('%r\n' % (('put', recipient, sender, message),))
+					records += 1
+		if self._journal is not None:
+			self._journal.close()
+		# os.rename won't replace an existing file on windows.
+		if os.name == 'nt' and os.path.exists(self._filename):
+			os.remove(self._filename)
+		os.rename(temp_name, self._filename)
+		self._journal = open(self._filename, 'a')
+		self._records = records
+
+	def _maybe_compact(self):
+		if self._records > max(self._live, 1) * self.compact_ratio:
+			self.compact()
+
+	def _ensure_loaded(self):
+		# The journal is opened the first time it's needed so the store
+		# works even if nothing called load() first.
+		if self._journal is None:
+			self.load()
+
+	def _write(self, record):
+		self._apply(record)
+		self._journal.write('%r\n' % (record,))
+		self._journal.flush()
+		self._records += 1
+
+	def _apply(self, record):
+		if record[0] == 'put':
+			_, recipient, sender, message = record
+			box = self._boxes.setdefault(recipient, {})
+			if sender not in box:
+				self._live += 1
+			box[sender] = message
+		elif record[0] == 'del':
+			_, recipient, sender = record
+			box = self._boxes.get(recipient)
+			if box is not None and sender in box:
+				del box[sender]
+				self._live -= 1
+				if not box:
+					del self._boxes[recipient]
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Lightweight counters, gauges and latency histograms.
+
+All metrics live in the module level `registry`. Recording is skipped while
+`registry.enabled` is False, so instrumented code only pays for a flag check.
+
+	from common import metrics
+	with metrics.registry.time('command.%s' % name):
+		...
+	metrics.registry.inc('mail.sent')
+
+"""
+
+from __future__ import with_statement
+
+import sys
+import time
+
+# Upper bound of each latency bucket in milliseconds, the last bucket holds
+# everything slower.
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+class Counter(object):
+	"""A value that only goes up."""
+	__slots__ = ['value']
+
+	def __init__(self):
+		self.value = 0
+
+	def inc(self, amount=1):
+		self.value += amount
+
+	def snapshot(self):
+		return self.value
+
+class Gauge(object):
+	"""A value that is set to whatever it currently is."""
+	__slots__ = ['value']
+
+	def __init__(self):
+		self.value = 0
+
+	def set(self, value):
+		self.value = value
+
+	def snapshot(self):
+		return self.value
+
+class Histogram(object):
+	"""Bucketed latency recorder.
+
+	Observations are in seconds, reported values are in milliseconds.
+	Percentiles are the upper bound of the bucket they fall in.
+
+	"""
+	__slots__ = ['buckets', 'count', 'total', 'max']
+
+	def __init__(self):
+		self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		ms = seconds * 1000.0
+		self.count += 1
+		self.total += ms
+		if ms > self.max:
+			self.max = ms
+		index = 0
+		for bound in LATENCY_BUCKETS:
+			if ms <= bound:
+				break
+			index += 1
+		self.buckets[index] += 1
+
+	def percentile(self, percent):
+		"""percentile(float percent) -> float
+
+		Return the bucket bound in milliseconds `percent` of observations
+		fall under.
+
+		"""
+		if not self.count:
+			return 0.0
+		wanted = self.count * percent / 100.0
+		seen = 0
+		for index, hits in enumerate(self.buckets):
+			seen += hits
+			if seen >= wanted:
+				if index < len(LATENCY_BUCKETS):
+					return float(LATENCY_BUCKETS[index])
+				break
+		return self.max
+
+	def snapshot(self):
+		return {
+			'count' : self.count,
+			'avg_ms' : self.count and self.total / self.count,
+			'max_ms' : self.max,
+			'p50_ms' : self.percentile(50),
+			'p95_ms' : self.percentile(95),
+			'p99_ms' : self.percentile(99),
+		}
+
+class _Timer(object):
+	"""Context manager that records its duration in a histogram."""
+	__slots__ = ['histogram', 'start']
+
+	def __init__(self, histogram):
+		self.histogram = histogram
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.histogram.observe(time.time() - self.start)
+
+class _NullTimer(object):
+	"""Stand in for _Timer while metrics are disabled."""
+	__slots__ = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		pass
+
+_null_timer = _NullTimer()
+
+class MetricsRegistry(object):
+	"""Stores every named metric.
+
+	Metrics are created the first time they're used, a name always refers
+	to the same kind of metric.
+
+	"""
+
+	def __init__(self):
+		self.enabled = False
+		self.started = time.time()
+		self._metrics = {}
+
+	def __iter__(self):
+		return iter(sorted(self._metrics.items()))
+
+	def _get(self, name, kind):
+		metric = self._metrics.get(name)
+		if metric is None:
+			metric = self._metrics[name] = kind()
+		return metric
+
+	def counter(self, name):
+		return self._get(name, Counter)
+
+	def gauge(self, name):
+		return self._get(name, Gauge)
+
+	def histogram(self, name):
+		return self._get(name, Histogram)
+
+	def inc(self, name, amount=1):
+		"""inc(str name, int amount=1) -> None
+
+		Increase the counter `name` if metrics are enabled.
+
+		"""
+		if self.enabled:
+			self._get(name, Counter).inc(amount)
+
+	def set(self, name, value):
+		"""set(str name, value) -> None
+
+		Set the gauge `name` if metrics are enabled.
+
+		"""
+		if self.enabled:
+			self._get(name, Gauge).set(value)
+
+	def observe(self, name, seconds):
+		"""observe(str name, float seconds) -> None
+
+		Record a duration in the histogram `name` if metrics are enabled.
+
+		"""
+		if self.enabled:
+			self._get(name, Histogram).observe(seconds)
+
+	def time(self, name):
+		"""time(str name) -> context manager
+
+		Time a block of code into the histogram `name`.
+
+		"""
+		if not self.enabled:
+			return _null_timer
+		return _Timer(self._get(name, Histogram))
+
+	def reset(self):
+		"""reset() -> None
+
+		Forget every metric.
+
+		"""
+		self._metrics.clear()
+		self.started = time.time()
+
+	def snapshot(self, prefix=''):
+		"""snapshot(str prefix='') -> dict
+
+		Return the current value of every metric whose name starts with
+		`prefix`.
+
+		"""
+		return dict([(name, metric.snapshot()) for name, metric in self
+					 if name.startswith(prefix)])
+
+	def format(self, prefix=''):
+		"""format(str prefix='') -> str
+
+		Return a human readable listing of every metric.
+
+		"""
+		lines = []
+		for name, metric in self:
+			if not name.startswith(prefix):
+				continue
+			if isinstance(metric, Histogram):
+				snap = metric.snapshot()
+				lines.append('%s: count=%d avg=%.2fms p50=%.1fms p95=%.1fms '
+					'p99=%.1fms max=%.2fms' % (name, snap['count'],
+					snap['avg_ms'], snap['p50_ms'], snap['p95_ms'],
+					snap['p99_ms'], snap['max_ms']))
+			else:
+				lines.append('%s: %s' % (name, metric.snapshot()))
+		return '\n'.join(lines)
+
+registry = MetricsRegistry()
+
+def timed(name, registry=registry):
+	"""Decorator that times every call of a function into `name`."""
+	def decorator(func):
+		def wrapper(*args, **kwargs):
+			if not registry.enabled:
+				return func(*args, **kwargs)
+			start = time.time()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				registry.observe(name, time.time() - start)
+		wrapper.__name__ = func.__name__
+		wrapper.__doc__ = func.__doc__
+		wrapper._metrics_wrapped = func
+		return wrapper
+	return decorator
+
+def instrument(cls, attr, name, registry=registry):
+	"""instrument(type cls, str attr, str name) -> None
+
+	Wrap the method `cls.attr` with `timed`. This lets us time classes we
+	don't own, like the xmpp ones. Wrapping the same method twice does
+	nothing.
+
+	"""
+	func = cls.__dict__[attr]
+	if hasattr(func, '_metrics_wrapped'):
+		return
+	setattr(cls, attr, timed(name, registry)(func))
+
+class MetricsExporter(object):
+	"""Write registry snapshots to a file, or stdout if no file is given.
+
+	Pass `export` to BotFramework.addTimer to dump on an interval.
+
+	"""
+
+	def __init__(self, filename=None, registry=registry):
+		self.filename = filename
+		self.registry = registry
+
+	def export(self):
+		if not self.registry.enabled:
+			return
+		report = '--- metrics %s (%ds) ---\n%s\n' % (
+			time.strftime('%Y-%m-%d %H:%M:%S'),
+			time.time() - self.registry.started,
+			self.registry.format())
+		if self.filename:
+			with open(self.filename, 'a') as f:
+				f.write(report)
+		else:
+			sys.stdout.write(report)
+			sys.stdout.flush()
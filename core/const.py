@@ -74,6 +74,8 @@ LOC_SEND_MSG_POST 	= 'send_msg_post'
 LOC_EV_MSG		= 'ev_msg'
 LOC_EV_MSG_PRE	= 'ev_msg_pre'
 LOC_EV_MSG_POST	= 'ev_msg_post'
+# ev_relay passes the sender and the text after it's been sent to the room.
+LOC_EV_RELAY	= 'ev_relay'
 
 # ev_iq passes the calling user and the iq stanza.
 LOC_EV_IQ		= 'ev_iq'
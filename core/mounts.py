@@ -27,6 +27,9 @@
 #  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import time
+
+from common import metrics, utils
 from framework.pluginregistry import Locations, PluginRegistry
 
 __all__ = ['thread_base', 'PluginInitializers' ,'CommandMount', 'HookMount']
@@ -93,6 +96,16 @@ class CommandMount:
 	=====  =====================================================================
 
 
+	Plugins implementing this mount may provide the following attributes:
+
+	=======  ===================================================================
+	argspec  A common.cmdargs.ArgSpec describing the command's arguments.
+			 Build __doc__ from argspec.format_help() and parse with
+			 self.parse_args(args).
+
+	=======  ===================================================================
+
+
 	Plugins implementing this mount should also provide the following functions:
 
 	=========  =================================================================
@@ -125,7 +138,28 @@ class CommandMount:
 		self._thread = thread_base(self.thread)()
 		self._thread.send(None)
 
+	def parse_args(self, args):
+		"""parse_args(str args) -> Namespace
+
+		Match `args` against the command's argspec.
+		Raises CommandHelp if they don't fit.
+
+		"""
+		return self.argspec.parse(args)
+
 	def process(self, user, msg):
+		if not metrics.registry.enabled:
+			return self._process(user, msg)
+
+		start = time.time()
+		try:
+			return self._process(user, msg)
+		finally:
+			elapsed = time.time() - start
+			metrics.registry.observe('command.%s' % self.name, elapsed)
+			metrics.registry.observe('plugin.%s' % utils.get_plugin_name(getattr(self, 'file', '')), elapsed)
+
+	def _process(self, user, msg):
 		try:
 			self._thread.send((user, msg))
 		except StopIteration:
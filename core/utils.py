@@ -90,9 +90,147 @@ def get_import(mod=get_module(), from_=[], import_=[]):
 	if from_:
 		return 'from %s%s import %s' % (mod, f, i)
 
+class LazyModule(object):
+	"""Stands in for a module until one of its attributes is used.
+
+	ex. argparse = LazyModule('common.argparse')
+
+	"""
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+
+	def __getattr__(self, attr):
+		if self._module is None:
+			self._module = __import__(self._name, {}, {}, ['__name__'])
+		return getattr(self._module, attr)
+
+class LazyObject(object):
+	"""Stands in for the object returned by `factory` until it's used.
+
+	Used for expensive class level objects so they're only built once a
+	command actually uses them.
+
+	"""
+	def __init__(self, factory):
+		self._factory = factory
+		self._object = None
+
+	def __getattr__(self, attr):
+		if self._object is None:
+			self._object = self._factory()
+		return getattr(self._object, attr)
+
+class LazyDoc(object):
+	"""A class __doc__ built by calling `factory` the first time it's read.
+
+	ex. __doc__ = LazyDoc(lambda: "Usage:\n%s" % parser.format_help())
+
+	"""
+	def __init__(self, factory):
+		self._factory = factory
+		self._doc = None
+
+	def __get__(self, instance, owner):
+		if self._doc is None:
+			self._doc = self._factory()
+		return self._doc
+
 #=============================
 #=         User Tools        =
 #=============================
+#======
+#= Config
+# Values derived from config.ini, rebuilt whenever it's read.
+_domain = None
+_banned = frozenset()
+_mods = frozenset()
+_admins = frozenset()
+
+def _config_changed(config):
+	global _domain, _banned, _mods, _admins
+	_domain = 'server' in config and config.server.get('domain') or None
+	users = config.get('users')
+	_banned = users and users.get('banned') or frozenset()
+	_mods = users and users.get('mod') or frozenset()
+	_admins = users and users.get('admin') or frozenset()
+	size = 2000
+	if 'system' in config:
+		size = int(config.system.get('namecache', size))
+	for memo in name_memos.itervalues():
+		memo.size = size
+		memo.clear()
+
+#======
+#= Name Memos
+class NameMemo(object):
+	"""Remember the results of a JID conversion.
+
+	Entries are kept in two generations. Lookups check the young one first
+	and move anything found in the old one back into it. When the young one
+	holds `size` / 2 entries the old one is dropped and the young one takes
+	its place, so at most `size` entries are kept and anything used since
+	the last turn over survives it, which is close to least recently used
+	without any bookkeeping on a hit. A `size` of 0 disables the memo.
+
+	"""
+
+	def __init__(self, size=2000):
+		self.size = size
+		self._young = {}
+		self._old = {}
+		self.stats = {
+			'hits' : 0,
+			'misses' : 0,
+		}
+
+	def __len__(self):
+		return len(self._young) + len(self._old)
+
+	def get(self, key):
+		"""Return the value remembered for `key`, or None."""
+		value = self._young.get(key)
+		if value is None:
+			value = self._old.pop(key, None)
+			if value is None:
+				self.stats['misses'] += 1
+				return None
+			self.put(key, value)
+		self.stats['hits'] += 1
+		return value
+
+	def put(self, key, value):
+		if not self.size:
+			return
+		if len(self._young) * 2 >= self.size:
+			self._old = self._young
+			self._young = {}
+		self._young[key] = value
+
+	def clear(self):
+		self._young = {}
+		self._old = {}
+
+	def hit_rate(self):
+		lookups = self.stats['hits'] + self.stats['misses']
+		return lookups and float(self.stats['hits']) / lookups
+
+_names = NameMemo()
+_nicknames = NameMemo()
+_jids = NameMemo()
+name_memos = {
+	'getname' : _names,
+	'getnickname' : _nicknames,
+	'getjid' : _jids,
+}
+
+def forget_names():
+	"""Forget every remembered name, call this when a nickname changes."""
+	_names.clear()
+	_nicknames.clear()
+
+iMan.subscribe('config', _config_changed)
+
 #======
 #= User Names
 def getname(jid):
@@ -104,14 +242,20 @@ def getname(jid):
 	# Make sure all JIDs are stardized to be JID objects.
 	# They're much easier to manipulate.
 	assert isinstance(jid, JID)
-	domain = iMan.config.server.domain
-	if jid.domain == domain:
-		return unicode(jid.node)
+	key = (jid.node, jid.domain, jid.resource)
+	name = _names.get(key)
+	if name is not None:
+		return name
 
-	if '%' in jid.node and jid.domain != domain:
-		return unicode(jid.node[:jid.node.find('%')])
-
-	return unicode(jid)
+	domain = _domain
+	if jid.domain == domain:
+		name = unicode(jid.node)
+	elif '%' in jid.node and jid.domain != domain:
+		name = unicode(jid.node[:jid.node.find('%')])
+	else:
+		name = unicode(jid)
+	_names.put(key, name)
+	return name
 
 def getnickname(jid):
 	"""getnickname(xmpp.protocol.JID jid) -> unicode
@@ -122,36 +266,50 @@ def getnickname(jid):
 	# Make sure all JIDs are stardized to be JID objects.
 	# They're much easier to manipulate.
 	assert isinstance(jid, JID)
+	key = (jid.node, jid.domain, jid.resource)
+	name = _nicknames.get(key)
+	if name is not None:
+		return name
 
 	if has_nick(jid):
-		return get_nick(jid)
-
-	# If there is no nickname, return the name of the user.
-	return getname(jid)
+		name = get_nick(jid)
+	else:
+		# If there is no nickname, return the name of the user.
+		name = getname(jid)
+	_nicknames.put(key, name)
+	return name
 
 def getjid(user, domain='', resource=''):
 	"""getjid(str user, str domain=iMan.config.server.domain
 		str resource=iMan.config.server.resource) -> xmpp.protocol.JID
 
-	Returns a JID for 'user'.
+	Returns a JID for 'user'. The JID may be shared with other callers,
+	don't change it.
 
 	"""
 	if isinstance(user, JID):
 			return user
 
 	if not domain:
-		domain = iMan.config.server.domain
+		domain = _domain
 
 	# We can't do anything with non-strings.
 	assert isinstance(user, basestring), 'getjid got passed a %s' % type(user)
 
+	key = (user, domain, resource)
+	jid = _jids.get(key)
+	if jid is not None:
+		return jid
+
 	if '@' in user:
 		user = user.split('@', 1)[0]
-	return JID(
+	jid = JID(
 		node=user,
 		domain=domain,
 		resource=resource
 	)
+	_jids.put(key, jid)
+	return jid
 
 def has_nick(jid):
 	"""Returns True if jid has a nickname"""
@@ -177,17 +335,17 @@ def set_attr(jid, attr, rank):
 def isbanned(user):
 	if False and iMan.loaded('roster'):
 		return 'banned' in iMan.config[getname(user).lower()].rank
-	return getname(user).lower() in iMan.config.users.banned
+	return getname(user).lower() in _banned
 
 def ismod(user):
 	if False and iMan.loaded('roster'):
 		return 'mod' in iMan.config[getname(user).lower()].rank
-	return getname(user).lower() in iMan.config.users.mod
+	return getname(user).lower() in _mods
 
 def isadmin(user):
 	if False and iMan.loaded('roster'):
 		return 'admin' in iMan.config[getname(user).lower()].rank
-	return getname(user).lower() in iMan.config.users.admin
+	return getname(user).lower() in _admins
 
 
 #=====
@@ -226,6 +384,18 @@ def split_target(target):
 	return [getjid(target), reason]
 
 
+def get_plugin_name(path):
+	"""get_plugin_name(str path) -> str
+
+	Return the name of the plugin stored at 'path'.
+	ex. './gbot/plugins/plugin_mail.py' -> 'mail'
+
+	"""
+	name = os.path.splitext(os.path.basename(path))[0]
+	if name.startswith('plugin_'):
+		name = name[len('plugin_'):]
+	return name
+
 def is_plugin(args):
 	return args in iMan.config.system.plugins
 
@@ -296,20 +466,32 @@ def convert_seq(seq, y = None):
 		#print j
 	return j
 
+# The word filter regex, compiled the first time it's used after core.ini is read.
+_cuss_re = None
+
+def _core_changed(core):
+	global _cuss_re
+	_cuss_re = None
+
+iMan.subscribe('core', _core_changed)
+
 def cuss_list():
 	"Returns a formated Regex"
-	iMan.core.read()
-	j = convert_seq(iMan.core.optional.get("wordfilter"), y = 1)
-	j = j.strip()
-	j = re.sub('\s','|',j)
-	#j = '(?i)(?!\\B)(' + j + ')+(\\b|\\B)'
-	#Alternate, more precice way, but consumes more CPU time.
-	j = '(?i)(?!\\B)(?:(?:[^aeiou](?=[^aeiou]))|(?:[aeiou](?=[aeiou])))?(' + j + ')+(?=\\b)'
-	return j
+	global _cuss_re
+	if _cuss_re is None:
+		j = convert_seq(iMan.snapshot('core').optional.get("wordfilter"), y = 1)
+		j = j.strip()
+		j = re.sub('\s','|',j)
+		#j = '(?i)(?!\\B)(' + j + ')+(\\b|\\B)'
+		#Alternate, more precice way, but consumes more CPU time.
+		j = '(?i)(?!\\B)(?:(?:[^aeiou](?=[^aeiou]))|(?:[aeiou](?=[aeiou])))?(' + j + ')+(?=\\b)'
+		_cuss_re = re.compile(j)
+	return _cuss_re.pattern
 
 def clean_string(string):
 	'Returns a filtered string.'
-	return re.sub(cuss_list(), iMan.core.optional.filtermask, string)
+	cuss_list()
+	return _cuss_re.sub(iMan.snapshot('core').optional.filtermask, string)
 
 #========================
 #=         Misc         =
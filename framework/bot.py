@@ -27,11 +27,14 @@
 #  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from __future__ import with_statement
+
 import logging
 import logging.config
 import logging.handlers
 import traceback
 import os
+import signal
 import sys
 import time
 
@@ -40,10 +43,15 @@ import time
 #sys.path.append(os.path.abspath(os.path.join('.', 'common')))
 import xmpp
 
-from common		import	const, utils
+from common		import	const, logqueue, metrics, utils
 from common.ini	import	iMan
 from common.weightless_timers import NamedThreadPool
 from framework import pretty_stanza
+from framework.outbound import LANE_NAMES, LANE_SYSTEM, LANE_WHISPER, OutboundQueue
+from framework.presence import PresenceQueue
+from framework.rosterbatch import RosterBatch
+from framework.profiler import LoopProfiler
+from framework.shards import Shard, ShardSet
 
 from xml.parsers.expat	import	ExpatError
 
@@ -60,6 +68,12 @@ sys.path.append(os.path.abspath(os.path.join('.', 'common')))
 # The "process" function is also available to be overridden.
 # It is called directly after the jabber client's process function.
 
+# Time the xmpp internals. While metrics are disabled the wrappers only check
+# a flag before calling through.
+metrics.instrument(xmpp.dispatcher.Dispatcher, 'dispatch', 'xmpp.dispatch')
+metrics.instrument(xmpp.transports.TCPsocket, 'send', 'xmpp.send')
+metrics.instrument(xmpp.transports.TCPsocket, 'receive', 'xmpp.receive')
+
 def initalize_ini():
 	pass#iMan.load(utils.get_module(), 'config')
 
@@ -70,33 +84,55 @@ def initalize_loggers():
 	base_log = logging.getLogger('')
 	base_log.removeHandler(base_log.handlers[0])
 
-	global root_log, net_log, chat_log
+	global root_log, net_log, chat_log, log_writer
 	root_log = logging.getLogger('pygab')
 	root_log.setLevel(logging.INFO)
 
-	handler = logging.StreamHandler(sys.stdout)
-	handler.setFormatter(logging.Formatter(
+	console = logging.StreamHandler(sys.stdout)
+	console.setFormatter(logging.Formatter(
 		'%(levelname)s:%(name)s:%(asctime)s:%(message)s', iMan.config.system.timeformat))
-	root_log.addHandler(handler)
+
+	# Everything is written by a background thread so slow disks and log
+	# rotation don't hold up the main loop. 0 writes synchronously.
+	queue_size = int(iMan.config.system.get('logqueue', 10000))
+	# Nothing but the LogWriter flushes a BatchedFileHandler.
+	if queue_size <= 0:
+		file_handler = logging.handlers.TimedRotatingFileHandler
+	else:
+		file_handler = logqueue.BatchedFileHandler
 
 	#--- Connection Logger -----------------------------------------------------
 	net_log = logging.getLogger('pygab.net')
-	handler = logging.handlers.TimedRotatingFileHandler(
+	connection = file_handler(
 		os.path.join(module_path, iMan.config.system.logpath, 'connection.log'),
 		'midnight', 1, 0,'utf-8')
-	handler.setFormatter(logging.Formatter(
+	connection.setFormatter(logging.Formatter(
 		'%(levelname)s %(asctime)s %(message)s', iMan.config.system.timeformat))
-	net_log.addHandler(handler)
 
 	#--- Chat Logger -----------------------------------------------------------
 	chat_log = logging.getLogger('pygab.chat')
-	handler = logging.handlers.TimedRotatingFileHandler(
+	history = file_handler(
 		os.path.join(module_path, iMan.config.system.logpath, 'history.log'),
 		'midnight', 1, 0,'utf-8')
-	handler.setFormatter(logging.Formatter(
+	history.setFormatter(logging.Formatter(
 		'%(asctime)s %(message)s', iMan.config.system.timeformat))
 
-	chat_log.addHandler(handler)
+	if queue_size <= 0:
+		log_writer = None
+		root_log.addHandler(console)
+		net_log.addHandler(connection)
+		chat_log.addHandler(history)
+		return
+
+	# The queue handlers are made last, so logging.shutdown drains them before
+	# closing the files.
+	log_writer = logqueue.LogWriter(queue_size,
+		iMan.config.system.get('logoverflow', logqueue.OVERFLOW_DROP_NEW),
+		int(iMan.config.system.get('logbatch', 100)))
+	root_log.addHandler(log_writer.handler(console))
+	net_log.addHandler(log_writer.handler(connection))
+	chat_log.addHandler(log_writer.handler(history))
+	log_writer.start()
 
 def _promote_jid(jid):
 	"""_promote_jid(str jid) -> xmpp.protocol.JID
@@ -127,6 +163,51 @@ class BotFramework(object):
 		self.jid = xmpp.protocol.JID("%s@%s" % (username,domain))
 		self.password = password
 		self.timers = NamedThreadPool()
+		# Availability presences are held here briefly so a flood of them
+		# (eg. after connecting) collapses to one per JID.
+		self.presences = PresenceQueue(
+			float(iMan.config.system.get('presencewindow', 2.0)),
+			int(iMan.config.system.get('presencebatch', 50))
+		)
+		self.init_metrics()
+		# Disco results are shared by every connection, see xmpp.features.
+		xmpp.features.cache.size = int(iMan.config.system.get('discocache', 500))
+		xmpp.features.cache.ttl = int(iMan.config.system.get('discottl', 3600))
+		# Extra connections the roster is split across, see connect_shards.
+		self.shards = ShardSet()
+		# Outgoing stanzas waiting for their connection's rate limit.
+		# Shard (None for the bot's own connection) -> OutboundQueue
+		self.outbound = {}
+		# Roster changes held until the end of a rosterBatch() block.
+		self.roster_batch = RosterBatch(self)
+
+		self.profiler = LoopProfiler(os.path.join(
+			'.', utils.get_module(), iMan.config.system.logpath))
+		# `kill -USR1 <pid>` profiles the bot without going through chat.
+		# Signal handlers can only be set from the main thread.
+		if hasattr(signal, 'SIGUSR1'):
+			try:
+				signal.signal(signal.SIGUSR1, self._profile_signal)
+			except ValueError:
+				pass
+
+	def init_metrics(self):
+		"""init_metrics() -> None
+
+		Enable metrics if the config asks for them and start the exporter.
+
+		"""
+		metrics.registry.enabled = bool(iMan.config.system.get('metrics', False))
+		interval = int(iMan.config.system.get('metricsinterval', 0))
+		if not interval:
+			return
+
+		filename = iMan.config.system.get('metricsfile', '')
+		if filename:
+			filename = os.path.join('.', utils.get_module(),
+									iMan.config.system.logpath, filename)
+		self.metrics_exporter = metrics.MetricsExporter(filename or None)
+		self.addTimer(interval, self.metrics_exporter.export, type='seconds')
 
 # Things to do
 	def connect(self, server=(), proxy={}, use_srv=False, secure=None, resource=''):
@@ -156,9 +237,7 @@ class BotFramework(object):
 			net_log.warning("Unable to estabilish secure connection - TLS failed!")
 
 		#self.client.disconnect_handlers = []
-		self.client.RegisterHandler('message',self._msgcb)
-		self.client.RegisterHandler('iq',self._iqcb)
-		self.client.RegisterHandler('presence',self._presencecb)
+		self.registerHandlers()
 
 		authres = self.client.auth(self.jid.getNode(), self.password, resource)
 		if not authres:
@@ -166,7 +245,86 @@ class BotFramework(object):
 		if authres != 'sasl':
 			net_log.warning("Unable to perform SASL auth on %s:%s. Old authentication method used!" % server)
 
-		self.client.sendInitPresence()
+		self.plugRoster(self.client, resource)
+		self.client.sendInitPresence(requestRoster=0)
+		self.connect_shards(server, proxy, use_srv, secure)
+
+	def plugRoster(self, client, resource=''):
+		"""plugRoster(xmpp.Client client, str resource='') -> None
+
+		Plug the roster into `client` and request it. Unless `rostercache` is
+		off the roster is cached on disk, so if the server supports roster
+		versioning a reconnect only fetches what changed.
+
+		"""
+		cache = None
+		if iMan.config.system.get('rostercache', True):
+			cache = xmpp.roster.RosterCache(os.path.join('.', utils.get_module(),
+				'%s@%s.%s.roster' % (client.User, client.Server, resource or 'default')))
+		xmpp.roster.Roster(cache).PlugIn(client)
+
+	def connect_shards(self, server=(), proxy={}, use_srv=False, secure=None):
+		"""connect_shards(tuple server, dict proxy, bool use_srv, secure) -> None
+
+		Connect the extra connections listed in the [shards] config section,
+		each entry is `resource = "username:password"`, or `resource = ""` to
+		use another resource of the bot's account. Users are split between
+		them and the bot's own connection.
+		Shards that are already connected are left alone.
+
+		"""
+		if not self.shards:
+			for resource, account in sorted(iMan.config.shards.items()):
+				username, password = self.jid.getNode(), self.password
+				if account:
+					username, password = account.split(':', 1)
+				self.shards.add(Shard(resource,
+					xmpp.protocol.JID(node=username, domain=self.jid.getDomain()),
+					password, resource))
+			if not self.shards:
+				return
+			# Try to bring back lost shards every so often.
+			self.addTimer(60, self.reconnect_shards, type='seconds',
+						  args=[server, proxy, use_srv, secure])
+
+		for shard in self.shards:
+			if shard.connected:
+				continue
+			try:
+				shard.connect(self, server, proxy, use_srv, secure)
+				net_log.info('Shard %s connected' % shard)
+			except (const.ConnectError, const.AuthError):
+				net_log.warning('Unable to connect shard %s' % shard)
+		self.shards.rebuild()
+
+	def reconnect_shards(self, *args):
+		"Internal: Reconnect shards that lost their connection"
+		if [shard for shard in self.shards if not shard.connected]:
+			self.connect_shards(*args)
+
+	def registerHandlers(self, client=None, shared=False):
+		"""registerHandlers(xmpp.Client client=None, bool shared=False) -> None
+
+		Route the client's stanzas to the bot's callbacks.
+		`client` defaults to the bot's own connection.
+		A `shared` client is another resource of the bot's own account. The
+		server sends it copies of the presences and messages the bot's own
+		connection already gets, so only stanzas addressed to that resource
+		are routed.
+
+		"""
+		client = client or self.client
+		if shared:
+			client.RegisterHandler('message',self._shardmsgcb)
+			client.RegisterHandler('iq',self._iqcb)
+			return
+
+		client.RegisterHandler('message',self._msgcb)
+		client.RegisterHandler('iq',self._iqcb)
+		client.RegisterHandler('presence',self._presencecb)
+		# Learn entity capabilities so disco#info is shared between clients.
+		client.RegisterHandler('presence', xmpp.features.cache.PresenceHandler,
+							   system=1)
 
 	def run(self):
 		"""run() -> None
@@ -199,13 +357,7 @@ class BotFramework(object):
 					last_ping = time.time()
 					self.setOnline(iMan.config.system.status)
 
-				#Run through the timer list and run any events
-				#that haven't been run in their defined interval.
-				self.processTimers()
-
-				#print self.client.Process(1)
-				self.client.Process(0.25)
-				self.process()
+				self.step()
 			except KeyboardInterrupt, e:
 				self.stop()
 				logging.shutdown()
@@ -234,6 +386,32 @@ class BotFramework(object):
 				traceback.print_exc()
 				continue
 
+	def step(self, timeout=0.25):
+		"""step(float timeout=0.25) -> None
+
+		Run a single frame of the main loop, waiting at most `timeout`
+		seconds for data from the server.
+
+		"""
+		#Run through the timer list and run any events
+		#that haven't been run in their defined interval.
+		with metrics.registry.time('bot.timers'):
+			self.processTimers()
+
+		#print self.client.Process(1)
+		with metrics.registry.time('bot.client_process'):
+			self.shards.process(self.client, timeout)
+		with metrics.registry.time('bot.presences'):
+			self.processPresences()
+		with metrics.registry.time('bot.outbound'):
+			self.processOutbound()
+		self.process()
+		self.profiler.check()
+
+		if metrics.registry.enabled:
+			metrics.registry.inc('bot.loops')
+			metrics.registry.set('bot.presence_backlog', len(self.presences))
+
 	def clearState(self):
 		"""
 
@@ -259,6 +437,61 @@ class BotFramework(object):
 			except (GeneratorExit, StopIteration):
 				self.timers.remove_by_obj(event)
 
+	def processPresences(self):
+		"""processPresences() -> None
+
+		Dispatch the next batch of queued presences.
+
+		"""
+		for pres in self.presences.pop_batch():
+			try:
+				self._dispatch_presence(pres)
+			except:
+				# Don't let one bad hook drop the rest of the batch.
+				traceback.print_exc()
+
+	def processOutbound(self):
+		"""processOutbound() -> None
+
+		Send the queued stanzas each connection's rate limit allows.
+
+		"""
+		for shard, queue in self.outbound.items():
+			if len(queue):
+				self._flush_outbound(shard, queue)
+
+		if metrics.registry.enabled and self.outbound:
+			stats = self.outboundStats()
+			for name in LANE_NAMES:
+				metrics.registry.set('outbound.depth.%s' % name,
+									 stats['depth'][name])
+
+	def outboundStats(self):
+		"""outboundStats() -> dict
+
+		Return the sent, queued and dropped counts of every connection added
+		together.
+
+		"""
+		stats = {
+			'sent' : 0,
+			'depth' : dict.fromkeys(LANE_NAMES, 0),
+			'dropped' : dict.fromkeys(LANE_NAMES, 0),
+			'depth_peak' : 0,
+		}
+		for queue in self.outbound.itervalues():
+			stats['sent'] += queue.stats['sent']
+			stats['depth_peak'] = max(stats['depth_peak'], queue.stats['depth_peak'])
+			for name in LANE_NAMES:
+				stats['depth'][name] += queue.stats['depth'][name]
+				stats['dropped'][name] += queue.stats['dropped'][name]
+		return stats
+
+	def _profile_signal(self, signum, frame):
+		"Internal: Profile the main loop when signaled"
+		if self.profiler.start(int(iMan.config.system.get('profiletime', 30))):
+			root_log.info("Profiling started by signal %d" % signum)
+
 	def process(self):
 		"""process() -> None
 
@@ -282,6 +515,7 @@ class BotFramework(object):
 		Disconnect and stop the bot
 
 		"""
+		self.shards.disconnect()
 		self.client.disconnect()
 		self.stop()
 
@@ -345,9 +579,57 @@ class BotFramework(object):
 		"""A simple convenience method for building Message stanzas."""
 		return pretty_stanza.PrettyMessage(to=jid, body=text)
 
-	def _send_msg(self, message):
+	def _send_msg(self, message, lane=LANE_WHISPER):
 		"""Send a message stanza through the tubes"""
-		self.client.send(message)
+		self.send_stanza(message, lane)
+
+	def send_stanza(self, stanza, lane=LANE_SYSTEM):
+		"""send_stanza(xmpp.protocol.Protocol stanza, int lane=LANE_SYSTEM) -> None
+
+		Send `stanza` through the connection serving its recipient.
+		Stanzas without a recipient, like the bot's own presence, are sent
+		through every connection.
+		If `sendrate` is set the stanza waits in `lane` for the connection's
+		rate limit, see framework.outbound.
+
+		"""
+		to = stanza.getTo()
+		if to is None and self.shards:
+			for shard in self.shards:
+				if shard.connected:
+					self._queue_stanza(shard, stanza.__class__(node=stanza), lane)
+			self._queue_stanza(None, stanza, lane)
+			return
+
+		self._queue_stanza(self.shards.shard_for(to), stanza, lane)
+
+	def _queue_stanza(self, shard, stanza, lane):
+		"Internal: Send a stanza through `shard`, or queue it if rate limited"
+		rate = float(iMan.config.system.get('sendrate', 0))
+		if not rate:
+			self._write_stanza(shard, stanza)
+			return
+
+		queue = self.outbound.get(shard)
+		if queue is None:
+			queue = self.outbound[shard] = OutboundQueue(rate,
+				int(iMan.config.system.get('sendburst', 20)),
+				int(iMan.config.system.get('sendqueue', 5000)))
+		to = stanza.getTo()
+		if not queue.push(stanza, to and to.getStripped() or u'', lane):
+			metrics.registry.inc('outbound.dropped.%s' % LANE_NAMES[lane])
+		# Don't make the stanza wait a frame if there's room for it now.
+		self._flush_outbound(shard, queue)
+
+	def _flush_outbound(self, shard, queue):
+		for stanza in queue.pop_ready():
+			self._write_stanza(shard, stanza)
+
+	def _write_stanza(self, shard, stanza):
+		if shard is None:
+			self.client.send(stanza)
+		else:
+			shard.send(stanza)
 
 	# Messages to send
 	def msg(self, jid, text):
@@ -356,19 +638,34 @@ class BotFramework(object):
 		Build and send a message to a given jid
 
 		"""
-		self._send_msg(self._build_msg(jid, text))
+		self._send_msg(self._build_msg(jid, text), LANE_WHISPER)
 
 	# Roster management commands
+	def rosterBatch(self):
+		"""rosterBatch() -> RosterBatch
+
+		Return a context manager holding roster changes until the end of the
+		`with` block and sending them together.
+
+			with bot.rosterBatch():
+				for jid in invites:
+					bot.addUser(jid)
+
+		"""
+		return self.roster_batch
+
+	def _subscription(self, jid, typ):
+		"Internal: Send a subscription presence, or hold it for the batch"
+		if not self.roster_batch.subscription(jid, typ):
+			self.send_stanza(xmpp.protocol.Presence(to=jid, typ=typ))
+
 	def addUser(self, jid):
 		"""addUser(JID jid) -> None
 
 		Asks a user to join your roster
 
 		"""
-
-		self.client.send(xmpp.protocol.Presence(
-					to=jid, typ='subscribe'))
-		self.refreshRoster()
+		self._subscription(jid, 'subscribe')
 
 	def removeUser(self, jid):
 		"""removeUser(JID jid) -> None
@@ -376,21 +673,15 @@ class BotFramework(object):
 		Removes a user from your roster
 
 		"""
-		self.client.send(xmpp.protocol.Presence(
-					to=jid, typ='unsubscribe'))
-		self.refreshRoster()
+		self._subscription(jid, 'unsubscribe')
 
 	def acceptUser(self,jid):
 		"Allow a user to add you to their roster"
-		self.client.send(xmpp.protocol.Presence(
-					to=jid, typ='subscribed'))
-		self.refreshRoster()
+		self._subscription(jid, 'subscribed')
 
 	def rejectUser(self,jid):
 		"Remove yourself from a remote users roster/disallow adding"
-		self.client.send(xmpp.protocol.Presence(
-					to=jid, typ='unsubscribed'))
-		self.refreshRoster()
+		self._subscription(jid, 'unsubscribed')
 
 	def DisconnectHandler(self):
 		pass
@@ -418,8 +709,10 @@ class BotFramework(object):
 		Returns a dict of all this users resources to a tuple of their status
 		(subscribe/away/online/xa/dnd/chat) and message
 		"""
-		roster=self.client.getRoster()
 		jid=_promote_jid(jid)
+		# Users are only subscribed to the bot's own account, shards are just
+		# used to send to them.
+		roster=self.client.getRoster()
 		if jid.getResource() == '':
 			resources = roster.getResources(unicode(jid))
 		else:
@@ -433,39 +726,55 @@ class BotFramework(object):
 			res[fjid] = self._getSingleJidStatus(roster,fjid)
 		return res
 
+	def getClient(self, jid):
+		"Return the xmpp.Client serving `jid`"
+		shard = self.shards.shard_for(_promote_jid(jid))
+		if shard is None:
+			return self.client
+		return shard.client
+
 	def getRoster(self):
 		"Return all the users in the roster"
-		roster = self.client.getRoster()
-		return roster.getItems()
+		return self.client.getRoster().getItems()
 
 	def refreshRoster(self):
-		"Request a new roster from the server."
+		"""Request a new roster from the server.
+
+		With roster versioning only the changes are sent. Changes made through
+		addUser and friends don't need this, the server pushes them.
+		Inside a rosterBatch() block the roster is refreshed once at the end.
+
+		"""
+		if self.roster_batch.refresh():
+			return
+		# Only the bot's own roster is used, and a shard's connection belongs
+		# to its sender thread, so shard rosters are left alone.
 		roster = self.client.getRoster()
 		roster.Request(True)
 
 # Change bots status
 	def setOnline(self, msg=None, to=None):
 		"Set the bot 'Online'"
-		self.client.send(xmpp.protocol.Presence(to=to,status=msg))
+		self.send_stanza(xmpp.protocol.Presence(to=to,status=msg))
 
 	def setUnavailable(self, msg=None, to=None):
 		"Set the bot 'Offline'"
-		self.client.send(xmpp.protocol.Presence(
+		self.send_stanza(xmpp.protocol.Presence(
 					to=to,status=msg,show='unavailable'))
 
 	def setAway(self, msg=None, to=None):
 		"Set the bot 'Away'"
-		self.client.send(xmpp.protocol.Presence(
+		self.send_stanza(xmpp.protocol.Presence(
 					to=to,status=msg,show='away'))
 
 	def setDND(self, msg=None, to=None):
 		"Set the bot 'Do Not Disturb'"
-		self.client.send(xmpp.protocol.Presence(
+		self.send_stanza(xmpp.protocol.Presence(
 					to=to,status=msg,show='dnd'))
 
 	def setXA(self, msg=None, to=None):
 		"Set the bot 'eXtended Away'"
-		self.client.send(xmpp.protocol.Presence(
+		self.send_stanza(xmpp.protocol.Presence(
 					to=to,status=msg,show='xa'))
 
 # Message related events
@@ -544,7 +853,32 @@ class BotFramework(object):
 		if text is not None:
 			self.ev_msg(mess)
 
+	def _shardmsgcb(self, conn, mess):
+		"Internal: Recieve a message on a shard of the bot's own account"
+		# Messages to the bare JID are also delivered to the bot's connection.
+		to = mess.getTo()
+		if to is not None and to.getResource():
+			self._msgcb(conn, mess)
+
 	def _presencecb(self, conn, pres):
+		"Internal: Recieve a presence from the server"
+		pres.__class__ = pretty_stanza.PrettyPresence
+
+		if pres.getType() == "error":
+			print pres
+
+		# Subscription changes must all be seen, only availability is queued.
+		if pres.getType() in (None, "unavailable") and self.presences.window > 0:
+			self.presences.push(pres)
+			return
+
+		# Anything still held from the same user happened first.
+		for held in self.presences.take(pres.getFrom()):
+			self._dispatch_presence(held)
+		self._dispatch_presence(pres)
+
+	def _dispatch_presence(self, pres):
+		"Internal: Route a presence to the matching ev_ handler"
 		presTypes1={
 			"subscribe"		: self.ev_subscribe,
 			"subscribed"	: self.ev_subscribed,
@@ -560,14 +894,9 @@ class BotFramework(object):
 			"dnd"	: self.ev_dnd,
 			"xa"	: self.ev_xa,
 		}
-		pres.__class__ = pretty_stanza.PrettyPresence
-
 		user = pres.getFrom()
 		self.last_stanza = pres
 
-		if pres.getType() == "error":
-			print pres
-
 		pres_type = pres.getType()
 		pres_show = pres.getShow()
 		msg = pres.getStatus() or ""
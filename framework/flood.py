@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+# What FloodControl.check decides about a message.
+FLOOD_OK = 0
+# Over the limit or muted, the message isn't relayed.
+FLOOD_THROTTLED = 1
+# Far enough over the limit the user has just been muted for a while.
+FLOOD_MUTED = 2
+
+class FloodControl(object):
+	"""Count each user's messages over a sliding window.
+
+	Instead of remembering every message only two counters are kept per user,
+	the current window's and the previous one's. The rate is estimated by
+	weighting the previous window by how much of it still overlaps the
+	sliding window, which is close enough to stop a flood and keeps every
+	user down to one small list.
+
+	Users who go quiet for `idle` seconds are forgotten, and no more than
+	`max_users` are tracked at once, the longest idle going first.
+
+	"""
+
+	def __init__(self, window=10.0, max_users=1000, idle=300.0):
+		self.window = float(window)
+		self.max_users = max_users
+		self.idle = idle
+		# user -> [window start, previous count, current count,
+		#          muted until, last seen]
+		self._users = {}
+		self._last_sweep = time.time()
+		self.stats = {
+			'throttled' : 0,
+			'muted' : 0,
+			'evicted' : 0,
+		}
+
+	def __len__(self):
+		return len(self._users)
+
+	def rate(self, entry, now):
+		"""Return the estimated messages in the window ending at `now`."""
+		self._advance(entry, now)
+		overlap = 1 - (now - entry[0]) / self.window
+		return entry[1] * overlap + entry[2]
+
+	def _advance(self, entry, now):
+		elapsed = now - entry[0]
+		if elapsed < self.window:
+			return
+		if elapsed < self.window * 2:
+			entry[1] = entry[2]
+			entry[0] += self.window
+		else:
+			entry[1] = 0
+			entry[0] = now
+		entry[2] = 0
+
+	def check(self, user, limit, mute_limit, mute_time, now=None):
+		"""check(unicode user, int limit, int mute_limit, float mute_time,
+			float now=time.time()) -> int
+
+		Count a message from `user` and return FLOOD_OK if it's within
+		`limit` messages per window. Past `limit` return FLOOD_THROTTLED,
+		and past `mute_limit` mute them for `mute_time` seconds and return
+		FLOOD_MUTED. While muted every message returns FLOOD_THROTTLED.
+
+		"""
+		if now is None:
+			now = time.time()
+		if now - self._last_sweep > self.idle:
+			self.sweep(now)
+
+		entry = self._users.get(user)
+		if entry is None:
+			if len(self._users) >= self.max_users:
+				self._evict(len(self._users) - self.max_users + 1, now)
+			entry = self._users[user] = [now, 0, 0, 0, now]
+		entry[4] = now
+
+		if entry[3] > now:
+			self.stats['throttled'] += 1
+			return FLOOD_THROTTLED
+
+		count = self.rate(entry, now) + 1
+		entry[2] += 1
+		if mute_limit and count > mute_limit:
+			entry[3] = now + mute_time
+			self.stats['muted'] += 1
+			return FLOOD_MUTED
+		if limit and count > limit:
+			self.stats['throttled'] += 1
+			return FLOOD_THROTTLED
+		return FLOOD_OK
+
+	def sweep(self, now=None):
+		"""Forget users who've been idle and aren't muted."""
+		if now is None:
+			now = time.time()
+		self._last_sweep = now
+		idle = [user for user, entry in self._users.iteritems()
+				if now - entry[4] > self.idle and entry[3] <= now]
+		for user in idle:
+			del self._users[user]
+		self.stats['evicted'] += len(idle)
+
+	def _evict(self, count, now):
+		# Drop a tenth at a time so a stream of new users doesn't mean a
+		# sort for every message. Muted users are kept, like in sweep, or
+		# going quiet would be a way out of a mute.
+		count = max(count, self.max_users // 10, 1)
+		oldest = sorted([user for user, entry in self._users.iteritems()
+						 if entry[3] <= now],
+						key=lambda user: self._users[user][4])[:count]
+		for user in oldest:
+			del self._users[user]
+		self.stats['evicted'] += len(oldest)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+import ast
+
+from common import const, mounts
+
+# Attributes each kind of mount needs before it can be staged.
+MOUNT_ATTRS = {
+	'CommandMount' : ('name', 'rank'),
+	'HookMount' : ('name', 'loc', 'priority'),
+}
+
+class Unresolved(Exception):
+	"""Raised when an attribute can't be worked out without running the plugin."""
+
+def _value(node):
+	"""Return the value of a class attribute's expression.
+
+	Only literals and `const.X` (alone or in a list) are understood.
+
+	"""
+	if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) \
+			and node.value.id == 'const':
+		try:
+			return getattr(const, node.attr)
+		except AttributeError:
+			raise Unresolved(node.attr)
+	if isinstance(node, (ast.List, ast.Tuple)):
+		return [_value(item) for item in node.elts]
+	try:
+		return ast.literal_eval(node)
+	except ValueError:
+		raise Unresolved(ast.dump(node))
+
+def _base_name(node):
+	if isinstance(node, ast.Attribute):
+		return node.attr
+	if isinstance(node, ast.Name):
+		return node.id
+
+def _class_attrs(classdef):
+	"""Return {attr: expression} for the simple assignments in a class."""
+	attrs = {}
+	for stmt in classdef.body:
+		if isinstance(stmt, ast.Assign):
+			for target in stmt.targets:
+				if isinstance(target, ast.Name):
+					attrs[target.id] = stmt.value
+	if ast.get_docstring(classdef) is not None:
+		attrs.setdefault('__doc__', ast.Str(ast.get_docstring(classdef)))
+	return attrs
+
+def scan_plugin(path):
+	"""scan_plugin(str path) -> list
+
+	Return a list of (mount name, attrs) for every command and hook defined in
+	the plugin at `path`, without executing it.
+	Return None if the plugin has to be loaded the normal way because one of
+	them can't be worked out statically.
+	A plugin's initializer isn't run until the plugin is activated.
+
+	"""
+	with open(path, 'r') as f:
+		try:
+			tree = ast.parse(f.read(), path)
+		except SyntaxError:
+			return None
+
+	classes = dict([(node.name, node) for node in tree.body
+					if isinstance(node, ast.ClassDef)])
+	found = []
+	for classdef in ast.walk(tree):
+		if not isinstance(classdef, ast.ClassDef):
+			continue
+		bases = [_base_name(base) for base in classdef.bases]
+		mount = [base for base in bases if base in MOUNT_ATTRS]
+		if not mount:
+			continue
+		if classes.get(classdef.name) is not classdef:
+			# Mounts defined conditionally or inside functions can only be
+			# found by running the plugin.
+			return None
+		mount = mount[0]
+
+		# Attributes may come from mixins defined in the same plugin,
+		# like LoadParser in plugin_admin.
+		attrs = {}
+		for base in reversed(bases):
+			if base in classes:
+				attrs.update(_class_attrs(classes[base]))
+		attrs.update(_class_attrs(classdef))
+
+		wanted = MOUNT_ATTRS[mount]
+		if [attr for attr in wanted if attr not in attrs]:
+			return None
+		if '__doc__' in attrs:
+			wanted += ('__doc__',)
+		try:
+			values = dict([(attr, _value(attrs[attr])) for attr in wanted])
+		except Unresolved:
+			return None
+		values.setdefault('__doc__', None)
+		found.append((mount, values))
+	return found
+
+def stage(bot, plugin_name, path, found):
+	"""stage(PluginFramework bot, str plugin_name, str path, list found) -> list
+
+	Register a stand-in for each command and hook in `found`. The first time
+	one of them runs it has `bot` activate the plugin and passes the call on
+	to the real command or hook. Return the stand-in classes.
+
+	"""
+	stubs = []
+	for mount, values in found:
+		attrs = dict(values)
+		attrs['file'] = path
+		attrs['lazy_plugin'] = plugin_name
+		attrs['__init__'] = _stub_init
+		if mount == 'CommandMount':
+			attrs['thread'] = _command_thread
+			base = mounts.CommandMount
+		else:
+			attrs['thread'] = _hook_thread
+			base = mounts.HookMount
+		stubs.append(type('Lazy%s' % mount, (base,), attrs))
+	return stubs
+
+def unstage(stubs):
+	"""Remove stand-ins registered by `stage`."""
+	for stub in stubs:
+		for base in (mounts.CommandMount, mounts.HookMount):
+			if not issubclass(stub, base):
+				continue
+			current = base.plugins.get(stub.name)
+			if current is stub or isinstance(current, stub):
+				base.remove(stub)
+
+def _stub_init(self, parent):
+	# Unlike a real mount a stand-in never puts itself in the registry. A
+	# loop over an older copy of the registry may still create it after its
+	# plugin has been activated, and it mustn't replace the real mount then.
+	self.parent = parent
+	self.init_thread()
+
+def _command_thread(self, *args):
+	self.parent.activate_plugin(self.lazy_plugin)
+	command = mounts.CommandMount.plugins.get(self.name)
+	if command is None or getattr(command, 'lazy_plugin', None):
+		return
+	if isinstance(command, type):
+		command = command(self.parent)
+	command.process(*args)
+
+def _hook_thread(self, *args):
+	self.parent.activate_plugin(self.lazy_plugin)
+	hook = mounts.HookMount.plugins.get(self.name)
+	if hook is None or getattr(hook, 'lazy_plugin', None):
+		return
+	if isinstance(hook, type):
+		hook = hook(self.parent)
+	return hook.process(*args)
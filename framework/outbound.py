@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+from collections import deque
+
+# Outgoing stanzas are sent in this order. Replies from the bot itself
+# (errors, system messages, presence) first, then whispers to a single user,
+# and room broadcasts last since there are the most of them.
+LANE_SYSTEM = 0
+LANE_WHISPER = 1
+LANE_BROADCAST = 2
+LANE_NAMES = ('system', 'whisper', 'broadcast')
+
+class TokenBucket(object):
+	"""Allow `rate` events a second with bursts of up to `burst`."""
+
+	def __init__(self, rate, burst):
+		self.rate = float(rate)
+		self.burst = float(max(burst, 1))
+		self.tokens = self.burst
+		self.last = time.time()
+
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+		self.last = now
+
+	def take(self, now):
+		"""take(float now) -> bool
+
+		Use up a token if one is available.
+
+		"""
+		self.refill(now)
+		if self.tokens < 1:
+			return False
+		self.tokens -= 1
+		return True
+
+class Lane(object):
+	"""Stanzas of one priority, queued per recipient.
+
+	Recipients take turns, so one user getting a long reply can't starve
+	everyone else in the lane.
+
+	"""
+
+	def __init__(self):
+		# recipient -> deque of stanzas
+		self.queues = {}
+		# (recipient, queue) in the order they get a turn. A queue emptied by
+		# drop is left here and skipped, its recipient gets a new queue.
+		self.turns = deque()
+		self.stale = 0
+		# queue length -> recipients with that many stanzas queued, so drop
+		# finds one of the longest queues without looking at them all.
+		self.lengths = {}
+		self.longest = 0
+		self.depth = 0
+
+	def push(self, recipient, stanza):
+		queue = self.queues.get(recipient)
+		if queue is None:
+			queue = self.queues[recipient] = deque()
+			self.turns.append((recipient, queue))
+		queue.append(stanza)
+		self._resized(recipient, len(queue) - 1, len(queue))
+		self.depth += 1
+
+	def pop(self):
+		recipient, queue = self.turns.popleft()
+		while not queue:
+			self.stale -= 1
+			recipient, queue = self.turns.popleft()
+		stanza = queue.popleft()
+		if queue:
+			self.turns.append((recipient, queue))
+		else:
+			del self.queues[recipient]
+		self._resized(recipient, len(queue) + 1, len(queue))
+		self.depth -= 1
+		return stanza
+
+	def drop(self):
+		"""Drop the oldest stanza of a recipient with the most queued."""
+		recipient = iter(self.lengths[self.longest]).next()
+		queue = self.queues[recipient]
+		queue.popleft()
+		if not queue:
+			del self.queues[recipient]
+			self.stale += 1
+			if self.stale > len(self.queues) + 16:
+				# Mostly dead turns, sweep them out so they can't pile up
+				# while nothing is being sent.
+				self.turns = deque([turn for turn in self.turns if turn[1]])
+				self.stale = 0
+		self._resized(recipient, len(queue) + 1, len(queue))
+		self.depth -= 1
+
+	def _resized(self, recipient, old, new):
+		# Lengths only ever change by one, so when the longest bucket empties
+		# the recipient that left it is one of the new longest.
+		if old:
+			bucket = self.lengths[old]
+			bucket.discard(recipient)
+			if not bucket:
+				del self.lengths[old]
+		if new:
+			self.lengths.setdefault(new, set()).add(recipient)
+		if new > self.longest:
+			self.longest = new
+		elif old == self.longest and old not in self.lengths:
+			self.longest = new
+
+class OutboundQueue(object):
+	"""Rate limit a connection's outgoing stanzas.
+
+	Stanzas are let out at `rate` a second with bursts of `burst`, taking the
+	highest priority lane first and recipients in turn within a lane. At most
+	`max_queued` stanzas wait, when there's no room the oldest stanza of the
+	lowest priority lane is dropped, or the new one if nothing queued is less
+	important.
+
+	"""
+
+	def __init__(self, rate=10, burst=20, max_queued=5000):
+		self.bucket = TokenBucket(rate, burst)
+		self.max_queued = max_queued
+		self.lanes = [Lane() for name in LANE_NAMES]
+		self.stats = {
+			'sent' : 0,
+			'depth' : dict.fromkeys(LANE_NAMES, 0),
+			'dropped' : dict.fromkeys(LANE_NAMES, 0),
+			'depth_peak' : 0,
+		}
+
+	def __len__(self):
+		return sum([lane.depth for lane in self.lanes])
+
+	def push(self, stanza, recipient, lane=LANE_SYSTEM):
+		"""push(Protocol stanza, unicode recipient, int lane=LANE_SYSTEM) -> bool
+
+		Queue a stanza, return False if it was dropped.
+
+		"""
+		depth = len(self)
+		if depth >= self.max_queued:
+			lowest = [i for i in xrange(len(self.lanes) - 1, lane, -1)
+					  if self.lanes[i].depth]
+			if not lowest:
+				self.stats['dropped'][LANE_NAMES[lane]] += 1
+				return False
+			self.lanes[lowest[0]].drop()
+			self.stats['dropped'][LANE_NAMES[lowest[0]]] += 1
+			depth -= 1
+
+		self.lanes[lane].push(recipient, stanza)
+		if depth + 1 > self.stats['depth_peak']:
+			self.stats['depth_peak'] = depth + 1
+		return True
+
+	def pop_ready(self, now=None):
+		"""pop_ready(float now=time.time()) -> list
+
+		Return the stanzas the rate limit allows to be sent now, in order.
+
+		"""
+		if now is None:
+			now = time.time()
+		ready = []
+		for lane in self.lanes:
+			while lane.depth and self.bucket.take(now):
+				ready.append(lane.pop())
+			if lane.depth:
+				break
+		self.stats['sent'] += len(ready)
+		for name, lane in zip(LANE_NAMES, self.lanes):
+			self.stats['depth'][name] = lane.depth
+		return ready
@@ -29,15 +29,21 @@
 
 from __future__ import with_statement
 
+import imp
 import logging
 import logging.handlers
+import marshal
 import os
 import re
 import sys
+import time
 import traceback
 
-from	common	import const, mounts, utils
+from	hashlib	import sha1
+
+from	common	import const, metrics, mounts, utils
 from	common.ini	import iMan
+from	framework	import manifest
 
 _plugin_log = logging.getLogger('pygab.plugins')
 _handler = logging.handlers.RotatingFileHandler(
@@ -87,9 +93,18 @@ class PluginFramework(object):
 	def __init__(self, folder_name="plugins", name_format="plugin_%s.py"):
 		#Plugin hashing dictionary
 		self._pluginhash = {}
+		# name -> (path, mtime, size) of the source that was last loaded.
+		self._pluginstat = {}
+		# folder -> (mtime, set of file names), so finding a plugin doesn't
+		# need a stat per search path.
+		self._foldercache = {}
+		# name -> stand-in classes for plugins staged by stage_plugins.
+		self._staged = {}
 		self.pluginpaths = [utils.get_module(), '']
 		self.folder_name = folder_name
 		self.name_format = name_format
+		# Compiled plugins are cached here, keyed by a hash of their source.
+		self.code_cache_path = os.path.join('.', utils.get_module(), 'plugin_cache')
 
 	def get_plugin_path(self, name):
 		"""
@@ -118,25 +133,88 @@ class PluginFramework(object):
 		Generate valid plugin paths.
 
 		"""
+		file_name = self.name_format % name
 		for folder in plugin_paths:
-			plug_path = os.path.abspath(
-				os.path.join(
-					'.', folder, self.folder_name,
-					self.name_format % name
-				)
-			)
-			if os.path.exists(plug_path):
-				yield plug_path
+			folder = os.path.abspath(os.path.join('.', folder, self.folder_name))
+			if file_name in self._list_folder(folder):
+				yield os.path.join(folder, file_name)
+
+	def _list_folder(self, folder):
+		"""Return the set of files in `folder`, relisting it only if the
+		folder's mtime has changed."""
+		try:
+			mtime = os.stat(folder).st_mtime
+		except OSError:
+			return ()
+
+		cached = self._foldercache.get(folder)
+		if cached is None or cached[0] != mtime:
+			cached = self._foldercache[folder] = (mtime, set(os.listdir(folder)))
+		return cached[1]
+
+	def _stat_plugin(self, path):
+		"""Return (path, mtime, size) for a plugin or None if it's missing."""
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		return (path, st.st_mtime, st.st_size)
 
 	def plugin_changed(self, plugin_name, plugin_source=None):
 		"""Return True if a plugin's source has changed"""
 
-		if not plugin_source:
-			path_ = self.get_plugin_path(plugin_name)
-			with open(path_, "r") as f:
-				plugin_source = f.read()
+		if plugin_source:
+			return self._pluginhash.get(plugin_name) != self._hash_source(plugin_source)
+
+		path_ = self.get_plugin_path(plugin_name)
+		if not path_:
+			return True
+
+		# If the file looks untouched don't bother reading it.
+		stat = self._stat_plugin(path_)
+		if stat is not None and stat == self._pluginstat.get(plugin_name):
+			return False
+
+		with open(path_, "r") as f:
+			plugin_source = f.read()
 
-		return self._pluginhash.get(plugin_name, 0) != hash(plugin_source)
+		return self._pluginhash.get(plugin_name) != self._hash_source(plugin_source)
+
+	@staticmethod
+	def _hash_source(source):
+		return sha1(source).hexdigest()
+
+	def _compile_plugin(self, name, source, digest):
+		"""_compile_plugin(str name, str source, str digest) -> code
+
+		Return the plugin's code object, from the on disk cache if this
+		exact source has been compiled before.
+
+		"""
+		cache_file = os.path.join(self.code_cache_path, '%s-%s.code' % (
+			self.name_format % name, digest))
+		try:
+			with open(cache_file, 'rb') as f:
+				# The cache is only valid for the python that wrote it.
+				if f.read(len(imp.get_magic())) == imp.get_magic():
+					return marshal.load(f)
+		except (IOError, EOFError, ValueError, TypeError):
+			pass
+
+		code = compile(source, self.name_format % name, 'exec')
+		try:
+			utils.confirmdir(self.code_cache_path)
+			# Drop code compiled from older versions of this plugin.
+			prefix = '%s-' % (self.name_format % name)
+			for old in os.listdir(self.code_cache_path):
+				if old.startswith(prefix):
+					os.remove(os.path.join(self.code_cache_path, old))
+			with open(cache_file, 'wb') as f:
+				f.write(imp.get_magic())
+				marshal.dump(code, f)
+		except (IOError, OSError):
+			_plugin_log.warning("Unable to cache the compiled %s plugin" % name)
+		return code
 
 	def load_plugins(self, plugins):
 		"""load_plugins(plugins: list<str>) -> list
@@ -152,7 +230,53 @@ class PluginFramework(object):
 
 		return loaded
 
+	def stage_plugins(self, plugins):
+		"""stage_plugins(plugins: list<str>) -> list
+
+		Register the commands and hooks of each plugin in `plugins` without
+		loading it. The plugin is loaded the first time one of them is used.
+		Plugins that can't be staged are loaded right away.
+		Return a list of successfully staged or loaded plugins.
+
+		"""
+		staged = []
+		for plugin_name in plugins:
+			path = self.get_plugin_path(plugin_name)
+			found = None
+			if path and plugin_name not in self._pluginhash:
+				try:
+					found = manifest.scan_plugin(path)
+				except:
+					_plugin_log.error('There was an error scanning %s\n%s' % (plugin_name, traceback.format_exc()))
+
+			if found is None:
+				if self.load_plugin(plugin_name):
+					staged.append(plugin_name)
+				continue
+
+			self._staged[plugin_name] = manifest.stage(self, plugin_name, path, found)
+			_plugin_log.info("Staging Plugin (%s)" % path)
+			staged.append(plugin_name)
+
+		return staged
+
+	def activate_plugin(self, name):
+		"""activate_plugin(name: str) -> bool
+
+		Load a plugin staged by stage_plugins, replacing its stand-ins.
+		Return True if the plugin was loaded.
+
+		"""
+		stubs = self._staged.pop(name, None)
+		if stubs is None:
+			return False
+		manifest.unstage(stubs)
+		return bool(self.load_plugin(name))
+
 	def load_plugin(self, name):
+		if name in self._staged:
+			return self.activate_plugin(name)
+
 		paths = self.get_plugin_paths(name)
 		if not paths:
 			# TODO: Add check to see if the bot is connected before trying to
@@ -167,7 +291,7 @@ class PluginFramework(object):
 			plugin_namespace["__file__"] = path
 			try:
 				if self._load_plugin(name, path, plugin_namespace):
-					return True
+					break
 			except:
 				traceback.print_exc()
 				print '\n'
@@ -179,12 +303,14 @@ class PluginFramework(object):
 				#with file(os.path.join('.', 'errors', "PluginError-%s.log" % self.module), "a+") as pluglog:
 				#	print >>pluglog, "\n Plugin error log for: ", plugin_name
 				#	traceback.print_exc(None, pluglog)
+		else:
+			return
 
 		# If the plugin has any initialization to be run, handle that here.
-		initializer = mounts.PluginInitializers.plugins.get(name)
-		if initializer:
+		initializer = mounts.PluginInitializers.plugins.get(path)
+		if isinstance(initializer, type):
 			initializer(self).initialize()
-
+		return True
 
 
 	def _load_plugin(self, name, path, namespace):
@@ -196,20 +322,28 @@ class PluginFramework(object):
 
 		"""
 
+		# Skip plugins that haven't been touched since they were loaded.
+		stat = self._stat_plugin(path)
+		if name in self._pluginhash and stat == self._pluginstat.get(name):
+			return False
+
 		with open(path, "r") as f:
 			a = f.read()
 		# Skip plugins that haven't been updated.
-		if not self.plugin_changed(name, a):
+		digest = self._hash_source(a)
+		if self._pluginhash.get(name) == digest:
+			self._pluginstat[name] = stat
 			return False
 
 		# Replicate __file__ in the plugin, since it isn't set by the
 		# interpreter when it executes a string.
 		# We're using __file__ to know what command classes to unload.
-		exec compile(a, 'plugin_%s.py' % name, 'exec') in namespace
+		exec self._compile_plugin(name, a, digest) in namespace
 
 		#utils.debug('core', "Loading Plugin (%s)" % path_)
 		_plugin_log.info("Loading Plugin (%s)" % path)
-		self._pluginhash[name] = hash(a)
+		self._pluginhash[name] = digest
+		self._pluginstat[name] = stat
 		return True
 
 	def unload_plugins(self, plugins):
@@ -222,6 +356,12 @@ class PluginFramework(object):
 
 		unloaded = []
 		for plugin_name in plugins:
+			stubs = self._staged.pop(plugin_name, None)
+			if stubs is not None:
+				manifest.unstage(stubs)
+				unloaded.append(plugin_name)
+				continue
+
 			if plugin_name not in self._pluginhash:
 				self.error(self.active_user, "The %s plugin hasn't been loaded or was"
 						   " misspelled." % plugin_name)
@@ -235,6 +375,7 @@ class PluginFramework(object):
 
 			self._unload_plugin(plugin_path)
 			del self._pluginhash[plugin_name]
+			self._pluginstat.pop(plugin_name, None)
 			unloaded.append(plugin_name)
 
 		return unloaded
@@ -280,7 +421,14 @@ class PluginFramework(object):
 				hook = hook(self)
 
 			# Process the next frame of the hook's generator.
-			break_ |= bool(hook.process(*args, **kwargs))
+			if metrics.registry.enabled:
+				start = time.time()
+				break_ |= bool(hook.process(*args, **kwargs))
+				elapsed = time.time() - start
+				metrics.registry.observe('hook.%s.%s' % (loc, hook.name), elapsed)
+				metrics.registry.observe('plugin.%s' % utils.get_plugin_name(getattr(hook, 'file', '')), elapsed)
+			else:
+				break_ |= bool(hook.process(*args, **kwargs))
 
 		return break_
 
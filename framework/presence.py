@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+from collections import deque
+
+# Presences are dispatched in this order once their window has passed.
+# Users coming online get their hooks (mail, greetings) first, status changes
+# next, and users going offline last since nothing is waiting on them.
+PRIORITY_ONLINE = 0
+PRIORITY_STATUS = 1
+PRIORITY_OFFLINE = 2
+
+def presence_priority(pres):
+	"""presence_priority(Presence pres) -> int
+
+	Return the dispatch priority of an availability presence.
+
+	"""
+	if pres.getType() == 'unavailable':
+		return PRIORITY_OFFLINE
+	if pres.getShow() in ('away', 'dnd', 'xa'):
+		return PRIORITY_STATUS
+	return PRIORITY_ONLINE
+
+class PresenceQueue(object):
+	"""Coalesce availability presences per JID.
+
+	When the bot (re)connects the server replays presence for every contact,
+	and busy clients often send several presences in a row. Each JID is held
+	for `window` seconds after its first presence arrives and any later
+	presence from it replaces the held one, so only the latest state runs
+	through the hooks. Presences that are ready are handed out in batches of
+	at most `batch_size`, ordered by `presence_priority`.
+
+	Subscription presences should never be queued, collapsing them would
+	lose requests. Use `take` to get the presences held for their JID so
+	those can be handled first.
+
+	"""
+
+	def __init__(self, window=2.0, batch_size=50):
+		self.window = window
+		self.batch_size = batch_size
+		# jid -> [first_seen, priority, stanza, jid]
+		self._pending = {}
+		# Entries in order of their first presence, first_seen only ever
+		# grows so the ready ones are always at the front. Entries removed
+		# by `take` have their stanza set to None and are skipped.
+		self._arrivals = deque()
+		self._ready = [deque() for priority in
+			(PRIORITY_ONLINE, PRIORITY_STATUS, PRIORITY_OFFLINE)]
+		self.stats = {
+			'received' : 0,
+			'coalesced' : 0,
+			'dispatched' : 0,
+			'backlog' : 0,
+			'backlog_peak' : 0,
+		}
+
+	def __len__(self):
+		return len(self._pending)
+
+	def push(self, pres, now=None):
+		"""push(Presence pres, float now=time.time()) -> None
+
+		Queue a presence, replacing any presence still held for its JID.
+
+		"""
+		if now is None:
+			now = time.time()
+		jid = unicode(pres.getFrom())
+		self.stats['received'] += 1
+
+		entry = self._pending.get(jid)
+		if entry is not None:
+			# The priority only matters until the JID is moved to a ready
+			# queue, after that it stays where it is.
+			entry[1:3] = [presence_priority(pres), pres]
+			self.stats['coalesced'] += 1
+			return
+
+		entry = self._pending[jid] = [now, presence_priority(pres), pres, jid]
+		self._arrivals.append(entry)
+		backlog = self.stats['backlog'] = len(self._pending)
+		if backlog > self.stats['backlog_peak']:
+			self.stats['backlog_peak'] = backlog
+
+	def pop_batch(self, now=None):
+		"""pop_batch(float now=time.time()) -> list
+
+		Return up to `batch_size` presences whose window has passed.
+
+		"""
+		if not self._pending:
+			return []
+		if now is None:
+			now = time.time()
+
+		arrivals = self._arrivals
+		while arrivals and arrivals[0][0] + self.window <= now:
+			entry = arrivals.popleft()
+			if entry[2] is not None:
+				self._ready[entry[1]].append(entry)
+
+		return self._take(self.batch_size)
+
+	def flush(self):
+		"""flush() -> list
+
+		Return every held presence regardless of its window.
+
+		"""
+		while self._arrivals:
+			entry = self._arrivals.popleft()
+			if entry[2] is not None:
+				self._ready[entry[1]].append(entry)
+		return self._take(len(self._pending))
+
+	def take(self, jid):
+		"""take(JID jid) -> list
+
+		Remove and return the presences held for `jid`, or for any of its
+		resources if it's a bare JID, in the order they arrived.
+
+		"""
+		jid = unicode(jid)
+		prefix = jid + '/'
+		entries = [entry for key, entry in self._pending.iteritems()
+				   if key == jid or key.startswith(prefix)]
+		if not entries:
+			return []
+		entries.sort(key=lambda entry: entry[0])
+		batch = []
+		for entry in entries:
+			del self._pending[entry[3]]
+			batch.append(entry[2])
+			entry[2] = None
+		self.stats['dispatched'] += len(batch)
+		self.stats['backlog'] = len(self._pending)
+		return batch
+
+	def _take(self, count):
+		batch = []
+		for ready in self._ready:
+			while ready and len(batch) < count:
+				entry = ready.popleft()
+				if entry[2] is None:
+					continue
+				del self._pending[entry[3]]
+				batch.append(entry[2])
+			if len(batch) >= count:
+				break
+
+		self.stats['dispatched'] += len(batch)
+		self.stats['backlog'] = len(self._pending)
+		return batch
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import with_statement
+
+import os
+import time
+
+from common import mounts, utils
+
+# Only needed once someone starts profiling.
+cProfile = utils.LazyModule('cProfile')
+pstats = utils.LazyModule('pstats')
+
+def label_functions():
+	"""label_functions() -> dict
+
+	Map each command and hook thread's (filename, line) to a readable name.
+	Plugins are exec'd from source, so without this every plugin function
+	shows up as plugin_<name>.py:<line>(thread).
+
+	"""
+	labels = {}
+	for kind, mount in (('command', mounts.CommandMount),
+						('hook', mounts.HookMount)):
+		for plugin in mount.plugins.values():
+			thread = getattr(plugin, 'thread', None)
+			code = getattr(getattr(thread, 'im_func', thread), 'func_code', None)
+			path = getattr(plugin, 'file', None)
+			# Without a file the plain filename label is kept.
+			if code is None or not path:
+				continue
+			labels[(code.co_filename, code.co_firstlineno)] = '%s:%s [%s]' % (
+				kind, plugin.name, utils.get_plugin_name(path))
+	return labels
+
+class LoopProfiler(object):
+	"""Profile the bot's main loop for a set amount of time.
+
+	`start` turns on cProfile and BotFramework.run calls `check` every frame,
+	which stops the profiler once time is up. The raw stats are dumped to
+	`log_dir` along with a text summary, and the summary is passed to the
+	callback given to `start`.
+
+	"""
+
+	def __init__(self, log_dir, top=15):
+		self.log_dir = log_dir
+		self.top = top
+		self._profile = None
+		self._stop_at = 0
+		self._callback = None
+
+	@property
+	def active(self):
+		return self._profile is not None
+
+	def start(self, seconds, callback=None):
+		"""start(int seconds, callable callback=None) -> bool
+
+		Start profiling. Return False if a profile is already running.
+
+		"""
+		if self.active:
+			return False
+		self._callback = callback
+		self._stop_at = time.time() + seconds
+		self._profile = cProfile.Profile()
+		self._profile.enable()
+		return True
+
+	def check(self):
+		"""check() -> None
+
+		Stop the profiler if its time is up.
+
+		"""
+		if self._profile is not None and time.time() >= self._stop_at:
+			self.stop()
+
+	def stop(self):
+		"""stop() -> str
+
+		Stop profiling, write the results and return the summary.
+
+		"""
+		profile, callback = self._profile, self._callback
+		if profile is None:
+			return ''
+		profile.disable()
+		self._profile = self._callback = None
+
+		utils.confirmdir(self.log_dir)
+		base_name = os.path.join(self.log_dir,
+								 time.strftime('profile-%Y%m%d-%H%M%S'))
+		profile.dump_stats(base_name + '.prof')
+		summary = self.summarize(pstats.Stats(profile))
+		with open(base_name + '.txt', 'w') as f:
+			f.write(summary)
+
+		summary = 'Profile saved to %s.prof\n%s' % (base_name, summary)
+		if callback:
+			callback(summary)
+		return summary
+
+	def summarize(self, stats):
+		"""summarize(pstats.Stats stats) -> str
+
+		Return the `top` functions by cumulative time, one per line.
+
+		"""
+		labels = label_functions()
+		rows = stats.stats.items()
+		rows.sort(key=lambda row: row[1][3], reverse=True)
+
+		lines = ['%d calls in %.3fs' % (stats.total_calls, stats.total_tt),
+				 'cumulative  own       calls   function']
+		for (filename, line, func), (_, calls, own, cumulative, _) in \
+				rows[:self.top]:
+			label = labels.get((filename, line))
+			if not label:
+				label = '%s:%d(%s)' % (os.path.basename(filename), line, func)
+			lines.append('%-11.4f %-9.4f %-7d %s' % (
+				cumulative, own, calls, label))
+		return '\n'.join(lines) + '\n'
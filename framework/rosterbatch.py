@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import xmpp
+
+# Which side of a subscription a presence type changes. Our subscription to
+# a user and their subscription to us are independent, so a batch keeps the
+# last change to each.
+_DIRECTION = {
+	'subscribe' : 'to',
+	'unsubscribe' : 'to',
+	'subscribed' : 'from',
+	'unsubscribed' : 'from',
+}
+
+class RosterBatch(object):
+	"""Collect roster changes and send them together.
+
+	While a batch is open addUser, removeUser, acceptUser and rejectUser only
+	record what they'd send and refreshRoster only notes it was asked for.
+	When the outermost `with` block ends the subscription presences are sent,
+	repeated changes to the same user reduced to the last one, and the roster
+	is refreshed at most once. The server pushes each change back, so the
+	local roster stays current without downloading it again.
+
+	"""
+
+	def __init__(self, bot):
+		self.bot = bot
+		self.depth = 0
+		# (jid, direction) -> presence type
+		self._changes = {}
+		self._order = []
+		self._refresh = False
+
+	def __enter__(self):
+		self.depth += 1
+		return self
+
+	def __exit__(self, *args):
+		self.depth -= 1
+		if not self.depth:
+			self.flush()
+
+	def __len__(self):
+		return len(self._changes)
+
+	def subscription(self, jid, typ):
+		"""subscription(JID jid, str typ) -> bool
+
+		Record a subscription presence. Return False if no batch is open and
+		it should be sent straight away.
+
+		"""
+		if not self.depth:
+			return False
+		key = (unicode(jid), _DIRECTION[typ])
+		if key not in self._changes:
+			self._order.append(key)
+		self._changes[key] = typ
+		return True
+
+	def refresh(self):
+		"""refresh() -> bool
+
+		Note that the roster should be refreshed once the batch is sent.
+		Return False if no batch is open.
+
+		"""
+		if not self.depth:
+			return False
+		self._refresh = True
+		return True
+
+	def flush(self):
+		"""flush() -> int
+
+		Send everything recorded so far, return the number of presences sent.
+
+		"""
+		changes, order, refresh = self._changes, self._order, self._refresh
+		self._changes, self._order, self._refresh = {}, [], False
+		for key in order:
+			self.bot.send_stanza(xmpp.protocol.Presence(
+				to=key[0], typ=changes[key]))
+		if refresh:
+			self.bot.refreshRoster()
+		return len(order)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Spread the bot's traffic across several client connections.
+
+Servers rate limit each connection, so a big conference can outgrow a
+single one. Each `Shard` is an extra connection, either another account or
+another resource of the bot's account. Users are assigned to a connection by
+consistent hashing of their bare JID, so adding or losing a shard only moves
+the users that hashed to it. Everything received on any connection goes to
+the bot's usual handlers.
+
+"""
+
+from __future__ import with_statement
+
+import bisect
+import logging
+import Queue
+import select
+import threading
+
+from hashlib import md5
+
+import xmpp
+
+from common import const, metrics
+
+net_log = logging.getLogger('pygab.net')
+
+class HashRing(object):
+	"""Consistent hashing of keys onto nodes.
+
+	Each node gets `replicas` points on the ring so keys spread evenly.
+
+	"""
+
+	def __init__(self, nodes=(), replicas=64):
+		self.replicas = replicas
+		self._points = []
+		self._nodes = {}
+		for node in nodes:
+			self.add(node)
+
+	def __len__(self):
+		return len(set(self._nodes.values()))
+
+	@staticmethod
+	def _hash(key):
+		return long(md5(key).hexdigest()[:16], 16)
+
+	def add(self, node, name=None):
+		"""Add `node`, hashed by `name` which defaults to str(node)."""
+		name = name or str(node)
+		for i in xrange(self.replicas):
+			point = self._hash('%s#%d' % (name, i))
+			if point not in self._nodes:
+				bisect.insort(self._points, point)
+			self._nodes[point] = node
+
+	def remove(self, node):
+		for point, owner in self._nodes.items():
+			if owner is node:
+				del self._nodes[point]
+				self._points.remove(point)
+
+	def get(self, key):
+		"""Return the node `key` belongs to, or None if the ring is empty."""
+		if not self._points:
+			return None
+		index = bisect.bisect(self._points, self._hash(key))
+		if index == len(self._points):
+			index = 0
+		return self._nodes[self._points[index]]
+
+class Shard(object):
+	"""An extra connection. Stanzas are sent by a thread of its own, so a
+	connection the server is throttling doesn't hold up the others.
+
+	"""
+
+	def __init__(self, name, jid, password, resource):
+		self.name = name
+		self.jid = jid
+		self.password = password
+		self.resource = resource
+		self.client = None
+		self.queue = Queue.Queue()
+		# Held while writing so the main loop never reads and writes the
+		# socket at the same time as the sender thread.
+		self.lock = threading.Lock()
+		self.sent = 0
+		self._thread = None
+
+	def __str__(self):
+		return '%s/%s' % (self.jid, self.resource)
+
+	@property
+	def connected(self):
+		return bool(self.client and self.client.isConnected())
+
+	def connect(self, bot, server=(), proxy={}, use_srv=False, secure=None):
+		"""connect(BotFramework bot, tuple server, dict proxy, bool use_srv, secure)
+
+		Connect and authenticate the same way BotFramework.connect does and
+		route received stanzas to `bot`.
+
+		"""
+		client = xmpp.Client(self.jid.getDomain(), debug=[])
+		if server:
+			conres = client.connect(server, proxy, use_srv=use_srv, secure=secure)
+		else:
+			conres = client.connect()
+		if not conres:
+			raise const.ConnectError(server)
+
+		bot.registerHandlers(client, shared=self.jid.bareMatch(bot.jid))
+		if not client.auth(self.jid.getNode(), self.password, self.resource):
+			raise const.AuthError(server)
+		bot.plugRoster(client, self.resource)
+		client.sendInitPresence(requestRoster=0)
+		# Wait for the roster here, later on only the sender thread writes.
+		client.getRoster()
+
+		self.client = client
+		if self._thread is None or not self._thread.isAlive():
+			self._thread = threading.Thread(target=self._sender,
+											name='Shard %s' % self)
+			self._thread.setDaemon(True)
+			self._thread.start()
+
+	def send(self, stanza):
+		"""Queue `stanza` for the sender thread."""
+		self.queue.put(stanza)
+
+	def process(self):
+		"""Handle received data, unless the sender thread is busy writing."""
+		if not self.lock.acquire(False):
+			return '0'
+		try:
+			return self.client.Process(0)
+		finally:
+			self.lock.release()
+
+	def disconnect(self):
+		self.queue.put(None)
+		if self.connected:
+			with self.lock:
+				self.client.disconnect()
+
+	def _sender(self):
+		while True:
+			stanza = self.queue.get()
+			if stanza is None:
+				return
+			try:
+				with self.lock:
+					self.client.send(stanza)
+				self.sent += 1
+			except:
+				net_log.exception('Shard %s failed to send' % self)
+
+class ShardSet(object):
+	"""The bot's own connection plus any shards, and which users each serves.
+
+	The bot's connection is represented by None in the ring and sends from
+	the main loop as before.
+
+	"""
+
+	def __init__(self):
+		self.shards = []
+		self.ring = HashRing()
+
+	def __len__(self):
+		return len(self.shards)
+
+	def __iter__(self):
+		return iter(self.shards)
+
+	def add(self, shard):
+		self.shards.append(shard)
+
+	def rebuild(self):
+		"""Put the bot's connection and every connected shard on the ring."""
+		self.ring = HashRing()
+		if not self.shards:
+			return
+		self.ring.add(None, 'primary')
+		for shard in self.shards:
+			if shard.connected:
+				self.ring.add(shard, str(shard))
+
+	def shard_for(self, jid):
+		"""shard_for(JID jid) -> Shard
+
+		Return the shard serving `jid`, None for the bot's own connection.
+
+		"""
+		if not self.shards or jid is None:
+			return None
+		return self.ring.get(unicode(jid.getStripped()).lower().encode('utf-8'))
+
+	def process(self, client, timeout):
+		"""process(xmpp.Client client, float timeout) -> None
+
+		Wait at most `timeout` seconds for data on `client` or any shard, then
+		handle whatever arrived. A shard that lost its connection is taken off
+		the ring so its users move to the others.
+
+		"""
+		shards = [shard for shard in self.shards if shard.connected]
+		if shards and timeout:
+			sockets = [client.Connection._sock]
+			sockets.extend([shard.client.Connection._sock for shard in shards])
+			try:
+				select.select(sockets, [], [], timeout)
+			except select.error:
+				pass
+			timeout = 0
+
+		result = client.Process(timeout)
+		for shard in shards:
+			if not shard.process():
+				net_log.warning('Shard %s disconnected' % shard)
+				self.rebuild()
+		if metrics.registry.enabled and shards:
+			for shard in shards:
+				metrics.registry.set('shard.%s.queued' % shard.name,
+									 shard.queue.qsize())
+		return result
+
+	def disconnect(self):
+		for shard in self.shards:
+			shard.disconnect()
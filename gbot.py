@@ -42,18 +42,14 @@ from common import locations
 
 def log(*args):
 	"""Replacement for print, which doesn't deal with unicode well"""
-	global me
-	msg = ' '.join(map(unicode,args))
-	# Replace unencodable charactors with ?
-	msg = '%s %s' % (time.strftime("%Y-%m-%d %H:%M:%S"),
-					 msg.encode(sys.getdefaultencoding(), "replace"))
-	print msg
-	print >> me.logf, msg
-	me.logf.flush()
+	# Goes through the pygab logger so the console and file writes happen on
+	# the log writer's thread.
+	logging.getLogger('pygab').info(' '.join(map(unicode, args)))
 
 from common		import const, mounts, utils
 from common.ini 	import iMan
 from framework.bot	import BotFramework
+from framework.outbound import LANE_BROADCAST, LANE_SYSTEM, LANE_WHISPER
 from framework.plugin import attach_hooks, attach_post_hook, PluginFramework
 from gbot		import	*
 
@@ -63,6 +59,7 @@ iMan.load(utils.get_module(), 'config')
 server = iMan.config.server
 
 conn_log = logging.getLogger('pygab.net')
+chat_log = logging.getLogger('pygab.chat')
 
 
 class ConferenceBot(BotFramework, PluginFramework):
@@ -82,7 +79,10 @@ class ConferenceBot(BotFramework, PluginFramework):
 		plugins_to_load = iMan.config.system.plugins
 		if isinstance(plugins_to_load, basestring):
 			plugins_to_load = plugins_to_load.split(' ')
-		self.load_plugins(plugins_to_load)
+		if iMan.config.system.get('lazyplugins', False):
+			self.stage_plugins(plugins_to_load)
+		else:
+			self.load_plugins(plugins_to_load)
 
 	def prep(self, secure=True):
 		try:
@@ -130,7 +130,7 @@ class ConferenceBot(BotFramework, PluginFramework):
 	def log(self,*args):
 		log(*args)
 
-	def _send_msg(self, msg):
+	def _send_msg(self, msg, lane=LANE_WHISPER):
 		"""Takes a message stanza rather than a jid and message"""
 		user = msg.to_user
 		if self.hook(const.LOC_SEND_MSG_PER_USER, user, msg):
@@ -140,11 +140,11 @@ class ConferenceBot(BotFramework, PluginFramework):
 			# XXX: The message needs to be updated for each resource
 			if self.hook(const.LOC_SEND_MSG_PER_RESOURCE, user, resource, msg) or \
 				show in [u"online", u"chat"]:
-				self.client.send(msg)
+				self.send_stanza(msg, lane)
 
 	def sendtoall(self, text, butnot=[]):
 		'''Send msg to all online users excluding anyone in butnot.'''
-		logging.getLogger('pygab.chat').info('All <- %s' % text)
+		chat_log.info('All <- %s', text)
 		if self.hook(const.LOC_SEND_MSG_PER_MSG, text):
 			return
 
@@ -152,26 +152,27 @@ class ConferenceBot(BotFramework, PluginFramework):
 			if user in butnot:
 				continue
 			message = self._build_msg(utils.getjid(user), text)
-			self._send_msg(message)
+			self._send_msg(message, LANE_BROADCAST)
 
-	def sendto(self, user, text):
+	def sendto(self, user, text, lane=LANE_WHISPER):
 		'''Send msg to user via self._send_msg'''
-		logging.getLogger('pygab.chat').info('%s <- %s' % (utils.getnickname(user), text))
+		chat_log.info('%s <- %s', utils.getnickname(user), text)
 		message = self._build_msg(utils.getjid(user), text)
 		if self.hook(const.LOC_SEND_MSG_PER_MSG, message):
 			return
 
-		self._send_msg(message)
+		self._send_msg(message, lane)
 
 	def sys(self, user, msg):
-		self.sendto(user, '%s %s' % (iMan.config.system.sysprefix, msg))
+		self.sendto(user, '%s %s' % (iMan.config.system.sysprefix, msg),
+					LANE_SYSTEM)
 
 	def systoall(self, msg, butnot=[]):
 		self.sendtoall('%s %s' % (iMan.config.system.sysprefix, msg), butnot)
 
 	def error(self, user, msg):
 		"Send an error message to a user"
-		self.sendto(user, "ERROR: %s" % msg)
+		self.sendto(user, "ERROR: %s" % msg, LANE_SYSTEM)
 
 	@attach_hooks()
 	def ev_msg(self, msg):
@@ -180,13 +181,12 @@ class ConferenceBot(BotFramework, PluginFramework):
 			if self.hook(const.LOC_EV_MSG, msg):
 				# TODO: Log all incoming to the console and
 				# all outgoing to a file.
-				logging.getLogger('pygab.chat').info('%s -> %s' % (
-					utils.getnickname(msg.from_user), msg.text
-				))
+				chat_log.info('%s -> %s', utils.getnickname(msg.from_user), msg.text)
 				return
 			# self.log("<%s> %s" % (getnickname(user), msg))
 			text = '<%s> %s' % (utils.getnickname(msg.from_user), msg.text)
 			self.sendtoall(text, butnot=[unicode(user)])
+			self.hook(const.LOC_EV_RELAY, msg.from_user, msg.text)
 
 	@attach_hooks()
 	def ev_iq(self, iq):
@@ -200,32 +200,33 @@ class ConferenceBot(BotFramework, PluginFramework):
 		if self.hook(const.LOC_EV_UNSUBSCRIBE, pres):
 			return
 
-		user = user.getStripped()
+		user = pres.getFrom().getStripped()
 		# User removed us from their list
 		# So remove them from ours.
 		log(user, "unsubscribing:", pres.getStatus())
-		self.removeUser(user)
-		# Remove us from their list
-		self.rejectUser(user)
-		self.refreshRoster()
+		with self.rosterBatch():
+			self.removeUser(user)
+			# Remove us from their list
+			self.rejectUser(user)
 
 	@attach_hooks()
 	def ev_subscribe(self, pres):
 		if self.hook(const.LOC_EV_SUBSCRIBE, pres):
 			return
 
+		user = pres.getFrom()
 		#FIXME: Currently getjid can only rebuild JID's with gmail.com domains,
 		# so we need to reject not gmail.com users.
-		if not user.get_domain() == server.domain:
+		if not user.getDomain() == server.domain:
 			self.removeUser(user)
 			return
 
 		user = user.getStripped()
 		# User added us to their list, so add them to ours
 		log(user, "subscribing:", pres.getStatus())
-		self.addUser(user)
-		self.acceptUser(user)
-		self.refreshRoster()
+		with self.rosterBatch():
+			self.addUser(user)
+			self.acceptUser(user)
 
 	@attach_hooks()
 	def ev_subscribed(self, pres):
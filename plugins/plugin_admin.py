@@ -30,16 +30,15 @@
 from __future__ import with_statement
 
 
-import	argparse
 import	os
-import	shlex
 import	sys
 import	time
 
 from	datetime	import	datetime
 
-from	common			import argparse, const, mounts, utils
+from	common			import cmdargs, const, metrics, mounts, utils
 from	common.ini		import	iMan
+
 #from	common.utils	import	*
 #module = get_module()
 #exec(get_import(mod=module, from_=['utils']))
@@ -144,6 +143,111 @@ class ForgetUser(mounts.CommandMount):
 			self.parent.sendto(user, 'Unknown User: %s' % args)
 		iMan.unload('roster')
 
+class PresenceStats(mounts.CommandMount):
+	name = 'presence'
+	rank = const.RANK_ADMIN
+	file = __file__
+
+	__doc__ = "Show how many presences have been queued and coalesced."
+
+	def thread(self, user, args):
+		stats = self.parent.presences.stats
+		self.parent.sendto(user, 'Presences received: %(received)d, '
+						   'coalesced: %(coalesced)d, dispatched: '
+						   '%(dispatched)d, backlog: %(backlog)d '
+						   '(peak %(backlog_peak)d)' % stats)
+
+class OutboundStats(mounts.CommandMount):
+	name = 'outbound'
+	rank = const.RANK_ADMIN
+	file = __file__
+
+	__doc__ = "Show how many outgoing stanzas are queued by the send rate limit."
+
+	def thread(self, user, args):
+		stats = self.parent.outboundStats()
+		self.parent.sendto(user, 'Stanzas sent: %d, queued: %s, dropped: %s '
+						   '(peak %d)' % (stats['sent'],
+						   ', '.join(['%s %d' % item for item in stats['depth'].items()]),
+						   ', '.join(['%s %d' % item for item in stats['dropped'].items()]),
+						   stats['depth_peak']))
+
+class NameStats(mounts.CommandMount):
+	name = 'names'
+	rank = const.RANK_ADMIN
+	file = __file__
+
+	__doc__ = "Show how often user names are found in the name memos. \n" \
+				"Usage: !names [clear]"
+
+	def thread(self, user, args):
+		if args.strip() == 'clear':
+			for memo in utils.name_memos.itervalues():
+				memo.clear()
+			self.parent.sendto(user, 'Name memos cleared.')
+			return
+
+		lines = []
+		for name, memo in sorted(utils.name_memos.items()):
+			lines.append('%s: %d remembered, %d hits, %d misses (%.1f%%)' % (
+				name, len(memo), memo.stats['hits'], memo.stats['misses'],
+				memo.hit_rate() * 100))
+		self.parent.sendto(user, '\n'.join(lines))
+
+class Metrics(mounts.CommandMount):
+	name = 'metrics'
+	rank = const.RANK_ADMIN
+	file = __file__
+
+	__doc__ = "Show or control the bot's metrics. \n" \
+				"Usage: !metrics [on|off|reset|<name prefix>]"
+
+	def thread(self, user, args):
+		args = args.strip()
+		if args == 'on':
+			metrics.registry.enabled = True
+			self.parent.sendto(user, 'Metrics enabled.')
+		elif args == 'off':
+			metrics.registry.enabled = False
+			self.parent.sendto(user, 'Metrics disabled.')
+		elif args == 'reset':
+			metrics.registry.reset()
+			self.parent.sendto(user, 'Metrics reset.')
+		else:
+			report = metrics.registry.format(args)
+			if not metrics.registry.enabled:
+				report = '(metrics are disabled)\n' + report
+			self.parent.sendto(user, report or 'No metrics recorded.')
+
+class Profile(mounts.CommandMount):
+	name = 'profile'
+	rank = const.RANK_ADMIN
+	file = __file__
+
+	__doc__ = "Profile the bot for a number of seconds (default 30). \n" \
+				"Usage: !profile [seconds|stop]"
+
+	def thread(self, user, args):
+		args = args.strip()
+		if args == 'stop':
+			if not self.parent.profiler.active:
+				self.parent.error(user, "I'm not being profiled.")
+			else:
+				self.parent.profiler.stop()
+			return
+
+		if args and not args.isdigit():
+			raise const.CommandHelp
+		seconds = int(args or 30)
+
+		def report(summary):
+			self.parent.sendto(user, summary)
+		if self.parent.profiler.start(seconds, report):
+			self.parent.sendto(user, "Profiling for %d second%s." % (
+				seconds, utils.pluralize(seconds)))
+		else:
+			self.parent.error(user, "A profile is already running.")
+
 class HookIgnoreUser(mounts.HookMount):
 	name = 'ignore'
 	loc = [const.LOC_EV_MSG]
@@ -213,41 +317,24 @@ class LoadParser(object):
 	rank = const.RANK_ADMIN
 	file = __file__
 
-	load_parser = argparse.ArgumentParser(prog='!(re|un)load', add_help=False)
-	load_parser.add_argument(
-		'extra',
-		default=False, nargs='?',
-		metavar='command', help='Start, stop, restart'
-	)
-	load_parser.add_argument(
-		'-a', '--all',
-		action='store_true',
-		help='Equvilant to -p -i'
-	)
-	load_parser.add_argument(
-		'-f', '--force',
-		action='store_true',
-		help='force an action'
-	)
-	load_parser.add_argument(
-		'-p', '--plugin',
-		const=True, default=False, nargs='?',
-		metavar='plugin_name', help='(re|un)load plugins'
-	)
-	load_parser.add_argument(
-		'-i', '--ini',
-		const=True, default=False, nargs='?',
-		metavar='ini_name', help='(re|un)load inis'
+	argspec = cmdargs.ArgSpec('!(re|un)load',
+		cmdargs.Arg('extra', nargs='?', default=False,
+			metavar='command', help='Start, stop, restart'),
+		cmdargs.Option('-a', '--all', help='Equvilant to -p -i'),
+		cmdargs.Option('-f', '--force', help='force an action'),
+		cmdargs.Option('-p', '--plugin', nargs='?', default=False,
+			metavar='plugin_name', help='(re|un)load plugins'),
+		cmdargs.Option('-i', '--ini', nargs='?', default=False,
+			metavar='ini_name', help='(re|un)load inis'),
 	)
 
 class Reload(mounts.CommandMount, LoadParser):
 	name = 'reload'
 
-	__doc__ = """Reload parts of the bot.\n%s""" % (LoadParser.load_parser.format_help())
-
+	__doc__ = """Reload parts of the bot.\n%s""" % LoadParser.argspec.format_help()
 
 	def thread(self, user, args):
-		options = self.load_parser.parse_args(shlex.split(args.lower()))
+		options = self.parse_args(args.lower())
 
 		if options.extra:
 			self.parent.error(user, "Please use one of the arguments. Ex. -p user, -i roster")
@@ -257,7 +344,7 @@ class Reload(mounts.CommandMount, LoadParser):
 			iMan.readall()
 			self.parent.sendto(user, 'I have read all ini\'s')
 		elif options.ini:
-			iMan[options.ini].read()
+			iMan.read(options.ini)
 			self.parent.sendto(user, 'I have read the ini (%s)' % options.ini)
 
 
@@ -287,11 +374,10 @@ class Reload(mounts.CommandMount, LoadParser):
 class Load(mounts.CommandMount, LoadParser):
 	name = 'load'
 
-	__doc__ = """Load parts of the bot.\n%s""" % (LoadParser.load_parser.format_help())
-
+	__doc__ = """Load parts of the bot.\n%s""" % LoadParser.argspec.format_help()
 
 	def thread(self, user, args):
-		options = self.load_parser.parse_args(shlex.split(args.lower()))
+		options = self.parse_args(args.lower())
 
 		if options.extra:
 			self.parent.error(user, "Please use one of the arguments. Ex. -p user, -i roster")
@@ -320,11 +406,10 @@ class Load(mounts.CommandMount, LoadParser):
 class Unload(mounts.CommandMount, LoadParser):
 	name = 'unload'
 
-	__doc__ = """Unload parts of the bot.\n%s""" % (LoadParser.load_parser.format_help())
-
+	__doc__ = """Unload parts of the bot.\n%s""" % LoadParser.argspec.format_help()
 
 	def thread(self, user, args):
-		options = self.load_parser.parse_args(shlex.split(args.lower()))
+		options = self.parse_args(args.lower())
 
 		if options.extra:
 			self.parent.error(user, "Please use one of the arguments. Ex. -p user, -i roster")
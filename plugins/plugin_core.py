@@ -3,18 +3,70 @@
 import logging
 import re
 
-from common import const, mounts, utils
+from common import const, metrics, mounts, utils
 from common.ini import iMan
 from common.locations import Locations
 
 from framework import plugin
+from framework.flood import FloodControl, FLOOD_MUTED, FLOOD_THROTTLED
 
 log = logging.getLogger('pygab.plugin.core')
 cmd_log = logging.getLogger('pygab.plugin.core.cmd_dispatch')
 
+class HookFloodControl(mounts.HookMount):
+	"""Stop relaying users who talk faster than the room can keep up with.
+
+	Every relayed line is sent to the whole roster, so this runs before
+	anything else and drops lines over `floodrate` per `floodwindow` seconds.
+	Users going past `floodmute` are muted for `floodmutetime` seconds.
+
+	"""
+	name = 'FloodControl'
+	loc = const.LOC_EV_MSG
+	file = __file__
+	priority = const.PRIORITY_CRITICAL
+
+	def __init__(self, parent):
+		self.flood = FloodControl(
+			iMan.config.system.get('floodwindow', 10),
+			iMan.config.system.get('floodusers', 1000))
+		mounts.HookMount.__init__(self, parent)
+
+	def thread(self, msg):
+		limit = iMan.config.system.get('floodrate', 0)
+		if not limit:
+			return False
+
+		user = msg.from_user.getStripped()
+		if utils.isadmin(user):
+			return False
+
+		self.flood.window = float(iMan.config.system.get('floodwindow', 10))
+		mute_time = iMan.config.system.get('floodmutetime', 60)
+		result = self.flood.check(user, limit,
+			iMan.config.system.get('floodmute', limit * 2), mute_time)
+
+		if result == FLOOD_THROTTLED:
+			metrics.registry.inc('flood.throttled')
+		elif result == FLOOD_MUTED:
+			metrics.registry.inc('flood.muted')
+			self.parent.error(user, "You're sending messages too quickly. "
+							  "You've been muted for %d seconds." % mute_time)
+		return result == FLOOD_THROTTLED or result == FLOOD_MUTED
+
+# Characters that start a command, rebuilt whenever config.ini is read.
+_prefixes = frozenset()
+
+def _config_changed(config):
+	global _prefixes
+	_prefixes = frozenset(config.system.get('commandprefix', ''))
+
+iMan.subscribe('config', _config_changed)
+
 class CommandDispatch(mounts.HookMount):
 	name = 'CommandDispatch'
 	loc = const.LOC_EV_MSG
+	file = __file__
 	plugin = __name__
 	priority = 'e'
 
@@ -32,7 +84,7 @@ class CommandDispatch(mounts.HookMount):
 		# TODO: Replace with the following when I feel like figuring out how
 		# best to strip a dynamic length delimter
 		#if not [x for x in iMan.config.system.commandprefix if text.startswith(x)]:
-		if text[:1] not in iMan.config.system.commandprefix:
+		if text[:1] not in _prefixes:
 			return False
 
 		text = text[1:]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+#  PyGab - Python Jabber Framework
+#  Copyright (c) 2008, Patrick Kennedy
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  - Redistributions of source code must retain the above copyright
+#  notice, this list of conditions and the following disclaimer.
+#
+#  - Redistributions in binary form must reproduce the above copyright
+#  notice, this list of conditions and the following disclaimer in the
+#  documentation and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE FOUNDATION OR
+#  CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#  EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#  PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import	os
+import	time
+
+from	common			import const, mounts, utils
+from	common.chatlog	import ChatHistory
+from	common.ini		import iMan
+
+# The most lines either command will send at once.
+MAX_LINES = 50
+
+history = ChatHistory(os.path.join('.', utils.get_module(), 'history'),
+	iMan.config.system.get('historysize', 200),
+	iMan.config.system.get('historysegment', 256) * 1024,
+	iMan.config.system.get('historysegments', 16))
+
+def format_lines(lines):
+	return '\n'.join(['[%s] <%s> %s' % (
+		time.strftime('%H:%M', time.localtime(created)), nick, text)
+		for created, nick, text in lines])
+
+class Init(mounts.PluginInitializers):
+	name = __file__
+
+	def initialize(self):
+		history.load()
+
+	def __exit__(self, *args):
+		history.close()
+		mounts.PluginInitializers.remove(self.__class__)
+
+class HookHistory(mounts.HookMount):
+	name = 'history'
+	loc = [const.LOC_EV_RELAY]
+	file = __file__
+	priority = const.PRIORITY_PERSISTANT
+
+	def thread(self, user, text):
+		history.append(utils.getnickname(user), text)
+
+class History(mounts.CommandMount):
+	name = 'history'
+	rank = const.RANK_USER
+	file = __file__
+
+	__doc__ = "Show the last lines said in the room. \n" \
+				"Usage: !history [count]"
+
+	def thread(self, user, args):
+		count = 20
+		if args.strip():
+			if not args.strip().isdigit():
+				raise const.CommandHelp
+			count = min(int(args), MAX_LINES)
+
+		lines = history.recent(count)
+		if not lines:
+			self.parent.sendto(user, "Nothing has been said yet.")
+			return
+		self.parent.sendto(user, format_lines(lines))
+
+class Grep(mounts.CommandMount):
+	name = 'grep'
+	rank = const.RANK_USER
+	file = __file__
+
+	__doc__ = "Show the last 20 lines said in the room using every word given. \n" \
+				"Usage: !grep <words>"
+
+	def thread(self, user, args):
+		query = args.strip().decode('utf-8', 'replace')
+		if not query:
+			raise const.CommandHelp
+
+		lines = history.search(query, 20)
+		if not lines:
+			self.parent.sendto(user, "Nobody has said that recently.")
+			return
+		self.parent.sendto(user, format_lines(lines))
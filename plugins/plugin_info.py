@@ -29,11 +29,11 @@
 
 import	datetime
 import	re
-import	shlex
 import	time
 
-from	common			import argparse, const, mounts, utils
+from	common			import cmdargs, const, mounts, utils
 from	common.ini		import iMan
+
 #from	common.utils	import *
 
 #module = get_module()
@@ -63,19 +63,17 @@ class Help(mounts.CommandMount):
 	rank = const.RANK_USER
 	file = __file__
 
-	help_parser = argparse.ArgumentParser(prog='!help', add_help=False,
-		epilog='''Options in <>'s are required.\n\
-			Options in []'s are optional.\n\
-			Don't include backets.''')
-	help_parser.add_argument('cmd', const=True, nargs='?',
-		metavar='command -', help='Display detailed information about a command.')
-
-	__doc__ = """Display this help message.\n%s""" % (help_parser.format_help())
-
+	argspec = cmdargs.ArgSpec('!help',
+		cmdargs.Arg('cmd', nargs='?', metavar='command -',
+			help='Display detailed information about a command.'),
+		epilog="Options in <>'s are required.\n"
+			"Options in []'s are optional.\n"
+			"Don't include backets.")
 
+	__doc__ = """Display this help message.\n%s""" % argspec.format_help()
 
 	def thread(self, user, args):
-		args = self.help_parser.parse_args(shlex.split(args))
+		args = self.parse_args(args)
 		if args.cmd:
 			if args.cmd in mounts.CommandMount.plugins.keys():
 				self.parent.sendto(user, mounts.CommandMount.plugins[args.cmd].__doc__)
@@ -123,13 +121,12 @@ class Names(mounts.CommandMount):
 	rank = const.RANK_USER
 	file = __file__
 
-	name_parser = argparse.ArgumentParser(prog='!w', add_help=False,
-	epilog='''Key:\n* '@' - Admin\n* '%%' - Mod\n* '-' - Away\n* '!' - Busyn\* '#' - Banned''')
-	name_parser.add_argument('nil', help=argparse.SUPPRESS)
-
-	#Setup the doc string with the help text from the argument parser.
-	__doc__ = """List status of users.\n%s""" % (name_parser.format_help())
+	argspec = cmdargs.ArgSpec('!w',
+		epilog="Key:\n* '@' - Admin\n* '%' - Mod\n* '-' - Away\n"
+			"* '!' - Busy\n* '#' - Banned")
 
+	#Setup the doc string with the help text from the argument spec.
+	__doc__ = """List status of users.\n%s""" % argspec.format_help()
 
 	def thread(self, user, args):
 		statuses ={
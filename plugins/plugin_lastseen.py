@@ -30,10 +30,9 @@
 import	datetime
 import	random
 import	re
-import	shlex
 import	time
 
-from	common import argparse, const, mounts, utils
+from	common import cmdargs, const, mounts, utils
 from	common.ini import iMan
 
 class Init(mounts.PluginInitializers):
@@ -201,24 +200,17 @@ class LastSeen(mounts.CommandMount):
 			truncate_to = iMan.plugin_lastseen.truncate_to
 		iMan.unload('plugin_lastseen')
 
-	lastseen_parser = argparse.ArgumentParser(prog='!lastseen', add_help=False)
-	lastseen_parser.add_argument('username', const=True, nargs='?',
-		metavar='username', help='Name of the user you\'re looking up.')
+	argspec = cmdargs.ArgSpec('!lastseen',
+		cmdargs.Arg('username', nargs='?',
+			help='Name of the user you\'re looking up.'))
 
-	__doc__ = """Display the last time a user was on.\n%s""" % (lastseen_parser.format_help())
+	__doc__ = """Display the last time a user was on.\n%s""" % argspec.format_help()
 
 	def thread(self, user, args, whisper):
+		args = self.parse_args(args).username
 		# Sterilize the name to prevent abuse.
-		if self.truncate_to:
-			if ' ' in args:
-				args, _ = args.split(' ', 1)
-			if len(args) > self.truncate_to:
-				args = args[:self.truncate_to]
-		elif False:
-			try:
-				args = self.lastseen_parser.parse_args(shlex.split(args))
-			except:
-				args = None
+		if args and self.truncate_to:
+			args = args[:self.truncate_to]
 
 		if not args:
 			raise const.CommandHelp
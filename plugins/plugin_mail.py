@@ -28,25 +28,80 @@
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import	datetime
+import	logging
 import	operator
+import	os
 import	random
 import	re
-import	shlex
 import	threading
 
-from	common			import argparse, const, mounts, utils
+from	common			import cmdargs, const, mounts, utils
 from	common.ini		import iMan
+from	common.mailbox	import MailStore
+
+_mail_log = logging.getLogger('pygab.plugin.mail')
+
+# Notifications queued by HookMail, sent in batches by the mail_notify timer.
+# username -> jid, so a user flapping online only gets one notice.
+_pending_notices = {}
+# The most notifications sent each time the timer runs.
+NOTICE_BATCH_SIZE = 25
+
+mailbox = MailStore(os.path.join('.', utils.get_module(), 'mail.journal'))
+# The bot running the mail_notify timer, None until start_mail is called.
+_notifier = None
+
+def mail_notify(bot):
+	"""Send queued "you've got mail" notices, a batch at a time."""
+	for username in _pending_notices.keys()[:NOTICE_BATCH_SIZE]:
+		user = _pending_notices.pop(username)
+		count = mailbox.count(username)
+		if not count:
+			continue
+		bot.sendto(
+			user, "You've got %d new message%s. "
+			"Please type '/w %s !mail get' to read it." %
+			(count, utils.pluralize(count), iMan.config.server.displayname)
+		)
+
+def start_mail(bot):
+	"""start_mail(BotFramework bot) -> None
+
+	Load the mailbox and start sending notices, unless that's already done.
+	Called by the initializer and again the first time the hook or command
+	runs, in case the bot didn't run the initializer.
+
+	"""
+	global _notifier
+	if _notifier is not None:
+		return
+	_notifier = bot
+
+	# Move letters out of the old mail.ini the first time we run.
+	first_run = not mailbox.exists()
+	mailbox.load()
+	if first_run and iMan.load([utils.get_module(), 'mail']):
+		imported = mailbox.import_ini(iMan.mail)
+		iMan.unload('mail', save=False)
+		if imported:
+			_mail_log.info("Imported %d letters from mail.ini" % imported)
+
+	bot.addTimer(1, mail_notify, type='seconds', args=[bot])
 
 class Init(mounts.PluginInitializers):
 	name = __file__
 
 	def initialize(self):
 		iMan.load([utils.get_module(), 'roster'])
-		iMan.load([utils.get_module(), 'mail'])
+		start_mail(self.parent)
 
 	def __exit__(self, *args):
+		global _notifier
+		if _notifier is not None:
+			_notifier.removeTimer('mail_notify')
+			_notifier = None
+		mailbox.close()
 		iMan.unload('roster')
-		iMan.unload('mail')
 		mounts.PluginInitializers.remove(self.__class__)
 
 
@@ -64,16 +119,10 @@ def delay_hookmail():
 		priority = const.PRIORITY_PERSISTANT
 
 		def thread(self, user, status):
+			start_mail(self.parent)
 			username = utils.getname(user).lower()
-			if username in iMan.mail:
-				def f():
-					self.parent.sendto(
-						user, "You've got %d new messages. "
-						"Please type '/w %s !mail get' to read it." %
-						(len(iMan.mail[username].keys()), iMan.config.server.displayname)
-					)
-				self.parent.addTimer(1, f, 0, type='seconds')
-				return
+			if username in mailbox:
+				_pending_notices[username] = user
 t = threading.Timer(10.0, delay_hookmail)
 t.start()
 
@@ -83,27 +132,18 @@ class Mail(mounts.CommandMount):
 	rank = const.RANK_USER
 	file = __file__
 
-	arg_parser = argparse.ArgumentParser(prog='!mail', add_help=False)
-	arg_parser.add_argument(
-		'message',
-		default=False, nargs='*',
-		metavar='message', help='Mail message'
-	)
-	arg_parser.add_argument(
-		'-g', '--get',
-		action='store_true',
-		help='Get the next message on your box'
-	)
-	arg_parser.add_argument(
-		'-t', '--to',
-		default=False, nargs='?',
-		metavar='recipient', help='recipent of your message'
+	argspec = cmdargs.ArgSpec('!mail',
+		cmdargs.Arg('message', nargs='*', default=False, help='Mail message'),
+		cmdargs.Option('-g', '--get', help='Get the next message on your box'),
+		cmdargs.Option('-t', '--to', nargs='?', default=False, const=None,
+			metavar='recipient', help='recipent of your message'),
 	)
 
 	__doc__ = "Send a single message to a user next time they login. \n" \
 				"Usage: !mail <get|check|username message> "
 
 	def thread(self, user, args, whisper):
+		start_mail(self.parent)
 		if not args:
 			raise const.CommandHelp
 		args = args.split(' ', 1)
@@ -112,27 +152,21 @@ class Mail(mounts.CommandMount):
 		username = utils.getname(user).lower()
 
 		if cmd == 'get':
-			if username in iMan.mail:
-				letters = iMan.mail[username].items()
-				# Only take the top letter.
-				sender, message = letters[0]
+			letter = mailbox.pop(username)
+			if letter:
+				sender, message = letter
+				remaining = mailbox.count(username)
 
 				self.parent.sendto(user, "%s says '%s'" % (sender, message))
 				self.parent.sendto(
 					user, "You have %s more letter%s." %
-						((len(letters) - 1) or 'no',
-						((len(letters) - 1) != 1 and 's') or ''
-					)
+						(remaining or 'no', utils.pluralize(remaining))
 				)
-
-				del iMan.mail[username][sender]
-				if not iMan.mail[username]:
-					del iMan.mail[username]
 			else:
 				self.parent.sendto(user, "I have no letters for you.")
 
 		elif cmd == 'check':
-			letters = len(iMan.mail.get(username, []))
+			letters = mailbox.count(username)
 			self.parent.sendto(
 				user, 'I have %s letter%s for you.' % (
 					letters or 'no',
@@ -151,7 +185,7 @@ class Mail(mounts.CommandMount):
 				self.parent.sendto(user, "I don't know %s and, therefore, "
 								   "can't send him a letter." % cmd)
 			else:
-				iMan.mail[target][utils.getname(user)] = ' '.join(message)
+				mailbox.put(target, utils.getname(user), ' '.join(message))
 				target_jid = utils.getjid(target)
 				if self.parent.was_whispered and \
 					utils.isonline(self.parent, target_jid):
@@ -164,5 +198,3 @@ class Mail(mounts.CommandMount):
 				else:
 					self.parent.sendto(user, "I have mailed your message to %s. "
 								   "He will notified it when he logs in." % cmd)
-
-		iMan.mail.save()
@@ -30,10 +30,9 @@
 import	datetime
 import	random
 import	re
-import	shlex
 import	time
 
-from	common			import argparse, const, mounts, utils
+from	common			import const, mounts, utils
 from	common.ini		import iMan
 
 class Init(mounts.PluginInitializers):
@@ -31,10 +31,9 @@ import	datetime
 import	operator
 import	random
 import	re
-import	shlex
 import	threading
 
-from	common			import argparse, const, mounts, utils
+from	common			import const, mounts, utils
 from	common.ini		import	iMan
 #from	common.utils	import	*
 
@@ -26,6 +26,21 @@ and use only methods for access all values you should not have any problems.
 
 """
 
-import simplexml,protocol,debug,auth,transports,roster,dispatcher,features,browser,filetransfer,commands
+import simplexml,protocol,debug,auth,transports,roster,dispatcher,features
+
+class _LazyModule:
+    """ Stands in for a submodule that few clients use (disco server, IBB, ad-hoc commands)
+        and imports it the first time one of its attributes is accessed.
+        Importing the submodule directly ("import xmpp.browser") works as usual. """
+    def __init__(self,name):
+        self._name=name
+    def __getattr__(self,attr):
+        module=__import__('%s.%s'%(__name__,self._name),globals(),locals(),[self._name])
+        globals()[self._name]=module
+        return getattr(module,attr)
+
+browser=_LazyModule('browser')
+filetransfer=_LazyModule('filetransfer')
+commands=_LazyModule('commands')
 from client import *
 from protocol import *
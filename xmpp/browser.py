@@ -26,6 +26,16 @@ automatically called when user requests some node of your disco tree.
 from dispatcher import *
 from client import PlugIn
 
+class _Prepared:
+    """ Already serialised reply payload. Placed among a node's children it is
+        written out as is. Used internally. """
+    def __init__(self,text):
+        self.text=text
+    def __str__(self):
+        return self.text
+    def __nonzero__(self):
+        return bool(self.text)
+
 class Browser(PlugIn):
     """ WARNING! This class is for components only. It will not work in client mode!
 
@@ -76,6 +86,9 @@ class Browser(PlugIn):
         info={'ids':ids,'features':features}
         # info['xdata']=xmpp.protocol.DataForm() # JEP-0128
         b.setDiscoHandler({'items':[],'info':info})
+
+        Replies for static info are serialised once and reused, so if you change
+        a registered dictionary call setDiscoHandler with it again.
     """
     def __init__(self):
         """Initialises internal variables. Used internally."""
@@ -83,6 +96,8 @@ class Browser(PlugIn):
         DBG_LINE='browser'
         self._exported_methods=[]
         self._handlers={'':{}}
+        self._resolved={}       # (node, jid) -> handler
+        self._prepared={}       # (id(static handler), ns) -> serialised payload
 
     def plugin(self, owner):
         """ Registers it's own iq handlers in your application dispatcher instance.
@@ -160,6 +175,7 @@ class Browser(PlugIn):
         self.DEBUG('Registering handler %s for "%s" node->%s'%(handler,jid,node), 'info')
         node,key=self._traversePath(node,jid,1)
         node[key]=handler
+        self._invalidate()
 
     def getDiscoHandler(self,node='',jid=''):
         """ Returns the previously registered DISCO handler
@@ -177,8 +193,49 @@ class Browser(PlugIn):
         if node:
             handler=node[key]
             del node[dict][node[str]]
+            self._invalidate()
             return handler
 
+    def _invalidate(self):
+        """ Forgets resolved handlers and prepared replies after the tree changed.
+            Used internally."""
+        self._resolved.clear()
+        self._prepared.clear()
+
+    def _resolveHandler(self,node,jid):
+        """ getDiscoHandler, remembering the answer until the tree changes. Used internally."""
+        key=(node,unicode(jid))
+        try: return self._resolved[key]
+        except KeyError: pass
+        handler=self.getDiscoHandler(node,jid)
+        # Requests can name any node, don't let them grow this without bound.
+        if len(self._resolved)>=1000: self._resolved.clear()
+        self._resolved[key]=handler
+        return handler
+
+    def _preparedPayload(self,handler,ns):
+        """ Returns the serialised payload of the reply for a static handler, or None
+            if there is nothing to reply with. Used internally."""
+        key=(id(handler),ns)
+        if self._prepared.has_key(key): return self._prepared[key]
+        q=Node('query')
+        if ns==NS_DISCO_ITEMS: self._addItems(q,handler['items'])
+        else: self._addInfo(q,handler['info'])
+        payload=None
+        if q.kids: payload=_Prepared(''.join([unicode(kid) for kid in q.kids]))
+        self._prepared[key]=payload
+        return payload
+
+    def _addItems(self,q,lst):
+        for item in lst: q.addChild('item',item)
+
+    def _addInfo(self,q,dt):
+        # handler must return dictionary:
+        # {'ids':[{},{},{},{}], 'features':[fe,at,ur,es], 'xdata':DataForm}
+        for id in dt['ids']: q.addChild('identity',id)
+        for feature in dt['features']: q.addChild('feature',{'var':feature})
+        if dt.has_key('xdata'): q.addChild(node=dt['xdata'])
+
     def _DiscoveryHandler(self,conn,request):
         """ Servers DISCO iq request from the remote client.
             Automatically determines the best handler to use and calls it
@@ -189,7 +246,7 @@ class Browser(PlugIn):
             nodestr=node
         else:
             nodestr='None'
-        handler=self.getDiscoHandler(node,request.getTo())
+        handler=self._resolveHandler(node,request.getTo())
         if not handler:
             self.DEBUG("No Handler for request with jid->%s node->%s ns->%s"%(request.getTo().__str__().encode('utf8'),nodestr.encode('utf8'),request.getQueryNS().encode('utf8')),'error')
             conn.send(Error(request,ERR_ITEM_NOT_FOUND))
@@ -198,24 +255,26 @@ class Browser(PlugIn):
         rep=request.buildReply('result')
         if node: rep.setQuerynode(node)
         q=rep.getTag('query')
-        if request.getQueryNS()==NS_DISCO_ITEMS:
+        ns=request.getQueryNS()
+        if type(handler)==dict and ns in (NS_DISCO_ITEMS,NS_DISCO_INFO):
+            # Static info, only the addressing differs between replies.
+            if handler[ns==NS_DISCO_ITEMS and 'items' or 'info']==None:
+                conn.send(Error(request,ERR_ITEM_NOT_FOUND))
+                raise NodeProcessed
+            payload=self._preparedPayload(handler,ns)
+            if payload: q.kids.append(payload)
+        elif ns==NS_DISCO_ITEMS:
             # handler must return list: [{jid,action,node,name}]
-            if type(handler)==dict: lst=handler['items']
-            else: lst=handler(conn,request,'items')
+            lst=handler(conn,request,'items')
             if lst==None:
                 conn.send(Error(request,ERR_ITEM_NOT_FOUND))
                 raise NodeProcessed
-            for item in lst: q.addChild('item',item)
-        elif request.getQueryNS()==NS_DISCO_INFO:
-            if type(handler)==dict: dt=handler['info']
-            else: dt=handler(conn,request,'info')
+            self._addItems(q,lst)
+        elif ns==NS_DISCO_INFO:
+            dt=handler(conn,request,'info')
             if dt==None:
                 conn.send(Error(request,ERR_ITEM_NOT_FOUND))
                 raise NodeProcessed
-            # handler must return dictionary:
-            # {'ids':[{},{},{},{}], 'features':[fe,at,ur,es], 'xdata':DataForm}
-            for id in dt['ids']: q.addChild('identity',id)
-            for feature in dt['features']: q.addChild('feature',{'var':feature})
-            if dt.has_key('xdata'): q.addChild(node=dt['xdata'])
+            self._addInfo(q,dt)
         conn.send(rep)
         raise NodeProcessed
@@ -25,9 +25,136 @@ All these methods takes 'disp' first argument that should be already connected
 """
 
 from protocol import *
+from collections import deque
+import base64,time
+try: from hashlib import sha1
+except ImportError: from sha import new as sha1
 
 REGISTER_DATA_RECEIVED='REGISTER DATA RECEIVED'
 
+class DiscoCache:
+    """ Remembers disco results keyed by (jid, node, namespace) for 'ttl' seconds,
+        holding at most 'size' of them with the least recently used dropped first.
+        Entity capabilities (XEP-0115) announced in presence are remembered per JID
+        and disco#info results for them are also stored under the caps 'ver', so every
+        client running the same software shares one entry. A verified caps hash never
+        changes meaning, so those entries don't expire. """
+    def __init__(self,size=500,ttl=3600):
+        self.size=size
+        self.ttl=ttl
+        self._entries={}        # key -> [payload, expires, stamp]
+        self._used=deque()      # (key, stamp) in the order keys were used
+        self._stamp=0
+        self._caps={}           # full jid -> (caps key, caps node#ver)
+        self.stats={'hits':0,'misses':0,'evicted':0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _touch(self,key,entry):
+        self._stamp+=1
+        entry[2]=self._stamp
+        self._used.append((key,self._stamp))
+        if len(self._used)>self.size*4:
+            # Most of the queue is stale, keep only the latest use of each key.
+            self._used=deque([(k,e[2]) for k,e in sorted(self._entries.items(),key=lambda i: i[1][2])])
+
+    def _get(self,key):
+        entry=self._entries.get(key)
+        if entry is None: return None
+        if entry[1] is not None and entry[1]<time.time():
+            del self._entries[key]
+            return None
+        self._touch(key,entry)
+        return entry[0]
+
+    def _put(self,key,payload,ttl):
+        expires=None
+        if ttl is not None: expires=time.time()+ttl
+        entry=self._entries[key]=[payload,expires,0]
+        self._touch(key,entry)
+        while len(self._entries)>self.size:
+            old,stamp=self._used.popleft()
+            if self._entries.has_key(old) and self._entries[old][2]==stamp:
+                del self._entries[old]
+                self.stats['evicted']+=1
+
+    def get(self,jid,node,ns):
+        """ Returns the cached payload for the query or None. """
+        jid=unicode(jid)
+        payload=self._get((jid,node,ns))
+        if payload is None and ns==NS_DISCO_INFO and not node and self._caps.has_key(jid):
+            payload=self._get(self._caps[jid][0])
+        if payload is None: self.stats['misses']+=1
+        else: self.stats['hits']+=1
+        return payload
+
+    def put(self,jid,node,ns,payload):
+        """ Stores a query's payload. disco#info for a JID with known caps is also
+            stored under the caps key, if its hash checks out. """
+        jid=unicode(jid)
+        self._put((jid,node,ns),payload,self.ttl)
+        if ns!=NS_DISCO_INFO or not self._caps.has_key(jid): return
+        key,capsnode=self._caps[jid]
+        if node and node!=capsnode: return
+        if key[0]=='hash':
+            if key[2]!=capsHash(payload,key[1]): return
+            self._put(key,payload,None)
+        else: self._put(key,payload,self.ttl)
+
+    def capsNode(self,jid):
+        """ Returns the 'node#ver' to query for 'jid' capabilities or None. """
+        caps=self._caps.get(unicode(jid))
+        if caps: return caps[1]
+
+    def features(self,jid):
+        """ Returns the features 'jid' is known to support without asking it,
+            or None if nothing is known. """
+        jid=unicode(jid)
+        payload=self._get((jid,None,NS_DISCO_INFO))
+        if payload is None and self._caps.has_key(jid): payload=self._get(self._caps[jid][0])
+        if payload is None: return None
+        return [n.getAttr('var') for n in payload if n.getName()=='feature']
+
+    def forget(self,jid):
+        """ Drops everything known about 'jid'. """
+        jid=unicode(jid)
+        if self._caps.has_key(jid): del self._caps[jid]
+        for key in [k for k in self._entries.keys() if k[0]==jid]: del self._entries[key]
+
+    def PresenceHandler(self,dis,pres):
+        """ Learns entity capabilities from presence. Register with 'system' set
+            so it sees every presence. """
+        jid=unicode(pres.getFrom())
+        if pres.getType()=='unavailable':
+            if self._caps.has_key(jid): del self._caps[jid]
+            return
+        c=pres.getTag('c',namespace=NS_CAPS)
+        if c is None or not c.getAttr('ver'): return
+        node,ver,algo=c.getAttr('node'),c.getAttr('ver'),c.getAttr('hash')
+        if algo=='sha-1': key=('hash',algo,ver)
+        else: key=('legacy',node,ver)   # Pre 1.5 caps, 'ver' is only unique per node.
+        self._caps[jid]=(key,'%s#%s'%(node,ver))
+
+def capsHash(payload,algo='sha-1'):
+    """ Returns the XEP-0115 verification string of a disco#info payload, or None
+        if it can't be computed (unsupported hash or extended info forms). """
+    if algo!='sha-1': return None
+    identities,features=[],[]
+    for n in payload:
+        if n.getName()=='identity':
+            identities.append('%s/%s/%s/%s'%(n.getAttr('category') or '',n.getAttr('type') or '',
+                n.getAttr('xml:lang') or '',n.getAttr('name') or ''))
+        elif n.getName()=='feature': features.append(n.getAttr('var'))
+        elif n.getName()=='x': return None
+    identities.sort()
+    features.sort()
+    s=''.join([i+'<' for i in identities]+[f+'<' for f in features])
+    return base64.b64encode(sha1(s.encode('utf-8')).digest())
+
+# Shared by every connection, disco results describe the remote entity.
+cache=DiscoCache()
+
 ### DISCO ### http://jabber.org/protocol/disco ### JEP-0030 ####################
 ### Browse ### jabber:iq:browse ### JEP-0030 ###################################
 ### Agents ### jabber:iq:agents ### JEP-0030 ###################################
@@ -35,13 +162,26 @@ def _discover(disp,ns,jid,node=None,fb2b=0,fb2a=1):
     """ Try to obtain info from the remote object.
         If remote object doesn't support disco fall back to browse (if fb2b is true)
         and if it doesnt support browse (or fb2b is not true) fall back to agents protocol
-        (if gb2a is true). Returns obtained info. Used internally. """
+        (if gb2a is true). Returns obtained info. Used internally.
+        Results are kept in the module's DiscoCache, see 'cache', under the namespace
+        that answered. """
+    namespaces=[ns]
+    if fb2b: namespaces.append(NS_BROWSE)
+    if fb2a: namespaces.append(NS_AGENTS)
+    for answered in namespaces:
+        payload=cache.get(jid,node,answered)
+        if payload is not None: return list(payload)
     iq=Iq(to=jid,typ='get',queryNS=ns)
     if node: iq.setQuerynode(node)
+    elif ns==NS_DISCO_INFO and cache.capsNode(jid):
+        iq.setQuerynode(cache.capsNode(jid))   # XEP-0115, the answer is the same for every client announcing it.
     rep=disp.SendAndWaitForResponse(iq)
     if fb2b and not isResultNode(rep): rep=disp.SendAndWaitForResponse(Iq(to=jid,typ='get',queryNS=NS_BROWSE))   # Fallback to browse
     if fb2a and not isResultNode(rep): rep=disp.SendAndWaitForResponse(Iq(to=jid,typ='get',queryNS=NS_AGENTS))   # Fallback to agents
-    if isResultNode(rep): return [n for n in rep.getQueryPayload() if isinstance(n, Node)]
+    if isResultNode(rep):
+        payload=[n for n in rep.getQueryPayload() if isinstance(n, Node)]
+        cache.put(jid,node,rep.getQueryNS() or ns,payload)
+        return list(payload)
     return []
 
 def discoverItems(disp,jid,node=None):
@@ -52,8 +192,9 @@ def discoverItems(disp,jid,node=None):
         action attribute of item can be either of remove or update value."""
     ret=[]
     for i in _discover(disp,NS_DISCO_ITEMS,jid,node):
-        if i.getName()=='agent' and i.getTag('name'): i.setAttr('name',i.getTagData('name'))
-        ret.append(i.attrs)
+        attrs=i.attrs.copy()    # The nodes are shared through the cache, leave them alone.
+        if i.getName()=='agent' and i.getTag('name'): attrs['name']=i.getTagData('name')
+        ret.append(attrs)
     return ret
 
 def discoverInfo(disp,jid,node=None):
@@ -64,12 +205,13 @@ def discoverInfo(disp,jid,node=None):
         feature: MUST HAVE var attribute"""
     identities , features = [] , []
     for i in _discover(disp,NS_DISCO_INFO,jid,node):
-        if i.getName()=='identity': identities.append(i.attrs)
+        if i.getName()=='identity': identities.append(i.attrs.copy())
         elif i.getName()=='feature': features.append(i.getAttr('var'))
         elif i.getName()=='agent':
-            if i.getTag('name'): i.setAttr('name',i.getTagData('name'))
-            if i.getTag('description'): i.setAttr('name',i.getTagData('description'))
-            identities.append(i.attrs)
+            attrs=i.attrs.copy()
+            if i.getTag('name'): attrs['name']=i.getTagData('name')
+            if i.getTag('description'): attrs['name']=i.getTagData('description')
+            identities.append(attrs)
             if i.getTag('groupchat'): features.append(NS_GROUPCHAT)
             if i.getTag('register'): features.append(NS_REGISTER)
             if i.getTag('search'): features.append(NS_SEARCH)
@@ -22,7 +22,32 @@ Note that this is just a transport for data. You have to negotiate data transfer
 
 from protocol import *
 from dispatcher import PlugIn
-import base64
+import base64,mmap
+
+class _BlockReader:
+    """ Reads a file one block at a time, through mmap if the file allows it.
+        Used internally. """
+    def __init__(self,fp,blocksize):
+        self.fp=fp
+        self.blocksize=blocksize
+        try:
+            self._map=mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ)
+            self._pos=fp.tell()
+        except (AttributeError,EnvironmentError,ValueError):
+            # Not a real file (or an empty one), read it the usual way.
+            self._map=None
+
+    def read(self):
+        if self._map is None: return self.fp.read(self.blocksize)
+        chunk=self._map[self._pos:self._pos+self.blocksize]
+        self._pos+=len(chunk)
+        return chunk
+
+    def close(self):
+        if self._map is None: return
+        self._map.close()
+        self._map=None
+        self.fp.seek(self._pos)
 
 class IBB(PlugIn):
     """ IBB used to transfer small-sized data chunk over estabilished xmpp connection.
@@ -30,6 +55,8 @@ class IBB(PlugIn):
         and sent to another entity that compiles these blocks back into the data chunk.
         This is very inefficiend but should work under any circumstances. Note that 
         using IBB normally should be the last resort.
+        Blocks are sent in <iq/> stanzas and up to 'window' of them may be waiting to
+        be acknowledged at once. Blocks sent in <message/> stanzas are received too.
     """
     def __init__(self):
         """ Initialise internal variables. """
@@ -41,7 +68,6 @@ class IBB(PlugIn):
 
     def plugin(self,owner):
         """ Register handlers for receiving incoming datastreams. Used internally. """
-        self._owner.RegisterHandlerOnce('iq',self.StreamOpenReplyHandler) # Move to StreamOpen and specify stanza id
         self._owner.RegisterHandler('iq',self.IqHandler,ns=NS_IBB)
         self._owner.RegisterHandler('message',self.ReceiveHandler,ns=NS_IBB)
 
@@ -49,10 +75,10 @@ class IBB(PlugIn):
         """ Handles streams state change. Used internally. """
         typ=stanza.getType()
         self.DEBUG('IqHandler called typ->%s'%typ,'info')
-        if typ=='set' and stanza.getTag('open',namespace=NS_IBB): self.StreamOpenHandler(conn,stanza)
+        if typ=='set' and stanza.getTag('data',namespace=NS_IBB): self.DataIqHandler(conn,stanza)
+        elif typ=='set' and stanza.getTag('open',namespace=NS_IBB): self.StreamOpenHandler(conn,stanza)
         elif typ=='set' and stanza.getTag('close',namespace=NS_IBB): self.StreamCloseHandler(conn,stanza)
-        elif typ=='result': self.StreamCommitHandler(conn,stanza)
-        elif typ=='error': self.StreamOpenReplyHandler(conn,stanza)
+        elif typ in ('result','error'): self.StreamOpenReplyHandler(conn,stanza)
         else: conn.send(Error(stanza,ERR_BAD_REQUEST))
         raise NodeProcessed
 
@@ -82,43 +108,47 @@ class IBB(PlugIn):
             self._streams[sid]={'direction':'<'+str(stanza.getFrom()),'block-size':blocksize,'fp':open('/tmp/xmpp_file_'+sid,'w'),'seq':0,'syn_id':stanza.getID()}
         conn.send(rep)
 
-    def OpenStream(self,sid,to,fp,blocksize=3000):
+    def OpenStream(self,sid,to,fp,blocksize=3000,window=16):
         """ Start new stream. You should provide stream id 'sid', the endpoind jid 'to',
             the file object containing info for send 'fp'. Also the desired blocksize can be specified.
             Take into account that recommended stanza size is 4k and IBB uses base64 encoding
-            that increases size of data by 1/3."""
+            that increases size of data by 1/3.
+            'window' is the number of blocks that may be sent before the first is acknowledged."""
         if sid in self._streams.keys(): return
         if not JID(to).getResource(): return
-        self._streams[sid]={'direction':'|>'+to,'block-size':blocksize,'fp':fp,'seq':0}
+        self._streams[sid]={'direction':'|>'+to,'block-size':blocksize,'fp':fp,'seq':0,
+            'reader':_BlockReader(fp,blocksize),'window':max(window,1),'inflight':{},'eof':0}
         self._owner.RegisterCycleHandler(self.SendHandler)
-        syn=Protocol('iq',to,'set',payload=[Node(NS_IBB+' open',{'sid':sid,'block-size':blocksize})])
-        self._owner.send(syn)
+        syn=Protocol('iq',to,'set',payload=[Node(NS_IBB+' open',{'sid':sid,'block-size':blocksize,'stanza':'iq'})])
+        self._owner.SendAndCallForResponse(syn,self.StreamOpenReplyHandler)
         self._streams[sid]['syn_id']=syn.getID()
         return self._streams[sid]
 
     def SendHandler(self,conn):
-        """ Send next portion of data if it is time to do it. Used internally. """
+        """ Send blocks until each stream's window is full. Used internally. """
         self.DEBUG('SendHandler called','info')
         for sid in self._streams.keys():
             stream=self._streams[sid]
-            if stream['direction'][:2]=='|>': cont=1
-            elif stream['direction'][0]=='>':
-                chunk=stream['fp'].read(stream['block-size'])
-                if chunk:
-                    datanode=Node(NS_IBB+' data',{'sid':sid,'seq':stream['seq']},base64.encodestring(chunk))
-                    stream['seq']+=1
-                    if stream['seq']==65536: stream['seq']=0
-                    conn.send(Protocol('message',stream['direction'][1:],payload=[datanode,self._ampnode]))
-                else:
-                    """ notify the other side about stream closing
-                        notify the local user about sucessfull send
-                        delete the local stream"""
-                    conn.send(Protocol('iq',stream['direction'][1:],'set',payload=[Node(NS_IBB+' close',{'sid':sid})]))
-                    conn.Event(self.DBG_LINE,'SUCCESSFULL SEND',stream)
-                    del self._streams[sid]
-                    self._owner.UnregisterCycleHandler(self.SendHandler)
+            if stream['direction'][0]!='>': continue
+            to=stream['direction'][1:]
+            inflight=stream['inflight']
+            while not stream['eof'] and len(inflight)<stream['window']:
+                chunk=stream['reader'].read()
+                if not chunk:
+                    stream['eof']=1
+                    break
+                # b64encode doesn't add line breaks, unlike encodestring.
+                datanode=Node(NS_IBB+' data',{'sid':sid,'seq':stream['seq']},base64.b64encode(chunk))
+                iq=Protocol('iq',to,'set',payload=[datanode])
+                conn.SendAndCallForResponse(iq,self.DataAckHandler,{'sid':sid})
+                inflight[iq.getID()]=stream['seq']
+                stream['seq']+=1
+                if stream['seq']==65536: stream['seq']=0
+            if stream['eof'] and not inflight: self._closeSend(conn,sid,'SUCCESSFULL SEND')
+        if not [1 for stream in self._streams.values() if '>' in stream['direction'][:2]]:
+            self._owner.UnregisterCycleHandler(self.SendHandler)
 
-                    """
+        """
 <message from='romeo@montague.net/orchard' to='juliet@capulet.com/balcony' id='msg1'>
   <data xmlns='http://jabber.org/protocol/ibb' sid='mySID' seq='0'>
     qANQR1DBwU4DX7jmYZnncmUQB/9KuKBddzQH+tZ1ZywKK0yHKnq57kWq+RFtQdCJ
@@ -134,28 +164,59 @@ class IBB(PlugIn):
 </message>
 """
 
+    def _closeSend(self,conn,sid,event):
+        """ notify the other side about stream closing
+            notify the local user with 'event'
+            delete the local stream, releasing its reader. Used internally. """
+        stream=self._streams.pop(sid)
+        stream['reader'].close()
+        to=stream['direction'].lstrip('|')[1:]
+        conn.send(Protocol('iq',to,'set',payload=[Node(NS_IBB+' close',{'sid':sid})]))
+        conn.Event(self.DBG_LINE,event,stream)
+
+    def _storeBlock(self,stanza):
+        """ Decode the data block carried by stanza and append it to its stream.
+            Returns error condition if the block can't be accepted. Used internally. """
+        sid,seq,data=stanza.getTagAttr('data','sid'),stanza.getTagAttr('data','seq'),stanza.getTagData('data')
+        self.DEBUG('Block received sid->%s seq->%s'%(sid,seq),'info')
+        try: seq=int(seq); data=base64.b64decode(data)
+        except: seq=''; data=''
+        if not sid in self._streams.keys(): return ERR_ITEM_NOT_FOUND
+        stream=self._streams[sid]
+        if not data: return ERR_BAD_REQUEST
+        if seq<>stream['seq']: return ERR_UNEXPECTED_REQUEST
+        self.DEBUG('Successfull receive sid->%s %s+%s bytes'%(sid,stream['fp'].tell(),len(data)),'ok')
+        stream['seq']+=1
+        if stream['seq']==65536: stream['seq']=0
+        stream['fp'].write(data)
+
     def ReceiveHandler(self,conn,stanza):
         """ Receive next portion of incoming datastream and store it write
             it to temporary file. Used internally.
         """
-        sid,seq,data=stanza.getTagAttr('data','sid'),stanza.getTagAttr('data','seq'),stanza.getTagData('data')
-        self.DEBUG('ReceiveHandler called sid->%s seq->%s'%(sid,seq),'info')
-        try: seq=int(seq); data=base64.decodestring(data)
-        except: seq=''; data=''
-        err=None
-        if not sid in self._streams.keys(): err=ERR_ITEM_NOT_FOUND
-        else:
-            stream=self._streams[sid]
-            if not data: err=ERR_BAD_REQUEST
-            elif seq<>stream['seq']: err=ERR_UNEXPECTED_REQUEST
-            else:
-                self.DEBUG('Successfull receive sid->%s %s+%s bytes'%(sid,stream['fp'].tell(),len(data)),'ok')
-                stream['seq']+=1
-                stream['fp'].write(data)
+        err=self._storeBlock(stanza)
         if err:
             self.DEBUG('Error on receive: %s'%err,'error')
             conn.send(Error(Iq(to=stanza.getFrom(),frm=stanza.getTo(),payload=[Node(NS_IBB+' close')]),err,reply=0))
 
+    def DataIqHandler(self,conn,stanza):
+        """ Receive data block sent in <iq/> and acknowledge it. Used internally. """
+        err=self._storeBlock(stanza)
+        if err:
+            self.DEBUG('Error on receive: %s'%err,'error')
+            conn.send(Error(stanza,err))
+        else: conn.send(stanza.buildReply('result'))
+
+    def DataAckHandler(self,conn,stanza,sid):
+        """ Handle remote side acknowledgement of a data block, freeing a place
+            in the stream window. Used internally. """
+        if not sid in self._streams.keys(): return
+        stream=self._streams[sid]
+        if stanza.getType()=='result':
+            if stanza.getID() in stream['inflight']: del stream['inflight'][stanza.getID()]
+            return
+        self._closeSend(conn,sid,'ERROR ON SEND')
+
     def StreamCloseHandler(self,conn,stanza):
         """ Handle stream closure due to all data transmitted.
             Raise xmpppy event specifying successfull data receive. """
@@ -163,6 +224,7 @@ class IBB(PlugIn):
         self.DEBUG('StreamCloseHandler called sid->%s'%sid,'info')
         if sid in self._streams.keys():
             conn.send(stanza.buildReply('result'))
+            self._streams[sid]['fp'].close()
             conn.Event(self.DBG_LINE,'SUCCESSFULL RECEIVE',self._streams[sid])
             del self._streams[sid]
         else: conn.send(Error(stanza,ERR_ITEM_NOT_FOUND))
@@ -175,9 +237,10 @@ class IBB(PlugIn):
         for sid in self._streams.keys():
             stream=self._streams[sid]
             if stream['syn_id']==syn_id:
-                if stream['direction'][0]=='<': conn.Event(self.DBG_LINE,'ERROR ON RECEIVE',stream)
-                else: conn.Event(self.DBG_LINE,'ERROR ON SEND',stream)
-                del self._streams[sid]
+                if stream['direction'][0]=='<':
+                    conn.Event(self.DBG_LINE,'ERROR ON RECEIVE',stream)
+                    del self._streams[sid]
+                else: self._closeSend(conn,sid,'ERROR ON SEND')
 
     def StreamOpenReplyHandler(self,conn,stanza):
         """ Handle remote side reply about is it agree or not to receive our datastream.
@@ -189,9 +252,10 @@ class IBB(PlugIn):
             stream=self._streams[sid]
             if stream['syn_id']==syn_id:
                 if stanza.getType()=='error':
-                    if stream['direction'][0]=='<': conn.Event(self.DBG_LINE,'ERROR ON RECEIVE',stream)
-                    else: conn.Event(self.DBG_LINE,'ERROR ON SEND',stream)
-                    del self._streams[sid]
+                    if stream['direction'][0]=='<':
+                        conn.Event(self.DBG_LINE,'ERROR ON RECEIVE',stream)
+                        del self._streams[sid]
+                    else: self._closeSend(conn,sid,'ERROR ON SEND')
                 elif stanza.getType()=='result':
                     if stream['direction'][0]=='|':
                         stream['direction']=stream['direction'][1:]
@@ -11,6 +11,8 @@ Implemented commands as follows:
 
 """
 
+import re
+
 xep0106mapping = [
 	[' ' ,'20'],
 	['"' ,'22'],
@@ -22,18 +24,49 @@ xep0106mapping = [
 	['>' ,'3e'],
 	['@' ,'40']]
 
+_encode_map = dict([(char, '\\' + code) for char, code in xep0106mapping])
+_encode_map['\\'] = '\\5c'
+_decode_map = dict([(code, char) for char, code in xep0106mapping])
+_decode_map['5c'] = '\\'
+
+# A backslash that already looks like an escape has to be escaped itself.
+_encode_re = re.compile(r'\\(?=%s|5c)|[%s]' % (
+	'|'.join([code for char, code in xep0106mapping]),
+	re.escape(''.join([char for char, code in xep0106mapping]))))
+_decode_re = re.compile(r'\\(%s|5c)' % '|'.join([code for char, code in xep0106mapping]))
+
+def _encode(match):
+	return _encode_map[match.group()]
+
+def _decode(match):
+	return _decode_map[match.group(1)]
+
 def JIDEncode(str):
-	str = str.replace('\\5c', '\\5c5c')
-	for each in xep0106mapping:
-		str = str.replace('\\' + each[1], '\\5c' + each[1])
-	for each in xep0106mapping:
-		str = str.replace(each[0], '\\' + each[1])
-	return str
+	return _encode_re.sub(_encode, str)
 
 def JIDDecode(str):
-	for each in xep0106mapping:
-		str = str.replace('\\' + each[1], each[0])
-	return str.replace('\\5c', '\\')
+	if '\\' not in str:
+		return str
+	return _decode_re.sub(_decode, str)
+
+def _bulk(strs, convert):
+	"""Convert every string with one pass over them all."""
+	strs = list(strs)
+	if not strs:
+		return []
+	joined = '\n'.join(strs)
+	if joined.count('\n') != len(strs) - 1:
+		# A newline in one of them, do them one by one.
+		return [convert(each) for each in strs]
+	return convert(joined).split('\n')
+
+def JIDEncodeAll(strs):
+	"""Return the list of encoded forms of strs, such as the legacy names of a roster."""
+	return _bulk(strs, JIDEncode)
+
+def JIDDecodeAll(strs):
+	"""Return the list of decoded forms of strs."""
+	return _bulk(strs, JIDDecode)
 
 if __name__ == "__main__":
 	def test(before,valid):
@@ -55,3 +88,4 @@ if __name__ == "__main__":
 	test(r'foo\bar',r'foo\bar')
 	test(r'foob\41r',r'foob\41r')
 	test('here\'s_a wild_&_/cr%zy/_address@example.com',r'here\27s_a\20wild_\26_\2fcr%zy\2f_address\40example.com')
+	test(r'\5c5c@\\',r'\5c5c5c\40\\')
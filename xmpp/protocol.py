@@ -114,6 +114,7 @@ NS_REGISTER         ='jabber:iq:register'                                   # XE
 NS_RC               ='http://jabber.org/protocol/rc'                        # XEP-0146
 NS_ROSTER           ='jabber:iq:roster'                                     # RFC 3921
 NS_ROSTERX          ='http://jabber.org/protocol/rosterx'                   # XEP-0144
+NS_ROSTER_VER       ='urn:xmpp:features:rosterver'                          # XEP-0237
 NS_RPC              ='jabber:iq:rpc'                                        # XEP-0009
 NS_SASL             ='urn:ietf:params:xml:ns:xmpp-sasl'                     # RFC 3920
 NS_SEARCH           ='jabber:iq:search'                                     # XEP-0055
@@ -324,6 +325,7 @@ class JID:
 
 class Protocol(Node):
     """ A "stanza" object class. Contains methods that are common for presences, iqs and messages. """
+    _tagdata=None       # tag -> (child, its CDATA list, CDATA list length, getTagData result)
     def __init__(self, name=None, to=None, typ=None, frm=None, attrs={}, payload=[], timestamp=None, xmlns=None, node=None):
         """ Constructor, name is the name of the stanza i.e. 'message' or 'presence' or 'iq'.
             to is the value of 'to' attribure, 'typ' - 'type' attribute
@@ -358,6 +360,18 @@ class Protocol(Node):
     def getTimestamp(self):
         """ Return the timestamp in the 'yyyymmddThhmmss' format. """
         return self.timestamp
+    def _getTagData(self,tag):
+        """ Same as getTagData but remembers the result until the child or its CDATA changes.
+            Used by the accessors that handlers call several times per stanza. """
+        nodes=self._kids_named(tag)
+        if not nodes: return None
+        node=nodes[0]
+        if self._tagdata is None: self._tagdata={}
+        cached=self._tagdata.get(tag)
+        if cached and cached[0] is node and cached[1] is node.data and cached[2]==len(node.data): return cached[3]
+        value=node.getData()
+        self._tagdata[tag]=(node,node.data,len(node.data),value)
+        return value
     def getID(self):
         """ Return the value of the 'id' attribute. """
         return self.getAttr('id')
@@ -422,13 +436,13 @@ class Message(Protocol):
         if subject: self.setSubject(subject)
     def getBody(self):
         """ Returns text of the message. """
-        return self.getTagData('body')
+        return self._getTagData('body')
     def getSubject(self):
         """ Returns subject of the message. """
-        return self.getTagData('subject')
+        return self._getTagData('subject')
     def getThread(self):
         """ Returns thread of the message. """
-        return self.getTagData('thread')
+        return self._getTagData('thread')
     def setBody(self,val):
         """ Sets the text of the message. """
         self.setTagData('body',val)
@@ -458,13 +472,13 @@ class Presence(Protocol):
         if status: self.setStatus(status)
     def getPriority(self):
         """ Returns the priority of the message. """
-        return self.getTagData('priority')
+        return self._getTagData('priority')
     def getShow(self):
         """ Returns the show value of the message. """
-        return self.getTagData('show')
+        return self._getTagData('show')
     def getStatus(self):
         """ Returns the status string of the message. """
-        return self.getTagData('status')
+        return self._getTagData('status')
     def setPriority(self,val):
         """ Sets the priority of the message. """
         self.setTagData('priority',val)
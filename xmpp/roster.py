@@ -19,9 +19,59 @@ Simple roster implementation. Can be used though for different tasks like
 mass-renaming of contacts.
 """
 
+import ast,os
 from protocol import *
 from client import PlugIn
 
+class RosterCache:
+    """ Keeps a copy of the roster and its version on disk, so that after a reconnect
+        only the changes made since need to be fetched (roster versioning, XEP-0237).
+        Pushes are appended to the file as they arrive, a full roster rewrites it. """
+    def __init__(self,filename):
+        self.filename=filename
+
+    def load(self):
+        """ Returns (version, {jid: item}) from disk or (None, {}) if there is no usable cache. """
+        version,items=None,{}
+        if not os.path.exists(self.filename): return version,items
+        f=open(self.filename,'r')
+        try:
+            for line in f:
+                try: record=ast.literal_eval(line)
+                except (SyntaxError,ValueError): break      # A torn write, everything before it is fine.
+                try:
+                    if record[0]=='ver': version=record[1]
+                    elif record[0]=='item': items[record[1]]=record[2]
+                    elif record[0]=='remove' and items.has_key(record[1]): del items[record[1]]
+                except (IndexError,KeyError,TypeError): break   # Not a record we wrote, stop there too.
+        finally: f.close()
+        return version,items
+
+    def save(self,version,items):
+        """ Replaces the cache with a full roster. """
+        temp=self.filename+'.tmp'
+        f=open(temp,'w')
+        try:
+            for jid,item in items.items(): f.write('%r\n'%(('item',jid,item),))
+            f.write('%r\n'%(('ver',version),))
+        finally: f.close()
+        # os.rename won't replace an existing file on windows.
+        if os.name=='nt' and os.path.exists(self.filename): os.remove(self.filename)
+        os.rename(temp,self.filename)
+
+    def update(self,version,jid,item):
+        """ Appends a roster push. 'item' is None when the contact was removed. """
+        f=open(self.filename,'a')
+        try:
+            if item is None: f.write('%r\n'%(('remove',jid),))
+            else: f.write('%r\n'%(('item',jid,item),))
+            f.write('%r\n'%(('ver',version),))
+        finally: f.close()
+
+    def clear(self):
+        """ Forgets the cached roster. """
+        if os.path.exists(self.filename): os.remove(self.filename)
+
 class Roster(PlugIn):
     """ Defines a plenty of methods that will allow you to manage roster.
         Also automatically track presences from remote JIDs taking into 
@@ -30,13 +80,18 @@ class Roster(PlugIn):
         You can also use mapping interface for access to the internal representation of
         contacts in roster.
         """
-    def __init__(self):
-        """ Init internal variables. """
+    def __init__(self,cache=None):
+        """ Init internal variables. If 'cache' (a RosterCache) is given and the server
+            supports roster versioning the roster is kept on disk and only changes
+            are fetched after that. """
         PlugIn.__init__(self)
         self.DBG_LINE='roster'
         self._data = {}
         self.set=None
         self._exported_methods=[self.getRoster]
+        self.version=None
+        self._cache=cache
+        self._items={}      # The contacts that are really in the roster, as the server sent them.
 
     def plugin(self,owner,request=1):
         """ Register presence and subscription trackers in the owner's dispatcher.
@@ -49,37 +104,99 @@ class Roster(PlugIn):
 
     def Request(self,force=0):
         """ Request roster from server if it were not yet requested 
-            (or if the 'force' argument is set). """
-        if self.set is None: self.set=0
+            (or if the 'force' argument is set).
+            If the server supports roster versioning only the changes since the
+            roster we have are sent. """
+        if self.set is None:
+            self.set=0
+            if self._cache and self.versioning():
+                self.version,items=self._cache.load()
+                for jid,item in items.items(): self._setItem(jid,item)
+                if self.version is not None: self.DEBUG('Loaded roster version %s from cache'%self.version,'ok')
         elif not force: return
-        self._owner.send(Iq('get',NS_ROSTER))
+        iq=Iq('get',NS_ROSTER)
+        if self.versioning(): iq.getTag('query').setAttr('ver',self.version or '')
+        self._owner.SendAndCallForResponse(iq,self.RosterResultHandler)
         self.DEBUG('Roster requested from server','start')
 
+    def versioning(self):
+        """ Returns True if the server advertised roster versioning. """
+        features=self._owner.Dispatcher.Stream.features
+        return bool(features and features.getTag('ver',namespace=NS_ROSTER_VER))
+
     def getRoster(self):
         """ Requests roster from server if neccessary and returns self."""
         if not self.set: self.Request()
         while not self.set: self._owner.Process(10)
         return self
 
+    def RosterResultHandler(self,dis,stanza):
+        """ Handles the answer to Request. A versioned request is answered with an
+            empty result if the roster hasn't changed, or is followed by pushes. Used internally. """
+        if stanza.getType()=='error':
+            if self.version is None: return self._setFull(None)
+            # The server didn't like our version, start over without the cache.
+            self.DEBUG('Roster version %s refused, requesting full roster'%self.version,'warn')
+            self.version=None
+            if self._cache: self._cache.clear()
+            self._owner.SendAndCallForResponse(Iq('get',NS_ROSTER),self.RosterResultHandler)
+            return
+        self._setFull(stanza.getTag('query'))
+
     def RosterIqHandler(self,dis,stanza):
         """ Subscription tracker. Used internally for setting items state in
             internal roster representation. """
-        for item in stanza.getTag('query').getTags('item'):
-            jid=item.getAttr('jid')
-            if item.getAttr('subscription')=='remove':
-                if self._data.has_key(jid): del self._data[jid]
-                raise NodeProcessed             # a MUST
-            self.DEBUG('Setting roster item %s...'%jid,'ok')
-            if not self._data.has_key(jid): self._data[jid]={}
-            self._data[jid]['name']=item.getAttr('name')
-            self._data[jid]['ask']=item.getAttr('ask')
-            self._data[jid]['subscription']=item.getAttr('subscription')
-            self._data[jid]['groups']=[]
-            if not self._data[jid].has_key('resources'): self._data[jid]['resources']={}
-            for group in item.getTags('group'): self._data[jid]['groups'].append(group.getData())
+        query=stanza.getTag('query')
+        if stanza.getType()!='set':
+            self._setFull(query)
+            raise NodeProcessed
+        # A roster push
+        for item in query.getTags('item'):
+            jid,data=self._itemData(item)
+            if data is None: self._delItem(jid)
+            else: self._setItem(jid,data)
+            if query.getAttr('ver') is not None:
+                self.version=query.getAttr('ver')
+                if self._cache: self._cache.update(self.version,jid,data)
+        self._owner.send(Iq('result',to=stanza.getFrom(),attrs={'id':stanza.getID()}))
+        raise NodeProcessed   # a MUST. Otherwise you'll get back an <iq type='error'/>
+
+    def _setFull(self,query):
+        """ Replace the roster with the one in 'query'. An empty result means the
+            version we have is current. Used internally. """
+        if query is not None:
+            items={}
+            for item in query.getTags('item'):
+                jid,data=self._itemData(item)
+                if data is not None: items[jid]=data
+            for jid in self._items.keys():
+                if not items.has_key(jid): self._delItem(jid)
+            for jid,data in items.items(): self._setItem(jid,data)
+            self.version=query.getAttr('ver')
+            if self._cache and self.version is not None: self._cache.save(self.version,self._items)
         self._data[self._owner.User+'@'+self._owner.Server]={'resources':{},'name':None,'ask':None,'subscription':None,'groups':None,}
         self.set=1
-        raise NodeProcessed   # a MUST. Otherwise you'll get back an <iq type='error'/>
+
+    def _itemData(self,item):
+        """ Returns (jid, item in internal format) from an <item/>, the data is None
+            when the item was removed. Used internally. """
+        jid=item.getAttr('jid')
+        if item.getAttr('subscription')=='remove': return jid,None
+        return jid,{'name':item.getAttr('name'),'ask':item.getAttr('ask'),
+            'subscription':item.getAttr('subscription'),
+            'groups':[group.getData() for group in item.getTags('group')]}
+
+    def _setItem(self,jid,data):
+        self.DEBUG('Setting roster item %s...'%jid,'ok')
+        self._items[jid]=data
+        if not self._data.has_key(jid): self._data[jid]={'resources':{}}
+        self._data[jid].update(data)
+        self._data[jid]['groups']=list(data['groups'])
+        if not self._data[jid].has_key('resources'): self._data[jid]['resources']={}
+
+    def _delItem(self,jid):
+        if self._items.has_key(jid): del self._items[jid]
+        if self._data.has_key(jid): del self._data[jid]
 
     def PresenceHandler(self,dis,pres):
         """ Presence tracker. Used internally for setting items' resources state in
@@ -1,3 +1,4 @@
+# -*- coding: koi8-r -*-
 ##
 ##   XMPP server
 ##
@@ -24,6 +25,8 @@ writing the server.
 """
 
 from protocol import *
+from collections import deque
+import random
 
 # Transport-level flags
 SOCKET_UNCONNECTED  =0
@@ -41,6 +44,9 @@ SESSION_BOUND      =3
 SESSION_OPENED     =4
 SESSION_CLOSED     =5
 
+# Small queued chunks are joined up to this many bytes before each send.
+SEND_CHUNK=65536
+
 class Session:
     """
     The Session class instance is used for storing all session-related info like 
@@ -88,10 +94,12 @@ class Session:
         if self.TYP=='server': self.ID=`random.random()`[2:]
         else: self.ID=None
 
-        self.sendbuffer=''
+        self.sendbuffer=deque()         # Chunks waiting to be sent, the first one may be partially sent.
+        self._sendview=None             # memoryview of sendbuffer[0] while it is partially sent.
+        self._sendoffset=0
         self._stream_pos_queued=None
         self._stream_pos_sent=0
-        self.deliver_key_queue=[]
+        self.deliver_key_queue=deque()
         self.deliver_queue_map={}
         self.stanza_queue=[]
 
@@ -150,7 +158,8 @@ class Session:
             stream authenticated. After that this method is effectively the same as "sendnow" method."""
         if isinstance(stanza,Protocol):
             self.stanza_queue.append(stanza)
-        else: self.sendbuffer+=stanza
+        elif type(stanza)==type(u''): self.sendbuffer.append(stanza.encode('utf-8'))
+        else: self.sendbuffer.append(stanza)
         if self._socket_state>=SOCKET_ALIVE: self.push_queue()
 
     def push_queue(self,failreason=ERR_RECIPIENT_UNAVAILABLE):
@@ -165,37 +174,56 @@ class Session:
                 self._dispatch(Error(self.deliver_queue_map[key],failreason),trusted=1) # should simply re-dispatch it?
             for stanza in self.stanza_queue:                                            # But such action can invoke
                 self._dispatch(Error(stanza,failreason),trusted=1)                      # Infinite loops in case of S2S connection...
-            self.deliver_queue_map,self.deliver_key_queue,self.stanza_queue={},[],[]
+            self.deliver_queue_map,self.deliver_key_queue,self.stanza_queue={},deque(),[]
             return
         elif self._session_state>=SESSION_AUTHED:       # FIXME!   -  .
             #### LOCK_QUEUE
             for stanza in self.stanza_queue:
                 txt=stanza.__str__().encode('utf-8')
-                self.sendbuffer+=txt
+                self.sendbuffer.append(txt)
                 self._stream_pos_queued+=len(txt)       # should be re-evaluated for SSL connection.
                 self.deliver_queue_map[self._stream_pos_queued]=stanza     # position of the stream when stanza will be successfully and fully sent
                 self.deliver_key_queue.append(self._stream_pos_queued)
             self.stanza_queue=[]
             #### UNLOCK_QUEUE
 
+    def _next_chunk(self):
+        """ Return view of the data that should be sent next.
+            Joins small queued chunks so that every send call carries up to SEND_CHUNK bytes.
+            Used internally. """
+        if self._sendview is None:
+            queue=self.sendbuffer
+            if len(queue)>1 and len(queue[0])<SEND_CHUNK:
+                chunks,size=[],0
+                while queue and size<SEND_CHUNK:
+                    chunks.append(queue.popleft())
+                    size+=len(chunks[-1])
+                queue.appendleft(''.join(chunks))
+            self._sendview=memoryview(queue[0])
+            self._sendoffset=0
+        return self._sendview[self._sendoffset:]
+
     def flush_queue(self):
         """ Put the "immidiatedly send" queue content on the wire. Blocks until at least one byte sent."""
         if self.sendbuffer:
+            chunk=self._next_chunk()
             try:
                 # LOCK_QUEUE
-                sent=self._send(self.sendbuffer)    #  !
+                sent=self._send(chunk)    #  !
             except:
                 # UNLOCK_QUEUE
                 self.set_socket_state(SOCKET_DEAD)
                 self.DEBUG("Socket error while sending data",'error')
                 return self.terminate_stream()
-            self.DEBUG(`self.fileno()`+' '+self.sendbuffer[:sent],'sent')
+            self.DEBUG(`self.fileno()`+' '+chunk[:sent].tobytes(),'sent')
             self._stream_pos_sent+=sent
-            self.sendbuffer=self.sendbuffer[sent:]
+            self._sendoffset+=sent
+            if self._sendoffset>=len(self._sendview):
+                self.sendbuffer.popleft()
+                self._sendview=None
             self._stream_pos_delivered=self._stream_pos_sent            # Should be acquired from socket somehow. Take SSL into account.
             while self.deliver_key_queue and self._stream_pos_delivered>self.deliver_key_queue[0]:
-                del self.deliver_queue_map[self.deliver_key_queue[0]]
-                self.deliver_key_queue.remove(self.deliver_key_queue[0])
+                del self.deliver_queue_map[self.deliver_key_queue.popleft()]
             # UNLOCK_QUEUE
 
     def _dispatch(self,stanza,trusted=0):
@@ -17,22 +17,46 @@
 """Simplexml module provides xmpppy library with all needed tools to handle XML nodes and XML streams.
 I'm personally using it in many other separate projects. It is designed to be as standalone as possible."""
 
-import xml.parsers.expat
+import xml.parsers.expat,re
+
+# also FORM FEED and ESC are dropped, because they are not valid XML chars
+_escapes={u'&':u'&amp;',u'<':u'&lt;',u'>':u'&gt;',u'"':u'&quot;',u'\x0C':u'',u'\x1B':u''}
+_escape_search=re.compile(u'[&<>"\x0C\x1B]').search
+_escape_sub=re.compile(u'[&<>"\x0C\x1B]').sub
+def _escape_char(match): return _escapes[match.group()]
 
 def XMLescape(txt):
     """Returns provided string with symbols & < > " replaced by their respective XML entities."""
-    # replace also FORM FEED and ESC, because they are not valid XML chars
-    return txt.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace(u'\x0C', "").replace(u'\x1B', "")
+    if _escape_search(txt) is None: return txt
+    return _escape_sub(_escape_char,txt)
+
 
 ENCODING='utf-8'
 def ustr(what):
     """Converts object "what" to unicode string using it's own __str__ method if accessible or unicode method otherwise."""
+    typ=type(what)
+    if typ is unicode: return what
+    if typ is str: return unicode(what,ENCODING)
     if isinstance(what, unicode): return what
     try: r=what.__str__()
     except AttributeError: r=str(what)
     if not isinstance(r, unicode): return unicode(r,ENCODING)
     return r
 
+# Escaped text of string attribute values. Most of them (own JID, namespaces, types)
+# repeat from stanza to stanza.
+ATTR_CACHE_SIZE=1024
+_attr_cache={}
+def _attr_text(val):
+    """ Returns attribute value as escaped unicode string. Used internally. """
+    typ=type(val)
+    if typ is not unicode and typ is not str: return XMLescape(ustr(val))
+    try: return _attr_cache[val]
+    except KeyError: pass
+    if len(_attr_cache)>=ATTR_CACHE_SIZE: _attr_cache.clear()
+    text=_attr_cache[val]=XMLescape(ustr(val))
+    return text
+
 class Node(object):
     """ Node class describes syntax of separate XML Node. It have a constructor that permits node creation
         from set of "namespace name", attributes and payload of text strings and other nodes.
@@ -49,6 +73,13 @@ class Node(object):
         replication (and using replication only to move upwards on the classes tree).
     """
     FORCE_NODE_RECREATION=0
+    # Index of child nodes by name, built on first lookup and rebuilt when self.kids changes
+    # or any node is renamed (children may be shared between nodes, see above).
+    _index=None
+    _index_kids=None
+    _index_len=0
+    _index_renames=0
+    _renames=0
     def __init__(self, tag=None, attrs={}, payload=[], parent=None, nsp=None, node_built=False, node=None):
         """ Takes "tag" argument as the name of node (prepended by namespace, if needed and separated from it
             by a space), attrs dictionary as the set of arguments, payload list as the set of textual strings
@@ -116,8 +147,7 @@ class Node(object):
                 if 'xmlns' not in self.attrs:
                     s = s + ' xmlns="%s"'%self.namespace
         for key in self.attrs.keys():
-            val = ustr(self.attrs[key])
-            s = s + ' %s="%s"' % ( key, XMLescape(val) )
+            s = s + ' %s="%s"' % ( key, _attr_text(self.attrs[key]) )
         s = s + ">"
         cnt = 0
         if self.kids:
@@ -182,6 +212,7 @@ class Node(object):
             Else deletes the first node that have specified name and (optionally) attributes. """
         if not isinstance(node, Node): node=self.getTag(node,attrs)
         self.kids[self.kids.index(node)]=None
+        self._index_kids=None
         return node
     def getAttrs(self):
         """ Returns all node's attributes as dictionary. """
@@ -226,31 +257,39 @@ class Node(object):
         """ Returns cocatenated CDATA of the child with specified name."""
         try: return self.getTag(tag).getData()
         except: return None
+    def _kids_named(self, name):
+        """ Returns the list of child nodes with specified name. Used internally. """
+        kids=self.kids
+        if self._index_kids is not kids or self._index_len!=len(kids) or self._index_renames!=Node._renames:
+            index={}
+            for node in kids:
+                if not isinstance(node, Node): continue
+                if node.name in index: index[node.name].append(node)
+                else: index[node.name]=[node]
+            self._index,self._index_kids,self._index_len,self._index_renames=index,kids,len(kids),Node._renames
+        return self._index.get(name,())
     def getTags(self, name, attrs={}, namespace=None, one=0):
         """ Filters all child nodes using specified arguments as filter.
             Returns the list of nodes found. """
         nodes=[]
-        for node in self.kids:
-            if not node: continue
+        for node in self._kids_named(name):
             if namespace and namespace!=node.getNamespace(): continue
-            if node.getName() == name:
-                for key in attrs.keys():
-                   if key not in node.attrs or node.attrs[key]!=attrs[key]: break
-                else: nodes.append(node)
-            if one and nodes: return nodes[0]
+            for key in attrs.keys():
+               if key not in node.attrs or node.attrs[key]!=attrs[key]: break
+            else:
+                if one: return node
+                nodes.append(node)
         if not one: return nodes
 
     def iterTags(self, name, attrs={}, namespace=None):
         """ Iterate over all children using specified arguments as filter. """
-        for node in self.kids:
-            if not node: continue
+        for node in self._kids_named(name):
             if namespace is not None and namespace!=node.getNamespace(): continue
-            if node.getName() == name:
-                for key in attrs.keys():
-                    if key not in node.attrs or \
-                        node.attrs[key]!=attrs[key]: break
-                else:
-                    yield node
+            for key in attrs.keys():
+                if key not in node.attrs or \
+                    node.attrs[key]!=attrs[key]: break
+            else:
+                yield node
 
     def setAttr(self, key, val):
         """ Sets attribute "key" with the value "val". """
@@ -261,6 +300,7 @@ class Node(object):
     def setName(self,val):
         """ Changes the node name. """
         self.name = val
+        Node._renames+=1
     def setNamespace(self, namespace):
         """ Changes the node namespace. """
         self.namespace=namespace